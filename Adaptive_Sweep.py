@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+'''
+
+File name: Adaptive_Sweep.py
+
+Simple Energy Model Ver 1
+
+Adaptive parameter sweep: instead of solving every point of a dense grid,
+start from a coarse grid over the chosen keywords and refine only the grid
+cells where the results change.
+
+    Each cell of the grid is a box whose corners are solved cases. The change
+    in a cell is the largest difference between its corners in any of the
+    result keys (SYSTEM_COST and the capacities by default), relative to the
+    largest value of that key seen on the coarse grid. In each round, every
+    cell that changes by more than the tolerance is split in half along every
+    keyword, largest change first, and the new corners of all these cells are
+    solved together in a worker pool. Refinement stops when no cell changes by
+    more than the tolerance, the cells are as narrow as min_cell_width, or
+    the solve budget is used up.
+
+The keyword ranges are multipliers of the keyword values of a base case, as
+in the case section of the case input file. The results are saved as for a
+normal run (save_basic_results), so postprocessing works as usual.
+
+'''
+
+# -----------------------------------------------------------------------------
+
+import copy
+import heapq
+import itertools
+import multiprocessing
+import numpy as np
+from Save_Basic_Results import save_basic_results
+
+# result keys compared between the corners of a cell, by default
+adaptive_result_key_list = [
+        'SYSTEM_COST',
+        'CAPACITY_NATGAS','CAPACITY_SOLAR','CAPACITY_WIND','CAPACITY_NUCLEAR',
+        'CAPACITY_STORAGE','FIXED_PGP_STORAGE',
+        'CAPACITY_TO_PGP_STORAGE','CAPACITY_FROM_PGP_STORAGE'
+        ]
+
+# cells are split at most this many times, so corners stay on an integer lattice
+max_refinement_level = 20
+
+# -----------------------------------------------------------------------------
+
+def solve_case(global_dic, case_dic):
+    # imported here so that this module can be imported without cvxpy
+    from Core_Model import core_model
+    from Cost_Model import cost_and_storage_calculation_case
+    result = core_model(global_dic, case_dic)
+    if global_dic['COST_MODEL']:
+        result.update(cost_and_storage_calculation_case(global_dic, case_dic, result))
+    return result
+
+# the case at integer lattice point <corner>
+def corner_case(base_case_dic, keyword_range_list, corner, lattice_size):
+    case_dic = copy.copy(base_case_dic)
+    name_list = [base_case_dic['CASE_NAME']]
+    for keyword_index in range(len(keyword_range_list)):
+        keyword, low, high = keyword_range_list[keyword_index]
+        multiplier = low + (high - low) * corner[keyword_index] / float(lattice_size)
+        case_dic[keyword] = base_case_dic[keyword] * multiplier
+        name_list.append(keyword + '{:.12g}'.format(multiplier))
+    case_dic['CASE_NAME'] = '_'.join(name_list)
+    return case_dic
+
+def cell_change(corner_list, result_dic, result_key_list, scale_dic):
+    change = 0.
+    for key in result_key_list:
+        value_list = [result_dic[corner][key] for corner in corner_list]
+        change = max(change, (max(value_list) - min(value_list)) / scale_dic[key])
+    return change
+
+def cell_corners(low_corner, high_corner):
+    return list(itertools.product(*zip(low_corner, high_corner)))
+
+# -----------------------------------------------------------------------------
+
+def adaptive_sweep(global_dic, base_case_dic, keyword_range_list, num_points = 3,
+                   tolerance = 0.05, budget = 200, result_key_list = adaptive_result_key_list,
+                   min_cell_width = 0.01):
+
+    # keyword_range_list -- list of (keyword, low, high); low and high are
+    #   multipliers of the keyword value in base_case_dic
+    # num_points -- number of points along each keyword in the coarse grid
+    # tolerance -- cells whose relative change is below this are not split
+    # budget -- maximum number of cases solved
+    # min_cell_width -- cells are not split into cells narrower than this
+    #   fraction of the keyword ranges
+
+    verbose = global_dic['VERBOSE']
+    num_keywords = len(keyword_range_list)
+    cell_size = 2 ** max_refinement_level
+    lattice_size = (num_points - 1) * cell_size
+    min_width = max(1, int(np.ceil(min_cell_width * lattice_size))) # in lattice units
+
+    if num_points ** num_keywords > budget:
+        raise ValueError('the coarse grid has {} points, more than the budget of {} cases'
+                         .format(num_points ** num_keywords, budget))
+
+    num_processes = global_dic['NUM_PROCESSES']
+    if num_processes <= 0:
+        num_processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(num_processes)
+
+    try:
+        result_dic = {} # lattice point -> result
+        case_dic_dic = {} # lattice point -> case_dic
+
+        # solve all corners not solved yet, in the worker pool
+        def solve_corners(corner_list):
+            corner_list = [corner for corner in sorted(set(corner_list)) if corner not in result_dic]
+            job_list = []
+            for corner in corner_list:
+                case_dic_dic[corner] = corner_case(base_case_dic, keyword_range_list, corner, lattice_size)
+                job_list.append(pool.apply_async(solve_case, (global_dic, case_dic_dic[corner])))
+            for corner, job in zip(corner_list, job_list):
+                result_dic[corner] = job.get()
+            if verbose:
+                print 'Adaptive_Sweep.py: ' + str(len(result_dic)) + ' cases solved'
+
+        # coarse grid
+        coarse_list = [range(0, lattice_size + 1, cell_size) for keyword_index in range(num_keywords)]
+        solve_corners(list(itertools.product(*coarse_list)))
+
+        scale_dic = {}
+        for key in result_key_list:
+            scale_dic[key] = max(max(abs(result[key]) for result in result_dic.values()), 1e-12)
+
+        # cells, largest change first
+        cell_heap = []
+        for low_corner in itertools.product(*[values[:-1] for values in coarse_list]):
+            high_corner = tuple(x + cell_size for x in low_corner)
+            change = cell_change(cell_corners(low_corner, high_corner), result_dic, result_key_list, scale_dic)
+            heapq.heappush(cell_heap, (-change, low_corner, high_corner))
+
+        narrow_cell_list = [] # cells above the tolerance that are too narrow to split
+        budget_reached = False
+        while not budget_reached:
+            # all cells above the tolerance, largest change first, as long as their new corners fit in the budget
+            split_list = []
+            new_corner_set = set()
+            while len(cell_heap) > 0 and -cell_heap[0][0] > tolerance:
+                change, low_corner, high_corner = cell_heap[0]
+                if high_corner[0] - low_corner[0] < 2 * min_width:
+                    narrow_cell_list.append(heapq.heappop(cell_heap))
+                    continue
+                mid_corner = tuple((x + y) // 2 for x, y in zip(low_corner, high_corner))
+                cell_corner_set = set(corner for corner in itertools.product(*zip(low_corner, mid_corner, high_corner))
+                                      if corner not in result_dic)
+                if len(result_dic) + len(new_corner_set | cell_corner_set) > budget:
+                    budget_reached = True
+                    break
+                heapq.heappop(cell_heap)
+                split_list.append((low_corner, mid_corner, high_corner))
+                new_corner_set |= cell_corner_set
+            if len(split_list) == 0:
+                break
+            solve_corners(list(new_corner_set))
+
+            # split each cell into 2**num_keywords cells
+            for low_corner, mid_corner, high_corner in split_list:
+                for half_list in itertools.product(*[[(x, m), (m, y)] for x, m, y in zip(low_corner, mid_corner, high_corner)]):
+                    sub_low_corner = tuple(half[0] for half in half_list)
+                    sub_high_corner = tuple(half[1] for half in half_list)
+                    sub_change = cell_change(cell_corners(sub_low_corner, sub_high_corner), result_dic, result_key_list, scale_dic)
+                    heapq.heappush(cell_heap, (-sub_change, sub_low_corner, sub_high_corner))
+
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate() # workers are not left running if a case fails
+
+    if verbose:
+        if budget_reached:
+            print 'Adaptive_Sweep.py: solve budget reached'
+        change_left_list = [-cell[0] for cell in cell_heap[:1] + narrow_cell_list]
+        if len(change_left_list) > 0:
+            print 'Adaptive_Sweep.py: largest change left in a cell = {:.4f}'.format(max(change_left_list))
+
+    # save in the usual format, cases in keyword order
+    corner_list = sorted(result_dic.keys())
+    case_dic_list = [case_dic_dic[corner] for corner in corner_list]
+    result_list = [result_dic[corner] for corner in corner_list]
+    for case_index in range(len(case_dic_list)):
+        case_dic_list[case_index]['CASE_INDEX'] = case_index
+    save_basic_results(global_dic, case_dic_list, result_list)
+
+    return case_dic_list, result_list
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+'''
+  Benchmark_Startup.py
+
+  Measure the time it takes a fresh python process to import the modules of the
+  Simple Energy Model. Each import is done in a new process (as in a batch
+  worker launching a single-case run), repeated, and the fastest time is kept.
+
+  Usage
+      python Benchmark_Startup.py [number of repeats]
+
+  The line for Simple_Energy_Model is the startup cost of the model itself:
+  matplotlib is only imported when POSTPROCESS or QUICK_LOOK is set.
+
+'''
+
+import os
+import subprocess
+import sys
+import time
+
+# modules to time, in the order they are printed
+module_list = [
+        'numpy',
+        'cvxpy',
+        'matplotlib.pyplot',
+        'Preprocess_Input',
+        'Core_Model',
+        'Save_Basic_Results',
+        'Simple_Energy_Model',
+        'Postprocess_Results',
+        'Quick_Look',
+        ]
+
+def time_import(module, num_repeats):
+
+    time_list = []
+    for repeat in range(num_repeats):
+        start_time = time.time()
+        with open(os.devnull, 'w') as devnull:
+            status = subprocess.call([sys.executable, '-c', 'import ' + module], stderr = devnull)
+        time_list.append(time.time() - start_time)
+        if status != 0:
+            return None
+    return min(time_list)
+
+def benchmark_startup(num_repeats = 5):
+
+    # time of the bare interpreter, subtracted from each import time
+    base_time = time_import('sys', num_repeats)
+    print 'python startup: {:.3f} s'.format(base_time)
+    print '{:<24}{:>12}'.format('module', 'import (s)')
+    for module in module_list:
+        import_time = time_import(module, num_repeats)
+        if import_time is None:
+            print '{:<24}{:>12}'.format(module, 'failed')
+        else:
+            print '{:<24}{:>12.3f}'.format(module, import_time - base_time)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        benchmark_startup(int(sys.argv[1]))
+    else:
+        benchmark_startup()
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+'''
+  Check_Kernels.py
+
+  Regression checks of the vectorized numeric kernels against the loop
+  implementations they replaced. The reference functions below are the old
+  loops, kept here only for comparison.
+
+  Usage
+      python Check_Kernels.py
+
+  Each check raises an AssertionError on the first difference, and prints one
+  line when it passes.
+
+  Known differences from the old loops
+      func_time_conversion with window_size > N (the series length): the old
+          loop indexed a tripled series, which is only right while the window
+          fits in it; from about 2N it crashed (IndexError, or ValueError on an
+          empty min/max slice) or took a shortened window. The new code wraps
+          around the series as many times as needed. The checks compare
+          against the old loop for window_size <= N and against an explicit
+          wrapped window from N + 1 to 3N + 1.
+      func_find_period / func_find_periods: the rolling mean comes from a
+          cumulative sum instead of np.sum over each window, so values agree to
+          round-off only. When windows tie (equal means), the window chosen can
+          be a different one of the tied windows.
+      battery_calculation when the stack is empty at the start of a discharge
+          hour: the old loop used top_of_stack left over from an earlier hour
+          (or crashed with a NameError if there was none), so the residence
+          time and headroom of that hour came from unrelated energy. Now
+          nothing is taken from storage in that hour: the maximum residence
+          time is 0 and the headroom is ENERGY_STORAGE[idx] -
+          ENERGY_STORAGE[idx + 1]. The checks compare against the old loop for
+          all other hours. lifo_stack_cost_analysis (Cost_Model.py) already
+          handled an empty stack and is unchanged there.
+
+'''
+
+from __future__ import division
+import copy
+import numpy as np
+from Supporting_Functions import func_time_conversion, func_rolling_extreme, func_find_period, func_find_periods
+from Supporting_Functions import func_range_max_table, func_range_max_query
+from Postprocess_Results import battery_calculation
+from Cost_Model import lifo_stack_cost_analysis
+
+# -----------------------------------------------------------------------------
+# old loop implementations
+
+def reference_time_conversion (input_data, window_size, operation_type = 'mean'):
+
+    N_periods = len(input_data)
+    input_data_x3 = np.concatenate((input_data,input_data,input_data))
+
+    half_size = window_size / 2.
+    half_size_full = int(half_size) # number of full things for the mean
+
+    output_data = np.zeros(len(input_data))
+
+    for ii in range(len(output_data)):
+        if half_size != float (half_size_full): # odd number, easy
+            if (operation_type == 'mean'):
+                output_data[ii] = np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full + 1 ])/ float(window_size)
+            elif(operation_type == 'min'):
+                output_data[ii] = np.min(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full + 1 ])
+            elif(operation_type == 'max'):
+                output_data[ii] = np.max(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full  + 1])
+            elif(operation_type == 'sum'):
+                output_data[ii] = np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full  + 1])
+        else: # even number need to include half of last ones
+            if (operation_type == 'mean'):
+                output_data[ii] = ( np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full ])  \
+                        + input_data_x3[N_periods + ii - half_size_full -1 ] *0.5 +  input_data_x3[N_periods + ii + half_size_full + 1 ] *0.5) / window_size
+            elif(operation_type == 'min'):
+                output_data[ii] = np.min(input_data_x3[N_periods + ii - half_size_full -1 : N_periods + ii + half_size_full + 1 ])
+            elif(operation_type == 'max'):
+                output_data[ii] = np.max(input_data_x3[N_periods + ii - half_size_full -1 : N_periods + ii + half_size_full + 1 ])
+            elif(operation_type == 'sum'):
+                output_data[ii] = (
+                        np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full ])
+                        + input_data_x3[N_periods + ii - half_size_full -1 ] *0.5 +  input_data_x3[N_periods + ii + half_size_full + 1 ] *0.5
+                        )
+
+    return output_data
+
+# the same windows as reference_time_conversion, with every index taken
+# modulo the series length (the behaviour of func_time_conversion for any
+# window size)
+def reference_time_conversion_wrapped (input_data, window_size, operation_type = 'mean'):
+
+    N_periods = len(input_data)
+    half_size_full = int(window_size / 2.)
+    odd_window = (window_size / 2. != float(half_size_full))
+    output_data = np.zeros(N_periods)
+    for ii in range(N_periods):
+        if odd_window:
+            window = input_data[np.arange(ii - half_size_full, ii + half_size_full + 1) % N_periods]
+            edge = 0.
+        else:
+            window = input_data[np.arange(ii - half_size_full, ii + half_size_full) % N_periods]
+            edge = 0.5 * (input_data[(ii - half_size_full - 1) % N_periods] + input_data[(ii + half_size_full + 1) % N_periods])
+        if operation_type in ['mean','sum']:
+            output_data[ii] = np.sum(window) + edge
+            if operation_type == 'mean':
+                output_data[ii] = output_data[ii] / window_size
+        else:
+            if not odd_window:
+                window = input_data[np.arange(ii - half_size_full - 1, ii + half_size_full + 1) % N_periods]
+            output_data[ii] = np.min(window) if operation_type == 'min' else np.max(window)
+    return output_data
+
+def reference_find_period (input_data):
+
+    window_size = input_data['window_size']
+    eff_window_size = copy.deepcopy(window_size) # If even go up to next odd number
+    if eff_window_size == 2 * int (eff_window_size /2 ):  # check if even
+        eff_window_size = eff_window_size + 1             # if so, add 1
+    data = input_data['data']
+    search_option = input_data['search_option']
+
+    data_in_window = reference_time_conversion(data, eff_window_size, 'mean')
+
+    if search_option == 'max':
+        center_index = int(np.argmax(data_in_window))
+        value = np.max(data_in_window)
+    elif search_option == 'min':
+        center_index = int(np.argmin(data_in_window))
+        value = np.min(data_in_window)
+
+    # If interval would go over boundary, then move inteval
+    if center_index < int(eff_window_size/2):
+        center_index = int(eff_window_size/2)
+    if center_index > len(data)- int(eff_window_size/2) - 1:
+        center_index = len(data) - 1 - int(eff_window_size/2)
+
+    left_index = center_index - int(eff_window_size/2)
+    right_index = center_index + int(eff_window_size/2)
+
+    output = {
+        'value':        value,
+        'left_index':   left_index,
+        'right_index':  right_index,
+        'center_index': center_index,
+        }
+
+    return output
+
+# old battery_calculation loop. Changes, so that it runs and can be compared:
+# start_point is an integer (range() failed on the float), and the hours where
+# the stack is empty at the start of a discharge are returned in
+# empty_stack_list (top_of_stack is then stale, or undefined the first time).
+def reference_battery_calculation(
+        num_time_periods,
+        DISPATCH_TO_STORAGE,
+        DISPATCH_FROM_STORAGE,
+        ENERGY_STORAGE,
+        STORAGE_CHARGING_EFFICIENCY
+        ):
+    start_point = 0
+    for idx in range(num_time_periods):
+        if ENERGY_STORAGE[idx] == 0:
+            start_point = idx
+
+    lifo_stack = []
+    
+    for idx in range(num_time_periods-start_point):
+        idx = idx + start_point
+        if DISPATCH_TO_STORAGE[idx] > 0:  # push on stack (with time moved up 1 cycle)
+            lifo_stack.append([idx-num_time_periods,DISPATCH_TO_STORAGE[idx]*STORAGE_CHARGING_EFFICIENCY ])
+        if DISPATCH_FROM_STORAGE[idx] > 0:
+            dispatch_remaining = DISPATCH_FROM_STORAGE[idx]
+            while dispatch_remaining > 0:
+                if len(lifo_stack) != 0:
+                    top_of_stack = lifo_stack.pop()
+                    if top_of_stack[1] > dispatch_remaining:
+                        # partial removal
+                        new_top = np.copy(top_of_stack)
+                        new_top[1] = new_top[1] - dispatch_remaining
+                        lifo_stack.append(new_top)
+                        dispatch_remaining = 0
+                    else:
+                        dispatch_remaining = dispatch_remaining - top_of_stack[1]
+                else:
+                    dispatch_remaining = 0 # stop while loop if stack is empty
+    # Now we have the stack as an initial condition and can do it for real
+    max_headroom = np.zeros(num_time_periods)
+    mean_residence_time = np.zeros(num_time_periods)
+    max_residence_time = np.zeros(num_time_periods)
+    empty_stack_list = []
+    top_of_stack = [0, 0.]
+    
+    for idx in range(num_time_periods):
+        max_head = 0
+        mean_res = 0
+        max_res = 0
+        if DISPATCH_TO_STORAGE[idx] > 0:  # push on stack
+            lifo_stack.append([idx,DISPATCH_TO_STORAGE[idx]*STORAGE_CHARGING_EFFICIENCY ])
+        if DISPATCH_FROM_STORAGE[idx] > 0:
+            if lifo_stack == []:
+                empty_stack_list.append(idx)
+            dispatch_remaining = DISPATCH_FROM_STORAGE[idx]
+            accum_time = 0
+            while dispatch_remaining > 0:
+                if lifo_stack != []:
+                    top_of_stack = lifo_stack.pop()
+                    if top_of_stack[1] > dispatch_remaining:
+                        # partial removal
+                        accum_time = accum_time + dispatch_remaining * (idx - top_of_stack[0])
+                        new_top = np.copy(top_of_stack)
+                        new_top[1] = new_top[1] - dispatch_remaining
+                        lifo_stack.append(new_top) # put back the remaining power at the old time
+                        dispatch_remaining = 0
+                    else: 
+                        # full removal of top of stack
+                        accum_time = accum_time + top_of_stack[1] * (idx - top_of_stack[0])
+                        dispatch_remaining = dispatch_remaining - top_of_stack[1]
+                else:
+                    dispatch_remaining = 0 # stop while loop if stack is empty
+            mean_res = accum_time / DISPATCH_FROM_STORAGE[idx]
+            max_res = idx - top_of_stack[0]
+            # maximum headroom needed is the max of the storage between idx and top_of_stack[0]
+            #    minus the amount of storage at time idx + 1
+            energy_vec = np.concatenate([ENERGY_STORAGE,ENERGY_STORAGE,ENERGY_STORAGE])
+            max_head = np.max(energy_vec[int(top_of_stack[0]+num_time_periods):int(idx + 1+num_time_periods)]) - energy_vec[int(idx + 1 + num_time_periods)]   # dl-->could be negative?
+        max_headroom[idx] = max_head
+        mean_residence_time[idx] = mean_res
+        max_residence_time[idx] = max_res
+    return max_headroom,mean_residence_time,max_residence_time,empty_stack_list
+
+# lifo_stack_cost_analysis with the stack as a list of lists and np.max over
+# each slice (Cost_Model.py before the preallocated stack)
+def reference_lifo_stack_cost_analysis(dispatch_to, dispatch_from, energy, efficiency, price_of_electricity, cost_to_per_kWh):
+    num_time_periods = len(dispatch_from)
+    cost_electricity = np.zeros(num_time_periods)
+    cost_to = np.zeros(num_time_periods)
+    capacity_needed = np.zeros(num_time_periods)
+    
+    energy_vec = np.concatenate([energy,energy,energy])
+
+    # each item on lifo stack is a list:
+    #  lifo[0] == time_idx
+    #  lifo[1] == amount of electricitity in storage
+    #  lifo[2] == electricity cost per kWh stored
+    #  lifo[3] == charging cost per kWh stored
+    lifo_stack = []
+
+    for cycle in range(2):
+        for idx in range(num_time_periods):
+            time_idx = idx + (cycle - 1) * num_time_periods
+            if dispatch_to[idx] > 0:  # push on stack
+                lifo_stack.append([time_idx, dispatch_to[idx]*efficiency,
+                                   price_of_electricity[idx]/efficiency, cost_to_per_kWh[idx]/efficiency])
+            if dispatch_from[idx] > 0:
+                dispatch_remaining = dispatch_from[idx]
+                accum_electricity = 0.
+                accum_to = 0.
+                oldest_time = time_idx
+                while dispatch_remaining > 0 and len(lifo_stack) > 0:
+                    top_of_stack = lifo_stack.pop()
+                    amount = min(top_of_stack[1], dispatch_remaining)
+                    accum_electricity += amount * top_of_stack[2]
+                    accum_to += amount * top_of_stack[3]
+                    oldest_time = top_of_stack[0]
+                    if top_of_stack[1] > dispatch_remaining:
+                        # partial removal, put back the remaining energy at the old time
+                        top_of_stack[1] = top_of_stack[1] - dispatch_remaining
+                        lifo_stack.append(top_of_stack)
+                    dispatch_remaining = dispatch_remaining - amount
+                if cycle == 1:
+                    cost_electricity[idx] = accum_electricity
+                    cost_to[idx] = accum_to
+                    capacity_needed[idx] = (
+                            np.max(energy_vec[oldest_time + num_time_periods:idx + 1 + num_time_periods])
+                            - energy_vec[idx + 1 + num_time_periods]
+                            )
+    return cost_electricity, cost_to, capacity_needed
+
+# -----------------------------------------------------------------------------
+# checks
+
+operation_list = ['mean','sum','min','max']
+
+def check_time_conversion(data):
+
+    N_periods = len(data)
+    for window_size in range(1, N_periods + 1):
+        for operation_type in operation_list:
+            new = func_time_conversion(data, window_size, operation_type)
+            old = reference_time_conversion(data, window_size, operation_type)
+            assert np.allclose(new, old, rtol = 1e-12, atol = 1e-12), (window_size, operation_type)
+    for window_size in range(N_periods + 1, 3 * N_periods + 2):
+        for operation_type in operation_list:
+            new = func_time_conversion(data, window_size, operation_type)
+            wrapped = reference_time_conversion_wrapped(data, window_size, operation_type)
+            assert np.allclose(new, wrapped, rtol = 1e-12, atol = 1e-12), (window_size, operation_type)
+
+    # a (time x columns) matrix gives the same result as each column on its own
+    matrix = np.column_stack([data, data[::-1], 2. * data])
+    for window_size in [1, 2, 7, 24, N_periods]:
+        for operation_type in operation_list:
+            new = func_time_conversion(matrix, window_size, operation_type)
+            for column in range(matrix.shape[1]):
+                assert np.allclose(new[:,column], func_time_conversion(matrix[:,column], window_size, operation_type)), (window_size, operation_type, column)
+    print 'func_time_conversion: ok'
+
+def check_rolling_extreme(data):
+
+    N_periods = len(data)
+    for window_length in range(1, N_periods + 1):
+        for operation_type in ['min','max']:
+            func_extreme = np.min if operation_type == 'min' else np.max
+            old = np.array([func_extreme(data[k : k + window_length]) for k in range(N_periods - window_length + 1)])
+            new = func_rolling_extreme(data, window_length, operation_type)
+            assert np.array_equal(new, old), (window_length, operation_type)
+    print 'func_rolling_extreme: ok'
+
+def check_find_period(data):
+
+    N_periods = len(data)
+    for window_size in range(1, N_periods - 1):
+        for search_option in ['max','min']:
+            input_data = {'data':data, 'window_size':window_size, 'search_option':search_option, 'print_option':0}
+            old = reference_find_period(input_data)
+            new = func_find_period(input_data)
+            assert np.isclose(new['value'], old['value'], rtol = 1e-12, atol = 1e-12), (window_size, search_option)
+            assert new['right_index'] - new['left_index'] == old['right_index'] - old['left_index'], (window_size, search_option)
+            if new['center_index'] != old['center_index']: # must be a tie
+                new_mean = np.mean(data[new['left_index'] : new['right_index'] + 1])
+                old_mean = np.mean(data[old['left_index'] : old['right_index'] + 1])
+                assert np.isclose(new_mean, old_mean, rtol = 1e-12, atol = 1e-12), (window_size, search_option)
+
+    # the first period of each column found by func_find_periods is the one
+    # func_find_period finds, and the other periods do not overlap it
+    matrix = np.column_stack([data, data[::-1]])
+    period_list = func_find_periods({'data':matrix, 'window_size_list':[5, 24], 'search_option':['max','min'], 'num_periods':3})
+    for period in period_list:
+        old = reference_find_period({'data':matrix[:,period['column']], 'window_size':period['window_size'],
+                                     'search_option':period['search_option']})
+        if period['rank'] == 0:
+            assert np.isclose(period['value'], old['value'], rtol = 1e-12, atol = 1e-12), period
+        else:
+            assert abs(period['center_index'] - old['center_index']) >= period['window_size'], period
+    print 'func_find_period, func_find_periods: ok'
+
+def check_range_max(data):
+
+    N_periods = len(data)
+    range_max_table = func_range_max_table(data)
+    left_index, right_index = np.triu_indices(N_periods + 1, 1) # every slice
+    new = func_range_max_query(range_max_table, left_index, right_index)
+    old = np.array([np.max(data[left : right]) for left, right in zip(left_index, right_index)])
+    assert np.array_equal(new, old)
+    print 'func_range_max_table, func_range_max_query: ok'
+
+# random storage dispatch, with hours where the stack runs empty
+def storage_series(N_periods, random_state):
+
+    dispatch_to = random_state.rand(N_periods) * (random_state.rand(N_periods) < 0.4)
+    dispatch_from = random_state.rand(N_periods) * (random_state.rand(N_periods) < 0.4)
+    energy = random_state.rand(N_periods)
+    energy[N_periods // 2] = 0. # start point of battery_calculation
+    return dispatch_to, dispatch_from, energy
+
+def check_battery_calculation(N_periods, random_state):
+
+    num_empty = 0
+    for repeat in range(20):
+        dispatch_to, dispatch_from, energy = storage_series(N_periods, random_state)
+        new = battery_calculation(N_periods, dispatch_to, dispatch_from, energy, 0.9)
+        old = reference_battery_calculation(N_periods, dispatch_to, dispatch_from, energy, 0.9)
+        same = np.ones(N_periods, dtype = bool)
+        same[old[3]] = False
+        for key, new_series, old_series in zip(['max_headroom','mean_residence_time','max_residence_time'], new, old):
+            assert np.allclose(new_series[same], old_series[same], rtol = 1e-12, atol = 1e-12), key
+        # empty stack: nothing is taken from storage in that hour
+        empty = np.array(old[3], dtype = int)
+        assert np.all(new[1][empty] == 0.) and np.all(new[2][empty] == 0.)
+        assert np.allclose(new[0][empty], energy[empty] - energy[(empty + 1) % N_periods])
+        num_empty += len(empty)
+    assert num_empty > 0 # the empty stack case was exercised
+    print 'battery_calculation: ok'
+
+def check_lifo_stack_cost_analysis(N_periods, random_state):
+
+    for repeat in range(20):
+        dispatch_to, dispatch_from, energy = storage_series(N_periods, random_state)
+        price_of_electricity = random_state.rand(N_periods)
+        cost_to_per_kWh = random_state.rand(N_periods)
+        new = lifo_stack_cost_analysis(dispatch_to, dispatch_from, energy, 0.9, price_of_electricity, cost_to_per_kWh)
+        old = reference_lifo_stack_cost_analysis(dispatch_to, dispatch_from, energy, 0.9, price_of_electricity, cost_to_per_kWh)
+        for key, new_series, old_series in zip(['cost_electricity','cost_to','capacity_needed'], new, old):
+            assert np.allclose(new_series, old_series, rtol = 1e-12, atol = 1e-12), key
+    print 'lifo_stack_cost_analysis: ok'
+
+def check_kernels(N_periods = 60, seed = 0):
+
+    random_state = np.random.RandomState(seed)
+    data = random_state.rand(N_periods)
+    data[N_periods // 3 : N_periods // 3 + 5] = data[N_periods // 3] # ties
+    check_time_conversion(data)
+    check_rolling_extreme(data)
+    check_find_period(data)
+    check_range_max(data)
+    check_battery_calculation(N_periods, random_state)
+    check_lifo_stack_cost_analysis(N_periods, random_state)
+
+if __name__ == '__main__':
+    check_kernels()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+'''
+
+File name: Compact_Result.py
+
+Simple Energy Model Ver 1
+
+Compact storage of the results of one case.
+
+A result dictionary holds about 20 hourly series (more with the cost model),
+many of them all zeros for the components a case does not have. CompactResult
+keeps the same keys and dictionary access, but stores:
+
+    the nonzero hourly series as the columns of one (hours x series) array,
+        in float32 if RESULT_FLOAT32 is set
+    the keys of the all-zero series only; reading one returns a read-only
+        zero view (np.broadcast_to), which takes no memory
+    everything else (scalars, status, other arrays) as in a dictionary
+
+A pickled CompactResult stores the one array, the column keys, the zero keys
+and the other items, so the zero series are not written to the pickle file.
+
+Reading a series returns a view of its column; writing a key replaces the
+series. Code that reads and writes results as a dictionary works unchanged.
+
+'''
+
+# -----------------------------------------------------------------------------
+
+from collections import MutableMapping
+import numpy as np
+
+# -----------------------------------------------------------------------------
+
+class CompactResult(MutableMapping):
+
+    def __init__(self, result_dic = None, num_time_periods = None, float32 = False):
+        self.num_time_periods = num_time_periods
+        self.dtype = np.dtype(np.float32 if float32 else np.float64)
+        self.series = np.zeros((num_time_periods or 0, 0), dtype = self.dtype)
+        self.column_list = [] # key of each column of series
+        self.column_dic = {} # key -> column
+        self.zero_key_set = set()
+        self.other_dic = {}
+        if result_dic is not None:
+            self.update(result_dic)
+
+    # an hourly series is a 1-D numeric array with one value per hour
+    def is_series(self, value):
+        if not isinstance(value, np.ndarray) or value.ndim != 1 or value.dtype.kind not in 'fiu':
+            return False
+        if self.num_time_periods is None:
+            self.num_time_periods = len(value)
+            self.series = np.zeros((self.num_time_periods, 0), dtype = self.dtype)
+        return len(value) == self.num_time_periods
+
+    def __getitem__(self, key):
+        if key in self.column_dic:
+            return self.series[:, self.column_dic[key]]
+        if key in self.zero_key_set:
+            return np.broadcast_to(np.zeros(1, dtype = self.dtype), (self.num_time_periods,))
+        return self.other_dic[key]
+
+    def __setitem__(self, key, value):
+        self.update({key:value})
+
+    def __delitem__(self, key):
+        if key in self.column_dic:
+            self.series = np.delete(self.series, self.column_dic[key], axis = 1)
+            self.column_list.remove(key)
+            self.column_dic = dict((column_key, column) for column, column_key in enumerate(self.column_list))
+        elif key in self.zero_key_set:
+            self.zero_key_set.remove(key)
+        else:
+            del self.other_dic[key]
+
+    def __iter__(self):
+        return iter(self.column_list + sorted(self.zero_key_set) + list(self.other_dic.keys()))
+
+    def __len__(self):
+        return len(self.column_list) + len(self.zero_key_set) + len(self.other_dic)
+
+    def __repr__(self):
+        return 'CompactResult({} hours, {} series, {} zero series, {} other items)'.format(
+                self.num_time_periods, len(self.column_list), len(self.zero_key_set), len(self.other_dic))
+
+    # new series are added as columns all at once, so the array is copied only once
+    def update(self, *args, **kwargs):
+        new_column_list = []
+        for key, value in dict(*args, **kwargs).items():
+            is_new_column = False
+            if self.is_series(value) and np.any(value):
+                if key in self.column_dic:
+                    self.series[:, self.column_dic[key]] = value
+                    continue
+                is_new_column = True
+            if key in self:
+                del self[key]
+            if is_new_column:
+                new_column_list.append([key, value])
+            elif self.is_series(value):
+                self.zero_key_set.add(key)
+            else:
+                self.other_dic[key] = value
+
+        if len(new_column_list) > 0:
+            num_columns = len(self.column_list)
+            series = np.empty((self.num_time_periods, num_columns + len(new_column_list)), dtype = self.dtype)
+            series[:, :num_columns] = self.series
+            for column, (key, value) in enumerate(new_column_list, num_columns):
+                series[:, column] = value
+                self.column_list.append(key)
+                self.column_dic[key] = column
+            self.series = series
+
+    def copy(self):
+        result = CompactResult()
+        result.__setstate__(self.__getstate__())
+        result.series = self.series.copy()
+        result.other_dic = dict(self.other_dic)
+        return result
+
+    def __getstate__(self):
+        return {
+                'num_time_periods':self.num_time_periods,
+                'dtype':self.dtype.str,
+                'series':self.series,
+                'column_list':self.column_list,
+                'zero_key_list':sorted(self.zero_key_set),
+                'other_dic':self.other_dic
+                }
+
+    def __setstate__(self, state):
+        self.num_time_periods = state['num_time_periods']
+        self.dtype = np.dtype(state['dtype'])
+        self.series = state['series']
+        self.column_list = list(state['column_list'])
+        self.column_dic = dict((key, column) for column, key in enumerate(self.column_list))
+        self.zero_key_set = set(state['zero_key_list'])
+        self.other_dic = state['other_dic']
@@ -33,7 +33,11 @@ Time
 
 import cvxpy as cvx
 import datetime
+import multiprocessing
 import numpy as np
+from Compact_Result import CompactResult
+from Cost_Model import cost_and_storage_calculation_batch
+from Supporting_Functions import func_sweep_order
 
 # Core function
 #   Linear programming
@@ -47,26 +51,91 @@ def core_model_loop (global_dic, case_dic_list):
         print 'Core_Model.py: Entering core model loop'
     num_cases = len(case_dic_list)
     
+    # EXPORT_LP = 'MPS' or 'LP' writes the LP of each case to a file (see
+    # Export_LP.py); SOLVE = False only exports, without solving any case.
+    export_lp = global_dic.get('EXPORT_LP', '').upper()
+    if export_lp in ['MPS','LP']:
+        from Export_LP import export_case_lp
+    solve = global_dic.get('SOLVE', True)
+    
+    # Cost attribution (Cost_Model.py) is run in a worker pool on batches of
+    # solved cases, so it overlaps with solving the next cases; each batch
+    # goes through the batched cost calculation at once. The pool is
+    # terminated if a case fails.
+    cost_model = global_dic['COST_MODEL'] and solve
+    if cost_model:
+        num_processes = global_dic['NUM_PROCESSES']
+        if num_processes <= 0:
+            num_processes = multiprocessing.cpu_count()
+        cost_batch_size = max(1, num_cases // (4 * num_processes)) # a few batches per process
+        pool = multiprocessing.Pool(num_processes)
+        cost_job_list = [] # [case indices of the batch, job]
+        cost_batch = []
+    
+    # Cases are solved in the order set by CASE_ORDER (see func_sweep_order),
+    # so that consecutive cases are near each other in the sweep; results are
+    # kept in the order of the case input file.
+    case_order = func_sweep_order(case_dic_list, global_dic.get('CASE_ORDER','INPUT').upper())
+    
     result_list = [dict() for x in range(num_cases)]
-    for case_index in range(num_cases):
-
-        if verbose:
-            today = datetime.datetime.now()
-            print 'solving ',case_dic_list[case_index]['CASE_NAME'],' time = ',today
-        result_list[case_index] = core_model (global_dic, case_dic_list[case_index])                                            
-        if verbose:
-            today = datetime.datetime.now()
-            print 'solved  ',case_dic_list[case_index]['CASE_NAME'],' time = ',today
+    try:
+        for case_index in case_order:
+
+            if export_lp in ['MPS','LP']:
+                export_case_lp(global_dic, case_dic_list[case_index], export_lp)
+            if not solve:
+                continue
+            if verbose:
+                today = datetime.datetime.now()
+                print 'solving ',case_dic_list[case_index]['CASE_NAME'],' time = ',today
+            result_list[case_index] = core_model (global_dic, case_dic_list[case_index])                                            
+            if verbose:
+                today = datetime.datetime.now()
+                print 'solved  ',case_dic_list[case_index]['CASE_NAME'],' time = ',today
+            if cost_model:
+                cost_batch.append(case_index)
+                if len(cost_batch) == cost_batch_size:
+                    cost_job_list.append([cost_batch, submit_cost_batch(pool, global_dic, case_dic_list, result_list, cost_batch)])
+                    cost_batch = []
+
+        if cost_model:
+            if len(cost_batch) > 0:
+                cost_job_list.append([cost_batch, submit_cost_batch(pool, global_dic, case_dic_list, result_list, cost_batch)])
+            pool.close()
+            for batch, cost_job in cost_job_list:
+                for case_index, cost_result in zip(batch, cost_job.get()):
+                    result_list[case_index].update(cost_result)
+            pool.join()
+            if verbose:
+                today = datetime.datetime.now()
+                print 'Core_Model.py: cost attribution complete time = ',today
+    finally:
+        if cost_model:
+            pool.terminate()
     return result_list
 
+def submit_cost_batch(pool, global_dic, case_dic_list, result_list, cost_batch):
+    return pool.apply_async(
+            cost_and_storage_calculation_batch,
+            (global_dic, [case_dic_list[case_index] for case_index in cost_batch],
+             [result_list[case_index] for case_index in cost_batch])
+            )
+
 # -----------------------------------------------------------------------------
 
-def core_model (global_dic, case_dic):
+def core_model (global_dic, case_dic, solve = True, presolve = None):
+    # solve = False returns the cvxpy problem without solving it
+    # presolve = None uses global_dic['PRESOLVE'] (see the Presolve note below)
+    if solve and global_dic.get('PROBLEM_CACHE', False):
+        # same problem, built from cached constraint matrices (Problem_Cache.py)
+        from Problem_Cache import core_model_cached
+        return core_model_cached(global_dic, case_dic, presolve)
     verbose = global_dic['VERBOSE']
-    numerics_cost_scaling = global_dic['NUMERICS_COST_SCALING']
-    numerics_demand_scaling = global_dic['NUMERICS_DEMAND_SCALING']
     if verbose:
         print 'Core_Model.py: processing case ',case_dic['CASE_NAME']
+    if presolve is None:
+        presolve = global_dic.get('PRESOLVE', True)
+    numerics_cost_scaling, numerics_demand_scaling = numerics_scaling(global_dic, case_dic, presolve)
     demand_series = np.array(case_dic['DEMAND_SERIES'])*numerics_demand_scaling 
     solar_series = case_dic['SOLAR_SERIES'] # Assumed to be normalized per kW capacity
     wind_series = case_dic['WIND_SERIES'] # Assumed to be normalized per kW capacity
@@ -103,6 +172,30 @@ def core_model (global_dic, case_dic):
       
     num_time_periods = len(demand_series)
 
+    # -------------------------------------------------------------------------
+    # Presolve
+    #   Reductions made before the problem is passed to the solver (PRESOLVE):
+    #   1. Solar and wind are left out if their capacity factor is zero in every
+    #      hour (their capacity and dispatch are then zero).
+    #   2. dispatch_from_storage <= energy_storage * (1 - storage_decay_rate)
+    #      and the same constraint for PGP storage are left out. Continuity and
+    #      energy_storage >= 0 already give dispatch_from_storage <=
+    #      energy_storage * (1 - storage_decay_rate) + efficiency * dispatch_to_storage,
+    #      and charging and discharging in the same hour only loses energy.
+    #   The storage continuity constraints are built as two vector constraints
+    #   instead of one scalar constraint per hour, which makes the problem much
+    #   faster to build (the rows passed to the solver are the same).
+    #   capacity >= 0 is kept even though it is implied: its dual is the reduced
+    #   cost of the capacity (REDUCED_COST_CAPACITY_<component>).
+    
+    model_components = lp_components(case_dic, presolve) # components in the LP
+
+    if verbose:
+        numerics_range_dic = numerics_ranges(case_dic, model_components, numerics_cost_scaling, numerics_demand_scaling)
+        for key in ['OBJECTIVE','RHS','MATRIX']:
+            print ('Core_Model.py: {} coefficients from {:.3g} to {:.3g}'
+                   .format(key.lower(), numerics_range_dic[key][0], numerics_range_dic[key][1]))
+
     # -------------------------------------------------------------------------
         
     #%% Construct the Problem
@@ -129,15 +222,20 @@ def core_model (global_dic, case_dic):
     
     fcn2min = 0
     constraints = []
+    # constraints whose duals are returned with the results
+    capacity_bound_dic = {} # dispatch (or energy) <= capacity, by component
+    continuity_storage = []
+    continuity_pgp_storage = []
 
 #---------------------- natural gas ------------------------------------------    
-    if 'NATGAS' in system_components:
+    if 'NATGAS' in model_components:
         capacity_natgas = cvx.Variable(1)
         dispatch_natgas = cvx.Variable(num_time_periods)
+        capacity_bound_dic['NATGAS'] = dispatch_natgas <= capacity_natgas
         constraints += [
                 capacity_natgas >= 0,
                 dispatch_natgas >= 0,
-                dispatch_natgas <= capacity_natgas
+                capacity_bound_dic['NATGAS']
                 ]
         fcn2min += capacity_natgas * fixed_cost_natgas + cvx.sum_entries(dispatch_natgas * var_cost_natgas)/num_time_periods
     else:
@@ -145,13 +243,14 @@ def core_model (global_dic, case_dic):
         dispatch_natgas = np.zeros(num_time_periods)
         
 #---------------------- solar ------------------------------------------    
-    if 'SOLAR' in system_components:
+    if 'SOLAR' in model_components:
         capacity_solar = cvx.Variable(1)
         dispatch_solar = cvx.Variable(num_time_periods)
+        capacity_bound_dic['SOLAR'] = dispatch_solar <= capacity_solar * solar_series
         constraints += [
                 capacity_solar >= 0,
                 dispatch_solar >= 0, 
-                dispatch_solar <= capacity_solar * solar_series 
+                capacity_bound_dic['SOLAR']
                 ]
         fcn2min += capacity_solar * fixed_cost_solar + cvx.sum_entries(dispatch_solar * var_cost_solar)/num_time_periods
     else:
@@ -159,13 +258,14 @@ def core_model (global_dic, case_dic):
         dispatch_solar = np.zeros(num_time_periods)
         
 #---------------------- wind ------------------------------------------    
-    if 'WIND' in system_components:
+    if 'WIND' in model_components:
         capacity_wind = cvx.Variable(1)
         dispatch_wind = cvx.Variable(num_time_periods)
+        capacity_bound_dic['WIND'] = dispatch_wind <= capacity_wind * wind_series
         constraints += [
                 capacity_wind >= 0,
                 dispatch_wind >= 0, 
-                dispatch_wind <= capacity_wind * wind_series 
+                capacity_bound_dic['WIND']
                 ]
         fcn2min += capacity_wind * fixed_cost_wind + cvx.sum_entries(dispatch_wind * var_cost_wind)/num_time_periods
     else:
@@ -173,13 +273,14 @@ def core_model (global_dic, case_dic):
         dispatch_wind = np.zeros(num_time_periods)
         
 #---------------------- nuclear ------------------------------------------    
-    if 'NUCLEAR' in system_components:
+    if 'NUCLEAR' in model_components:
         capacity_nuclear = cvx.Variable(1)
         dispatch_nuclear = cvx.Variable(num_time_periods)
+        capacity_bound_dic['NUCLEAR'] = dispatch_nuclear <= capacity_nuclear
         constraints += [
                 capacity_nuclear >= 0,
                 dispatch_nuclear >= 0, 
-                dispatch_nuclear <= capacity_nuclear 
+                capacity_bound_dic['NUCLEAR']
                 ]
         fcn2min += capacity_nuclear * fixed_cost_nuclear + cvx.sum_entries(dispatch_nuclear * var_cost_nuclear)/num_time_periods
     else:
@@ -187,32 +288,41 @@ def core_model (global_dic, case_dic):
         dispatch_nuclear = np.zeros(num_time_periods)
         
 #---------------------- storage ------------------------------------------    
-    if 'STORAGE' in system_components:
+    if 'STORAGE' in model_components:
         capacity_storage = cvx.Variable(1)
         dispatch_to_storage = cvx.Variable(num_time_periods)
         dispatch_from_storage = cvx.Variable(num_time_periods)
         energy_storage = cvx.Variable(num_time_periods)
+        capacity_bound_dic['TO_STORAGE'] = dispatch_to_storage <= capacity_storage / storage_charging_time
+        capacity_bound_dic['FROM_STORAGE'] = dispatch_from_storage <= capacity_storage / storage_charging_time
+        capacity_bound_dic['STORAGE'] = energy_storage <= capacity_storage
         constraints += [
                 capacity_storage >= 0,
                 dispatch_to_storage >= 0, 
-                dispatch_to_storage <= capacity_storage / storage_charging_time,
+                capacity_bound_dic['TO_STORAGE'],
                 dispatch_from_storage >= 0, # dispatch_to_storage is negative value
-                dispatch_from_storage <= capacity_storage / storage_charging_time,
+                capacity_bound_dic['FROM_STORAGE'],
+                energy_storage >= 0,
+                capacity_bound_dic['STORAGE']
+                ]
+        if not presolve:
+            constraints += [
                 dispatch_from_storage <= energy_storage * (1 - storage_decay_rate), # you can't dispatch more from storage in a time step than is in the battery
                                                                                     # This constraint is redundant
-                energy_storage >= 0,
-                energy_storage <= capacity_storage
                 ]
 
         fcn2min += capacity_storage * fixed_cost_storage +  \
             cvx.sum_entries(dispatch_to_storage * var_cost_to_storage)/num_time_periods + \
             cvx.sum_entries(dispatch_from_storage * var_cost_from_storage)/num_time_periods 
  
-        for i in xrange(num_time_periods):
-
-            constraints += [
-                    energy_storage[(i+1) % num_time_periods] == energy_storage[i] + storage_charging_efficiency * dispatch_to_storage[i] - dispatch_from_storage[i] - energy_storage[i]*storage_decay_rate
-                    ]
+        # energy_storage[(i+1) % num_time_periods] == energy_storage[i] + storage_charging_efficiency * dispatch_to_storage[i] 
+        #     - dispatch_from_storage[i] - energy_storage[i]*storage_decay_rate, for all hours i
+        # written as one constraint for hours 0 ... N-2 and one for the last hour (wrapping around to hour 0)
+        energy_storage_next = energy_storage + storage_charging_efficiency * dispatch_to_storage - dispatch_from_storage - energy_storage*storage_decay_rate
+        if num_time_periods > 1:
+            continuity_storage.append(energy_storage[1:] == energy_storage_next[:-1])
+        continuity_storage.append(energy_storage[0] == energy_storage_next[num_time_periods-1])
+        constraints += continuity_storage
 
     else:
         capacity_storage = 0
@@ -230,25 +340,31 @@ def core_model (global_dic, case_dic):
 #   1. dispatch to storage (power)
 #   2. dispatch from storage (power)
 #
-    if 'PGP_STORAGE' in system_components:
+    if 'PGP_STORAGE' in model_components:
         capacity_pgp_storage = cvx.Variable(1)  # energy storage capacity in kWh (i.e., tank size)
         capacity_to_pgp_storage = cvx.Variable(1) # maximum power input / output (in kW) fuel cell / electrolyzer size
         capacity_from_pgp_storage = cvx.Variable(1) # maximum power input / output (in kW) fuel cell / electrolyzer size
         dispatch_to_pgp_storage = cvx.Variable(num_time_periods)
         dispatch_from_pgp_storage = cvx.Variable(num_time_periods)  # this is dispatch FROM storage
         energy_pgp_storage = cvx.Variable(num_time_periods) # amount of energy currently stored in tank
+        capacity_bound_dic['TO_PGP_STORAGE'] = dispatch_to_pgp_storage <= capacity_to_pgp_storage
+        capacity_bound_dic['FROM_PGP_STORAGE'] = dispatch_from_pgp_storage <= capacity_from_pgp_storage
+        capacity_bound_dic['PGP_STORAGE'] = energy_pgp_storage <= capacity_pgp_storage
         constraints += [
                 capacity_pgp_storage >= 0,  # energy
                 capacity_to_pgp_storage >= 0,  # power in
                 capacity_from_pgp_storage >= 0,  # power out
                 dispatch_to_pgp_storage >= 0, 
-                dispatch_to_pgp_storage <= capacity_to_pgp_storage,
+                capacity_bound_dic['TO_PGP_STORAGE'],
                 dispatch_from_pgp_storage >= 0, # dispatch_to_storage is negative value
-                dispatch_from_pgp_storage <= capacity_from_pgp_storage,
+                capacity_bound_dic['FROM_PGP_STORAGE'],
+                energy_pgp_storage >= 0,
+                capacity_bound_dic['PGP_STORAGE']
+                ]
+        if not presolve:
+            constraints += [
                 dispatch_from_pgp_storage <= energy_pgp_storage, # you can't dispatch more from storage in a time step than is in the battery
                                                                                     # This constraint is redundant
-                energy_pgp_storage >= 0,
-                energy_pgp_storage <= capacity_pgp_storage
                 ]
 
         fcn2min += capacity_pgp_storage * fixed_cost_pgp_storage + \
@@ -256,13 +372,13 @@ def core_model (global_dic, case_dic):
             cvx.sum_entries(dispatch_to_pgp_storage * var_cost_to_pgp_storage)/num_time_periods + \
             cvx.sum_entries(dispatch_from_pgp_storage * var_cost_from_pgp_storage)/num_time_periods 
  
-        for i in xrange(num_time_periods):
-
-            constraints += [
-                    energy_pgp_storage[(i+1) % num_time_periods] == energy_pgp_storage[i] 
-                    + pgp_storage_charging_efficiency * dispatch_to_pgp_storage[i] 
-                    - dispatch_from_pgp_storage[i] 
-                    ]
+        # energy_pgp_storage[(i+1) % num_time_periods] == energy_pgp_storage[i] 
+        #     + pgp_storage_charging_efficiency * dispatch_to_pgp_storage[i] - dispatch_from_pgp_storage[i], for all hours i
+        energy_pgp_storage_next = energy_pgp_storage + pgp_storage_charging_efficiency * dispatch_to_pgp_storage - dispatch_from_pgp_storage
+        if num_time_periods > 1:
+            continuity_pgp_storage.append(energy_pgp_storage[1:] == energy_pgp_storage_next[:-1])
+        continuity_pgp_storage.append(energy_pgp_storage[0] == energy_pgp_storage_next[num_time_periods-1])
+        constraints += continuity_pgp_storage
 
     else:
         capacity_pgp_storage = 0  # energy storage capacity in kWh (i.e., tank size)
@@ -273,7 +389,7 @@ def core_model (global_dic, case_dic):
         energy_pgp_storage = np.zeros(num_time_periods) # amount of energy currently stored in tank
 
 #---------------------- unmet demand ------------------------------------------    
-    if 'UNMET_DEMAND' in system_components:
+    if 'UNMET_DEMAND' in model_components:
         dispatch_unmet_demand = cvx.Variable(num_time_periods)
         constraints += [
                 dispatch_unmet_demand >= 0
@@ -284,9 +400,12 @@ def core_model (global_dic, case_dic):
         
   
 #---------------------- dispatch energy balance constraint ------------------------------------------    
-    constraints += [
+    energy_balance = (
             dispatch_natgas + dispatch_solar + dispatch_wind + dispatch_nuclear + dispatch_from_storage + dispatch_from_pgp_storage + dispatch_unmet_demand  == 
                 demand_series + dispatch_to_storage + dispatch_to_pgp_storage
+            )
+    constraints += [
+            energy_balance
             ]    
     
     # -----------------------------------------------------------------------------
@@ -300,6 +419,10 @@ def core_model (global_dic, case_dic):
     
     # Form and Solve the Problem
     prob = cvx.Problem(obj, constraints)
+    if not solve:
+        return prob
+    if global_dic.get('PRESOLVE_REPORT', False):
+        report_problem_size(prob, presolve_reduction(case_dic, presolve), case_dic['CASE_NAME'])
 #    prob.solve(solver = 'GUROBI')
     #prob.solve(solver = 'GUROBI',BarConvTol = 1e-11, feasibilityTol = 1e-6, NumericFocus = 3)
     prob.solve(solver = 'GUROBI')
@@ -311,72 +434,355 @@ def core_model (global_dic, case_dic):
         print 'system cost ',prob.value/(numerics_cost_scaling * numerics_demand_scaling)
                 
     # -----------------------------------------------------------------------------
+    # Results, from the solution values and the duals (see solution_result)
+    
+    variable_dic = {
+            'CAPACITY_NATGAS':capacity_natgas, 'DISPATCH_NATGAS':dispatch_natgas,
+            'CAPACITY_SOLAR':capacity_solar, 'DISPATCH_SOLAR':dispatch_solar,
+            'CAPACITY_WIND':capacity_wind, 'DISPATCH_WIND':dispatch_wind,
+            'CAPACITY_NUCLEAR':capacity_nuclear, 'DISPATCH_NUCLEAR':dispatch_nuclear,
+            'CAPACITY_STORAGE':capacity_storage, 'DISPATCH_TO_STORAGE':dispatch_to_storage,
+            'DISPATCH_FROM_STORAGE':dispatch_from_storage, 'ENERGY_STORAGE':energy_storage,
+            'FIXED_PGP_STORAGE':capacity_pgp_storage, 'CAPACITY_TO_PGP_STORAGE':capacity_to_pgp_storage,
+            'CAPACITY_FROM_PGP_STORAGE':capacity_from_pgp_storage, 'DISPATCH_TO_PGP_STORAGE':dispatch_to_pgp_storage,
+            'DISPATCH_FROM_PGP_STORAGE':dispatch_from_pgp_storage, 'ENERGY_PGP_STORAGE':energy_pgp_storage,
+            'DISPATCH_UNMET_DEMAND':dispatch_unmet_demand
+            }
+    # components not in the LP are constants (zero), the others cvxpy variables
+    value_dic = dict((key, getattr(variable, 'value', variable)) for key, variable in variable_dic.items())
     
+    dual_dic = dict((bound_name, dual_array(constraint, num_time_periods)) for bound_name, constraint in capacity_bound_dic.items())
+    dual_dic['ENERGY_BALANCE'] = dual_array(energy_balance, num_time_periods)
+    for family, continuity in [['STORAGE_CONTINUITY', continuity_storage], ['PGP_STORAGE_CONTINUITY', continuity_pgp_storage]]:
+        if continuity:
+            dual_dic[family] = np.concatenate([dual_array(constraint, np.prod(constraint.size)) for constraint in continuity])
+    
+    return solution_result(global_dic, case_dic, model_components, prob, value_dic, dual_dic,
+                           numerics_cost_scaling, numerics_demand_scaling)
+
+# -----------------------------------------------------------------------------
+
+# capacity variables (result key and fixed cost keyword) with the capacity
+# bounds each appears in, for the reduced costs; the first bound is the one
+# on the component itself
+capacity_variable_list = [
+        ['NATGAS', 'CAPACITY_NATGAS', 'FIXED_COST_NATGAS', ['NATGAS']],
+        ['SOLAR', 'CAPACITY_SOLAR', 'FIXED_COST_SOLAR', ['SOLAR']],
+        ['WIND', 'CAPACITY_WIND', 'FIXED_COST_WIND', ['WIND']],
+        ['NUCLEAR', 'CAPACITY_NUCLEAR', 'FIXED_COST_NUCLEAR', ['NUCLEAR']],
+        ['STORAGE', 'CAPACITY_STORAGE', 'FIXED_COST_STORAGE', ['STORAGE', 'TO_STORAGE', 'FROM_STORAGE']],
+        ['PGP_STORAGE', 'FIXED_PGP_STORAGE', 'FIXED_COST_PGP_STORAGE', ['PGP_STORAGE']],
+        ['TO_PGP_STORAGE', 'CAPACITY_TO_PGP_STORAGE', 'FIXED_COST_TO_PGP_STORAGE', ['TO_PGP_STORAGE']],
+        ['FROM_PGP_STORAGE', 'CAPACITY_FROM_PGP_STORAGE', 'FIXED_COST_FROM_PGP_STORAGE', ['FROM_PGP_STORAGE']],
+        ]
+
+# coefficient of the capacity in a capacity bound, dispatch <= coefficient * capacity
+def capacity_coefficient(case_dic, bound_name):
+    if bound_name in ['SOLAR','WIND']:
+        return np.array(case_dic[bound_name + '_SERIES'], dtype = float)
+    if bound_name in ['TO_STORAGE','FROM_STORAGE']:
+        return 1. / case_dic['STORAGE_CHARGING_TIME']
+    return 1.
+
+# Results of a solved case, for core_model and core_model_cached (Problem_Cache.py).
+#   value_dic -- solution value of every variable, by result key, in the scaled
+#       units of the LP (zero for components not in the LP)
+#   dual_dic -- duals of the energy balance, the storage continuity and the
+#       capacity bounds (by component), as flat arrays; absent if not in the LP
+def solution_result(global_dic, case_dic, model_components, prob, value_dic, dual_dic,
+                    numerics_cost_scaling, numerics_demand_scaling):
+
+    num_time_periods = len(case_dic['DEMAND_SERIES'])
     result={
             'SYSTEM_COST':prob.value/(numerics_cost_scaling * numerics_demand_scaling),
-            'PROBLEM_STATUS':prob.status
+            'PROBLEM_STATUS':prob.status,
+            'NUMERICS_COST_SCALING':numerics_cost_scaling,
+            'NUMERICS_DEMAND_SCALING':numerics_demand_scaling
             }
+    numerics_range_dic = numerics_ranges(case_dic, model_components, numerics_cost_scaling, numerics_demand_scaling)
+    for key in ['OBJECTIVE','RHS','MATRIX']:
+        result['NUMERICS_' + key + '_RANGE'] = numerics_range_dic[key][1] / numerics_range_dic[key][0]
     
-    if 'NATGAS' in system_components:
-        result['CAPACITY_NATGAS'] = np.asscalar(capacity_natgas.value)/numerics_demand_scaling
-        result['DISPATCH_NATGAS'] = np.array(dispatch_natgas.value).flatten()/numerics_demand_scaling
-    else:
-        result['CAPACITY_NATGAS'] = capacity_natgas/numerics_demand_scaling
-        result['DISPATCH_NATGAS'] = dispatch_natgas/numerics_demand_scaling
+    capacity_key_list = [capacity_key for capacity_name, capacity_key, cost_key, bound_name_list in capacity_variable_list]
+    for key, value in value_dic.items():
+        if key in capacity_key_list:
+            result[key] = np.array(value, dtype = float).item()/numerics_demand_scaling
+        else:
+            result[key] = np.array(value, dtype = float).flatten()/numerics_demand_scaling
+        
+    # -----------------------------------------------------------------------------
+    # Shadow prices and reduced costs
+    #
+    # The objective is the mean hourly cost, so the dual of an hourly constraint
+    # times num_time_periods is the cost of that constraint per kWh in that hour.
+    # Dividing by numerics_cost_scaling undoes the scaling (demand scaling cancels).
+    # cvxpy writes a == b as a - b == 0, so the dual of the energy balance has the
+    # opposite sign to the price of adding electricity. The continuity rows are
+    # written the other way round (storage at the next hour on the left), so
+    # their duals already have the sign of the value of stored energy.
+    #
+    #   PRICE_ELECTRICITY -- marginal cost of demand in each hour ($/kWh)
+    #   PRICE_STORAGE, PRICE_PGP_STORAGE -- value of energy in storage at the end
+    #       of each hour ($/kWh)
+    #   SHADOW_CAPACITY_<component> -- value of 1 kW (or kWh) more capacity in
+    #       each hour ($/kWh per kW)
+    #   REDUCED_COST_CAPACITY_<component> -- fixed cost minus the value of the
+    #       capacity over all hours ($/h per kW); zero if the component is built,
+    #       otherwise how much its fixed cost would need to fall to be built
+    
+    dual_scaling = num_time_periods / numerics_cost_scaling
+    
+    result['PRICE_ELECTRICITY'] = -dual_dic['ENERGY_BALANCE'] * dual_scaling
+    for price_name, family in [['PRICE_STORAGE','STORAGE_CONTINUITY'], ['PRICE_PGP_STORAGE','PGP_STORAGE_CONTINUITY']]:
+        if family in dual_dic:
+            result[price_name] = dual_dic[family] * dual_scaling
+        else:
+            result[price_name] = np.zeros(num_time_periods)
+    
+    for capacity_name, capacity_key, cost_key, bound_name_list in capacity_variable_list:
+        if bound_name_list[0] in dual_dic:
+            reduced_cost = case_dic[cost_key]
+            for bound_name in bound_name_list:
+                shadow_capacity = dual_dic[bound_name] * dual_scaling
+                result['SHADOW_CAPACITY_' + bound_name] = shadow_capacity
+                reduced_cost -= np.sum(shadow_capacity * capacity_coefficient(case_dic, bound_name)) / num_time_periods
+            result['REDUCED_COST_CAPACITY_' + capacity_name] = reduced_cost
+        else:
+            for bound_name in bound_name_list:
+                result['SHADOW_CAPACITY_' + bound_name] = np.zeros(num_time_periods)
+            result['REDUCED_COST_CAPACITY_' + capacity_name] = np.nan
 
-    if 'SOLAR' in system_components:
-        result['CAPACITY_SOLAR'] = np.asscalar(capacity_solar.value)/numerics_demand_scaling
-        result['DISPATCH_SOLAR'] = np.array(dispatch_solar.value).flatten()/numerics_demand_scaling
-    else:
-        result['CAPACITY_SOLAR'] = capacity_solar/numerics_demand_scaling
-        result['DISPATCH_SOLAR'] = dispatch_solar/numerics_demand_scaling
+    # -----------------------------------------------------------------------------
+    # Check the unscaled solution against the constraints
+    
+    result.update(verify_solution(case_dic, result))
+    verify_tolerance = global_dic.get('VERIFY_TOLERANCE', 1e-6)
+    result['VERIFY_VIOLATION'] = result['VERIFY_MAX_RESIDUAL'] > verify_tolerance
+    if result['VERIFY_VIOLATION']:
+        print ('Core_Model.py: case {} violates the constraints, largest residual {:.3g} (VERIFY_TOLERANCE {:.3g})'
+               .format(case_dic['CASE_NAME'], result['VERIFY_MAX_RESIDUAL'], verify_tolerance))
 
-    if 'WIND' in system_components:
-        result['CAPACITY_WIND'] = np.asscalar(capacity_wind.value)/numerics_demand_scaling
-        result['DISPATCH_WIND'] = np.array(dispatch_wind.value).flatten()/numerics_demand_scaling
-    else:
-        result['CAPACITY_WIND'] = capacity_wind/numerics_demand_scaling
-        result['DISPATCH_WIND'] = dispatch_wind/numerics_demand_scaling
+    # hourly series in one array, zero series (absent components) not stored
+    return CompactResult(result, num_time_periods, global_dic.get('RESULT_FLOAT32', False))
 
-    if 'NUCLEAR' in system_components:
-        result['CAPACITY_NUCLEAR'] = np.asscalar(capacity_nuclear.value)/numerics_demand_scaling
-        result['DISPATCH_NUCLEAR'] = np.array(dispatch_nuclear.value).flatten()/numerics_demand_scaling
-    else:
-        result['CAPACITY_NUCLEAR'] = capacity_nuclear/numerics_demand_scaling
-        result['DISPATCH_NUCLEAR'] = dispatch_nuclear/numerics_demand_scaling
-
-    if 'STORAGE' in system_components:
-        result['CAPACITY_STORAGE'] = np.asscalar(capacity_storage.value)/numerics_demand_scaling
-        result['DISPATCH_TO_STORAGE'] = np.array(dispatch_to_storage.value).flatten()/numerics_demand_scaling
-        result['DISPATCH_FROM_STORAGE'] = np.array(dispatch_from_storage.value).flatten()/numerics_demand_scaling
-        result['ENERGY_STORAGE'] = np.array(energy_storage.value).flatten()/numerics_demand_scaling
-    else:
-        result['CAPACITY_STORAGE'] = capacity_storage/numerics_demand_scaling
-        result['DISPATCH_TO_STORAGE'] = dispatch_to_storage/numerics_demand_scaling
-        result['DISPATCH_FROM_STORAGE'] = dispatch_from_storage/numerics_demand_scaling
-        result['ENERGY_STORAGE'] = energy_storage/numerics_demand_scaling
-        
-    if 'PGP_STORAGE' in system_components:
-        result['FIXED_PGP_STORAGE'] = np.asscalar(capacity_pgp_storage.value)/numerics_demand_scaling
-        result['CAPACITY_TO_PGP_STORAGE'] = np.asscalar(capacity_to_pgp_storage.value)/numerics_demand_scaling
-        result['CAPACITY_FROM_PGP_STORAGE'] = np.asscalar(capacity_from_pgp_storage.value)/numerics_demand_scaling
-        result['DISPATCH_TO_PGP_STORAGE'] = np.array(dispatch_to_pgp_storage.value).flatten()/numerics_demand_scaling
-        result['DISPATCH_FROM_PGP_STORAGE'] = np.array(dispatch_from_pgp_storage.value).flatten()/numerics_demand_scaling
-        result['ENERGY_PGP_STORAGE'] = np.array(energy_pgp_storage.value).flatten()/numerics_demand_scaling
-    else:
-        result['FIXED_PGP_STORAGE'] = capacity_pgp_storage/numerics_demand_scaling
-        result['CAPACITY_TO_PGP_STORAGE'] = capacity_to_pgp_storage/numerics_demand_scaling
-        result['CAPACITY_FROM_PGP_STORAGE'] = capacity_from_pgp_storage/numerics_demand_scaling
-        result['DISPATCH_TO_PGP_STORAGE'] = dispatch_to_pgp_storage/numerics_demand_scaling
-        result['DISPATCH_FROM_PGP_STORAGE'] = dispatch_from_pgp_storage/numerics_demand_scaling
-        result['ENERGY_PGP_STORAGE'] = energy_pgp_storage/numerics_demand_scaling
-        
-        
-    if 'UNMET_DEMAND' in system_components:
-        result['DISPATCH_UNMET_DEMAND'] = np.array(dispatch_unmet_demand.value).flatten()/numerics_demand_scaling
-    else:
-        result['DISPATCH_UNMET_DEMAND'] = dispatch_unmet_demand/numerics_demand_scaling
+# -----------------------------------------------------------------------------
+
+# dual value of a constraint as a flat array (nan if the solver returned none)
+def dual_array(constraint, size):
+    if constraint.dual_value is None:
+        return np.nan * np.ones(size)
+    return np.array(constraint.dual_value, dtype = float).flatten()
+
+# -----------------------------------------------------------------------------
+
+# constraint families checked by verify_solution
+verify_family_list = ['ENERGY_BALANCE','STORAGE_CONTINUITY','PGP_STORAGE_CONTINUITY','CAPACITY','NONNEGATIVITY']
+
+# Residuals of the unscaled solution in <result> for each constraint family,
+# relative to mean demand. For each family, VERIFY_<family>_MAX and
+# VERIFY_<family>_MEAN are the largest and mean absolute residual (equality
+# constraints) or violation (inequality constraints) over all hours.
+def verify_solution(case_dic, result):
+
+    demand_series = np.array(case_dic['DEMAND_SERIES'], dtype = float)
+    solar_series = np.array(case_dic['SOLAR_SERIES'], dtype = float)
+    wind_series = np.array(case_dic['WIND_SERIES'], dtype = float)
+    storage_charging_efficiency = case_dic['STORAGE_CHARGING_EFFICIENCY']
+    storage_charging_time = max(case_dic['STORAGE_CHARGING_TIME'], 1e-12)
+    storage_decay_rate = case_dic['STORAGE_DECAY_RATE']
+    pgp_storage_charging_efficiency = case_dic['PGP_STORAGE_CHARGING_EFFICIENCY']
+    
+    d = dict((key, np.array(result[key], dtype = float)) for key in [
+            'DISPATCH_NATGAS','DISPATCH_SOLAR','DISPATCH_WIND','DISPATCH_NUCLEAR',
+            'DISPATCH_TO_STORAGE','DISPATCH_FROM_STORAGE','ENERGY_STORAGE',
+            'DISPATCH_TO_PGP_STORAGE','DISPATCH_FROM_PGP_STORAGE','ENERGY_PGP_STORAGE',
+            'DISPATCH_UNMET_DEMAND',
+            'CAPACITY_NATGAS','CAPACITY_SOLAR','CAPACITY_WIND','CAPACITY_NUCLEAR','CAPACITY_STORAGE',
+            'FIXED_PGP_STORAGE','CAPACITY_TO_PGP_STORAGE','CAPACITY_FROM_PGP_STORAGE'
+            ])
+    
+    residual_dic = {}
+    residual_dic['ENERGY_BALANCE'] = (
+            d['DISPATCH_NATGAS'] + d['DISPATCH_SOLAR'] + d['DISPATCH_WIND'] + d['DISPATCH_NUCLEAR'] +
+            d['DISPATCH_FROM_STORAGE'] + d['DISPATCH_FROM_PGP_STORAGE'] + d['DISPATCH_UNMET_DEMAND'] -
+            demand_series - d['DISPATCH_TO_STORAGE'] - d['DISPATCH_TO_PGP_STORAGE']
+            )
+    residual_dic['STORAGE_CONTINUITY'] = (
+            np.roll(d['ENERGY_STORAGE'], -1) - d['ENERGY_STORAGE'] * (1 - storage_decay_rate) -
+            storage_charging_efficiency * d['DISPATCH_TO_STORAGE'] + d['DISPATCH_FROM_STORAGE']
+            )
+    residual_dic['PGP_STORAGE_CONTINUITY'] = (
+            np.roll(d['ENERGY_PGP_STORAGE'], -1) - d['ENERGY_PGP_STORAGE'] -
+            pgp_storage_charging_efficiency * d['DISPATCH_TO_PGP_STORAGE'] + d['DISPATCH_FROM_PGP_STORAGE']
+            )
+    residual_dic['CAPACITY'] = np.maximum(0., np.concatenate([
+            d['DISPATCH_NATGAS'] - d['CAPACITY_NATGAS'],
+            d['DISPATCH_SOLAR'] - d['CAPACITY_SOLAR'] * solar_series,
+            d['DISPATCH_WIND'] - d['CAPACITY_WIND'] * wind_series,
+            d['DISPATCH_NUCLEAR'] - d['CAPACITY_NUCLEAR'],
+            d['DISPATCH_TO_STORAGE'] - d['CAPACITY_STORAGE'] / storage_charging_time,
+            d['DISPATCH_FROM_STORAGE'] - d['CAPACITY_STORAGE'] / storage_charging_time,
+            d['ENERGY_STORAGE'] - d['CAPACITY_STORAGE'],
+            d['DISPATCH_TO_PGP_STORAGE'] - d['CAPACITY_TO_PGP_STORAGE'],
+            d['DISPATCH_FROM_PGP_STORAGE'] - d['CAPACITY_FROM_PGP_STORAGE'],
+            d['ENERGY_PGP_STORAGE'] - d['FIXED_PGP_STORAGE']
+            ]))
+    residual_dic['NONNEGATIVITY'] = np.maximum(0., -np.concatenate([np.atleast_1d(d[key]) for key in sorted(d.keys())]))
+    
+    mean_demand = np.mean(np.abs(demand_series))
+    if mean_demand <= 0:
+        mean_demand = 1.
+    
+    verify_dic = {}
+    for family in verify_family_list:
+        residual = np.abs(residual_dic[family]) / mean_demand
+        verify_dic['VERIFY_' + family + '_MAX'] = np.max(residual)
+        verify_dic['VERIFY_' + family + '_MEAN'] = np.mean(residual)
+    verify_dic['VERIFY_MAX_RESIDUAL'] = max(verify_dic['VERIFY_' + family + '_MAX'] for family in verify_family_list)
+    
+    return verify_dic
+
+# -----------------------------------------------------------------------------
+
+# components in the LP of a case: with presolve, solar and wind are left out
+# if their capacity factor is zero in every hour
+def lp_components(case_dic, presolve):
+    model_components = list(case_dic['SYSTEM_COMPONENTS'])
+    if presolve:
+        if 'SOLAR' in model_components and np.max(case_dic['SOLAR_SERIES']) <= 0:
+            model_components.remove('SOLAR')
+        if 'WIND' in model_components and np.max(case_dic['WIND_SERIES']) <= 0:
+            model_components.remove('WIND')
+    return model_components
+
+# cost keywords in the objective of the LP; variable costs (VAR_COST_) are
+# per kWh and enter the objective divided by the number of hours
+objective_cost_key_list = [
+        'FIXED_COST_NATGAS','FIXED_COST_SOLAR','FIXED_COST_WIND','FIXED_COST_NUCLEAR',
+        'FIXED_COST_STORAGE','FIXED_COST_PGP_STORAGE','FIXED_COST_TO_PGP_STORAGE','FIXED_COST_FROM_PGP_STORAGE',
+        'VAR_COST_NATGAS','VAR_COST_SOLAR','VAR_COST_WIND','VAR_COST_NUCLEAR','VAR_COST_UNMET_DEMAND',
+        'VAR_COST_TO_STORAGE','VAR_COST_FROM_STORAGE','VAR_COST_TO_PGP_STORAGE','VAR_COST_FROM_PGP_STORAGE'
+        ]
+
+# component that a FIXED_COST_ or VAR_COST_ keyword belongs to
+def cost_component(key):
+    component = key.split('_COST_', 1)[1]
+    for prefix in ['TO_','FROM_']:
+        if component.startswith(prefix):
+            component = component[len(prefix):]
+    return component
+
+# NUMERICS_COST_SCALING and NUMERICS_DEMAND_SCALING for a case. A value <= 0
+# (the default) is chosen from the case data: demand is scaled to a mean of 1,
+# and costs so that the geometric mean of the positive cost coefficients of
+# the components in the LP is 1.
+# Capacities and dispatch are then of order 1, and so is the objective.
+# All results are unscaled in core_model.
+def numerics_scaling(global_dic, case_dic, presolve = None):
+
+    numerics_cost_scaling = global_dic['NUMERICS_COST_SCALING']
+    numerics_demand_scaling = global_dic['NUMERICS_DEMAND_SCALING']
+    
+    if numerics_demand_scaling <= 0:
+        mean_demand = np.mean(case_dic['DEMAND_SERIES'])
+        numerics_demand_scaling = 1. / mean_demand if mean_demand > 0 else 1.
         
+    if numerics_cost_scaling <= 0:
+        # costs of the components in the LP only; cost keywords of other
+        # components can hold placeholders (-1). Unmet demand is left out:
+        # its cost is a penalty, not a technology cost.
+        if presolve is None:
+            presolve = global_dic.get('PRESOLVE', True)
+        model_components = lp_components(case_dic, presolve)
+        cost_list = [case_dic[key] for key in objective_cost_key_list
+                     if key != 'VAR_COST_UNMET_DEMAND' and case_dic[key] > 0
+                     and cost_component(key) in model_components]
+        if len(cost_list) > 0:
+            numerics_cost_scaling = 1. / np.exp(np.mean(np.log(cost_list)))
+        else:
+            numerics_cost_scaling = 1.
+
+    return numerics_cost_scaling, numerics_demand_scaling
+
+# smallest and largest nonzero magnitude in a list of numbers and arrays
+def coefficient_range(value_list):
+    values = np.abs(np.concatenate([np.array(value, dtype = float).flatten() for value in value_list]))
+    values = values[values > 0]
+    if len(values) == 0:
+        return 1., 1.
+    return np.min(values), np.max(values)
+
+# ranges (smallest, largest) of the nonzero coefficients of the scaled LP of a
+# case, from the case keywords; the solver is least accurate when a range
+# spans many orders of magnitude. Used by core_model and core_model_cached.
+def numerics_ranges(case_dic, model_components, numerics_cost_scaling, numerics_demand_scaling):
+    num_time_periods = len(case_dic['DEMAND_SERIES'])
+    objective_list = []
+    for key in objective_cost_key_list:
+        if cost_component(key) in model_components:
+            if key.startswith('VAR_COST_'):
+                objective_list.append(case_dic[key] * numerics_cost_scaling / num_time_periods)
+            else:
+                objective_list.append(case_dic[key] * numerics_cost_scaling)
+    matrix_list = [1.]
+    if 'SOLAR' in model_components:
+        matrix_list.append(case_dic['SOLAR_SERIES'])
+    if 'WIND' in model_components:
+        matrix_list.append(case_dic['WIND_SERIES'])
+    if 'STORAGE' in model_components:
+        matrix_list += [case_dic['STORAGE_CHARGING_EFFICIENCY'], 1. / max(case_dic['STORAGE_CHARGING_TIME'], 1e-12),
+                        1. - case_dic['STORAGE_DECAY_RATE']]
+    if 'PGP_STORAGE' in model_components:
+        matrix_list.append(case_dic['PGP_STORAGE_CHARGING_EFFICIENCY'])
+    return {
+            'OBJECTIVE':coefficient_range(objective_list),
+            'RHS':coefficient_range([np.array(case_dic['DEMAND_SERIES']) * numerics_demand_scaling]),
+            'MATRIX':coefficient_range(matrix_list)
+            }
+
+# -----------------------------------------------------------------------------
 
-    return result
+# rows, columns and nonzeros of the problem as passed to the solver
+def problem_size(prob):
+    data = prob.get_problem_data('GUROBI')
+    num_rows = 0
+    num_nonzeros = 0
+    for key in ['A','G']: # equality and inequality constraint matrices
+        if key in data and data[key] is not None:
+            num_rows += data[key].shape[0]
+            num_nonzeros += data[key].nnz
+    return num_rows, np.size(data['c']), num_nonzeros
+
+# rows, columns and nonzeros that presolve leaves out of the LP of a case,
+# counted from the constraints core_model would add without presolve, so the
+# problem is not built twice
+def presolve_reduction(case_dic, presolve):
+    num_rows = 0
+    num_columns = 0
+    num_nonzeros = 0
+    if not presolve:
+        return num_rows, num_columns, num_nonzeros
+    num_time_periods = len(case_dic['DEMAND_SERIES'])
+    model_components = lp_components(case_dic, presolve)
+    for component in ['SOLAR','WIND']:
+        if component in case_dic['SYSTEM_COMPONENTS'] and component not in model_components:
+            # capacity >= 0, dispatch >= 0 and dispatch <= capacity * series,
+            # and the dispatch in the energy balance
+            num_rows += 1 + 2 * num_time_periods
+            num_columns += 1 + num_time_periods
+            num_nonzeros += 1 + 3 * num_time_periods + np.count_nonzero(case_dic[component + '_SERIES'])
+    # dispatch_from <= energy * (1 - decay rate), redundant
+    if 'STORAGE' in model_components:
+        num_rows += num_time_periods
+        num_nonzeros += num_time_periods * (2 if case_dic['STORAGE_DECAY_RATE'] != 1 else 1)
+    if 'PGP_STORAGE' in model_components:
+        num_rows += num_time_periods
+        num_nonzeros += 2 * num_time_periods
+    return num_rows, num_columns, num_nonzeros
+
+def report_problem_size(prob, reduction, case_name):
+    num_rows, num_columns, num_nonzeros = problem_size(prob)
+    full_num_rows, full_num_columns, full_num_nonzeros = [size + reduced for size, reduced in zip([num_rows, num_columns, num_nonzeros], reduction)]
+    print ('Core_Model.py: presolve {}: rows {} -> {}, columns {} -> {}, nonzeros {} -> {}'
+           .format(case_name, full_num_rows, num_rows, full_num_columns, num_columns, full_num_nonzeros, num_nonzeros))
   
\ No newline at end of file
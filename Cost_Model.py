@@ -9,6 +9,7 @@ Created on Wed Aug 22 17:50:11 2018
 @author: kcaldeira
 """
 import numpy as np
+from Supporting_Functions import func_range_max_table, func_range_max_query
 
 #%%
 #  Takes a capacity cost (fixed cost) and dispatch cost (variable cost) and
@@ -112,184 +113,196 @@ def cost_model_intermittent(fixed_cost_in, var_cost_in, dispatch_in, capacity_in
     return cost_per_hour, cost_per_kWh # cost of generation for each hour
 
 #%%
-# time loop cost calculations so as to include battery (and later PGP costs)
+#  Batched versions of cost_model_dispatchable and cost_model_intermittent.
 #
-# This code is assumed to have in it data from an individual simulation in the
-# form of <global_dic>, a single element of <case_dic_list> and <result_list>.
+#  These take a 2-D array of dispatch (cases x hours) and do the sort, the
+#  incremental capacity calculation and the unsort for all cases at once, with
+#  one argsort along the time axis. Fixed and variable costs can either be
+#  scalars or have one value per case. Results are (cases x hours) arrays and
+#  row i is identical to what the single case functions return for case i.
+#
+#  Takes a 2-D array of capacity needed in each hour and returns, for each case
+#  and hour, the cumulative incremental capacity per hour used (see the
+#  description of cost_model_dispatchable above).
+#
+def cost_model_cum_incr_capacity_batch(capacity_needed):
+    num_cases, num_hours = capacity_needed.shape
+    rows = np.arange(num_cases)[:,np.newaxis]
+    
+    order = np.argsort(capacity_needed, axis=1)[:,::-1] # indices of each row in descending order
+    sorted_needed = capacity_needed[rows, order]
+    
+    # The highest amount of use is used for 1 hour, the second highest is needed for 2 hours, etc
+    needed_hours = 1. + np.arange(num_hours)
+    
+    incr_capacity = np.empty_like(sorted_needed)
+    incr_capacity[:,:-1] = sorted_needed[:,:-1] - sorted_needed[:,1:]
+    incr_capacity[:,-1] = sorted_needed[:,-1]
+    
+    incr_capacity_div_hours_used = incr_capacity / needed_hours
+    
+    cum_incr_capacity_sorted = np.cumsum(incr_capacity_div_hours_used[:,::-1], axis=1)[:,::-1]
+    
+    # scatter back into time order (this is the unsort)
+    cum_incr_capacity = np.empty_like(cum_incr_capacity_sorted)
+    cum_incr_capacity[rows, order] = cum_incr_capacity_sorted
     
-# This code returns its result by updating dictionary <result> which should be a pointer.
+    return cum_incr_capacity
 
-def cost_and_storage_calculation( global_dic, case_dic, result ):
+def cost_model_dispatchable_batch(fixed_cost_in, var_cost_in, dispatch_in):
+    dispatch = np.atleast_2d(np.array(dispatch_in, dtype=float)) # cases x hours
+    fixed_cost = np.array(fixed_cost_in, dtype=float).reshape(-1,1) # avoid integer arithmatic
+    var_cost = np.array(var_cost_in, dtype=float).reshape(-1,1)
+    num_hours = dispatch.shape[1]
     
-    num_time_periods = len(case_dic['DEMAND_SERIES'])
-    zeroVec = np.zeros(num_time_periods,dtype=float)
-    totalDispatch = zeroVec[:]
-    totalCost = zeroVec[:]
+    cum_incr_capacity = cost_model_cum_incr_capacity_batch(dispatch)
     
-    system_components = case_dic['SYSTEM_COMPONENTS']  
+    cost_per_hour = var_cost * dispatch + fixed_cost * num_hours * cum_incr_capacity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost_per_kWh = cost_per_hour / dispatch
     
-    if 'NATGAS' in system_components:
-        dispatch = result['DISPATCH_NATGAS']
-        costPerHour = cost_model_dispatchable(
-                case_dic['FIXED_COST_NATGAS'],
-                case_dic['VAR_COST_NATGAS'],
-                dispatch
-                )
-        result['COST_NATGAS_PERHOUR'] = costPerHour 
-        result['COST_NATGAS_PERKWH'] = costPerHour / dispatch
-        totalDispatch += dispatch
-        totalCost += costPerHour
-    else:
-        result['COST_NATGAS_PERHOUR'] = zeroVec
-        result['COST_NATGAS_PERKWH'] = zeroVec
+    return cost_per_hour, cost_per_kWh # cost of generation for each case and hour
 
-    if 'SOLAR' in system_components:
-        dispatch = result['DISPATCH_SOLAR']
-        costPerHour = cost_model_dispatchable(
-                case_dic['FIXED_COST_SOLAR'],
-                case_dic['VAR_COST_SOLAR'],
-                dispatch
-                )
-        result['COST_SOLAR_PERHOUR'] = costPerHour 
-        result['COST_SOLAR_PERKWH'] = costPerHour / dispatch
-        totalDispatch += dispatch
-        totalCost += costPerHour
-    else:
-        result['COST_SOLAR_PERHOUR'] = zeroVec
-        result['COST_SOLAR_PERKWH'] = zeroVec
+def cost_model_intermittent_batch(fixed_cost_in, var_cost_in, dispatch_in, capacity_in):
+    dispatch = np.atleast_2d(np.array(dispatch_in, dtype=float)) # cases x hours
+    capacity = np.atleast_2d(np.array(capacity_in, dtype=float)) # hourly generation capacity per unit capacity installed
+    fixed_cost = np.array(fixed_cost_in, dtype=float).reshape(-1,1) # avoid integer arithmatic
+    var_cost = np.array(var_cost_in, dtype=float).reshape(-1,1)
+    capacity_needed = np.divide(dispatch, capacity, out = np.zeros_like(dispatch), where=capacity!=0)
+    num_hours = dispatch.shape[1]
+    
+    cum_incr_capacity = cost_model_cum_incr_capacity_batch(capacity_needed)
+    
+    cost_per_hour = var_cost * dispatch + fixed_cost * num_hours * cum_incr_capacity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost_per_kWh = cost_per_hour / dispatch
+    
+    return cost_per_hour, cost_per_kWh # cost of generation for each case and hour
 
-    if 'WIND' in system_components:
-        dispatch = result['DISPATCH_WIND']
-        costPerHour = cost_model_dispatchable(
-                case_dic['FIXED_COST_WIND'],
-                case_dic['VAR_COST_WIND'],
-                dispatch
-                )
-        result['COST_WIND_PERHOUR'] = costPerHour 
-        result['COST_WIND_PERKWH'] = costPerHour / dispatch
-        totalDispatch += dispatch
-        totalCost += costPerHour
-    else:
-        result['COST_WIND_PERHOUR'] = zeroVec
-        result['COST_WIND_PERKWH'] = zeroVec
+#%%
+# Cost calculations for all cases at once, including battery (and later PGP costs)
+#
+# This code is assumed to have in it data from a set of simulations in the
+# form of <global_dic>, <case_dic_list> and <result_list>.
+#
+# Cases are grouped by the length of their time series. Within a group, all of
+# the cases that include a given technology are handled by a single call to the
+# batched cost models above.
+    
+# This code returns its result by updating the dictionaries in <result_list>.
 
-    if 'NUCLEAR' in system_components:
-        dispatch = result['VAR_NUCLEAR']
-        costPerHour = cost_model_dispatchable(
-                case_dic['FIXED_COST_NUCLEAR'],
-                case_dic['VAR_COST_NUCLEAR'],
-                dispatch
-                )
-        result['COST_NUCLEAR_PERHOUR'] = costPerHour 
-        result['COST_NUCLEAR_PERKWH'] = costPerHour / dispatch
-        totalDispatch += dispatch
-        totalCost += costPerHour
-    else:
-        result['COST_NUCLEAR_PERHOUR'] = zeroVec
-        result['COST_NUCLEAR_PERKWH'] = zeroVec
-        
-        
-    if 'UNMET_DEMAND' in system_components:
-        dispatch = result['VAR_UNMET_DEMAND']
-        costPerHour = dispatch * case_dic['VAR_COST_UNMET_DEMAND'] # Assume no fixed cost to UNMET_DEMAND
-        result['COST_UNMET_DEMAND_PERHOUR'] = costPerHour 
-        result['COST_UNMET_DEMAND_PERKWH'] = costPerHour / dispatch
-        totalDispatch += dispatch
-        totalCost += costPerHour
-    else:
-        result['COST_UNMET_DEMAND_PERHOUR'] = zeroVec
-        result['COST_UNMET_DEMAND_PERKWH'] = zeroVec
+# [ component, capacity series key ]; capacity series key is None for dispatchable technologies
+cost_model_technology_list = [
+        ['NATGAS', None],
+        ['SOLAR', 'SOLAR_SERIES'],
+        ['WIND', 'WIND_SERIES'],
+        ['NUCLEAR', None]
+        ]
 
-    # first just do capacity part of storage (i.e., not dispatch costs, and not electricity costs)
-    if ('STORAGE' in system_components) or ('PGP+STORAGE' in system_components):
-        cost_and_storage_lifo_stack_analysis( global_dic, case_dic, result )
-        # storage_capacity_and_cost_analysis adds the following items to <result>
-        # result['COST_STORAGE_PERKWH']  cost of electricity from storage in $/kWh
-        # result['COST_STORAGE_PERHOUR'] cost of electricity from storage per hour in $/hr (includes subcomponents listed below)
-        
-        # result['COST_TO_STORAGE_PERHOUR'] variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from storage
-        # result['COST_ELECTRICITY_TO_STORAGE_PERHOUR'] charging electricity cost contribution to hourly cost of electricity from storage
-        # result['COST_FROM_STORAGE_PERHOUR'] variable cost of discharging contribution to hourly cost of electricity from storage
-        # result['COST_STORAGE_FIXED_COST_PERHOUR'] allocation of fixed cost of storage to cost of electricity from storage
-        # result['STORAGE_CAPACITY_NEEDED'] amount of storage capacity needed to supply the electricity needed for that hour, treating storage as a LIFO stack
-        
-        # result['COST_PGP_STORAGE_PERKWH']  cost of electricity from PGP_STORAGE in $/kWh
-        
-        # result['COST_PGP_STORAGE_PERHOUR'] cost of electricity from PGP_STORAGE per hour in $/hr (includes subcomponents listed below)
-        
-        # result['COST_TO_PGP_STORAGE_PERHOUR'] variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from PGP_STORAGE
-        # result['COST_ELECTRICITY_TO_PGP_STORAGE_PERHOUR'] charging electricity cost contribution to hourly cost of electricity from PGP_STORAGE
-        # result['COST_FROM_PGP_STORAGE_PERHOUR'] variable cost of discharging contribution to hourly cost of electricity from PGP_STORAGE
-        # result['COST_PGP_STORAGE_FIXED_COST_PERHOUR'] allocation of fixed cost of PGP_STORAGE to cost of electricity from PGP_STORAGE
-        # result['PGP_STORAGE_CAPACITY_NEEDED'] amount of PGP_STORAGE energy capacity needed to supply the electricity needed for that hour, treating PGP_STORAGE as a LIFO stack
-    else:
-        result['COST_STORAGE_PERKWH'] =  zeroVec # cost of electricity from storage in $/kWh
-        
-        result['COST_STORAGE_PERHOUR'] =  zeroVec #  cost of electricity from storage per hour in $/hr (includes subcomponents listed below)
-        
-        result['COST_TO_STORAGE_PERHOUR'] =  zeroVec #  variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from storage
-        result['COST_ELECTRICITY_TO_STORAGE_PERHOUR'] =  zeroVec #  charging electricity cost contribution to hourly cost of electricity from storage
-        result['COST_FROM_STORAGE_PERHOUR'] =  zeroVec #  variable cost of discharging contribution to hourly cost of electricity from storage
-        result['COST_STORAGE_FIXED_COST_PERHOUR'] =  zeroVec #  allocation of fixed cost of storage to cost of electricity from storage
-        result['STORAGE_CAPACITY_NEEDED'] =  zeroVec #  amount of storage capacity needed to supply the electricity needed for that hour, treating storage as a LIFO stack
-        
-        result['COST_PGP_STORAGE_PERKWH'] =  zeroVec #   cost of electricity from PGP_STORAGE in $/kWh
-        
-        result['COST_PGP_STORAGE_PERHOUR'] =  zeroVec #  cost of electricity from PGP_STORAGE per hour in $/hr (includes subcomponents listed below)
+storage_cost_key_list = [
+        'COST_STORAGE_PERKWH', # cost of electricity from storage in $/kWh
+        'COST_STORAGE_PERHOUR', # cost of electricity from storage per hour in $/hr (includes subcomponents listed below)
+        'COST_TO_STORAGE_PERHOUR', # variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from storage
+        'COST_ELECTRICITY_TO_STORAGE_PERHOUR', # charging electricity cost contribution to hourly cost of electricity from storage
+        'COST_FROM_STORAGE_PERHOUR', # variable cost of discharging contribution to hourly cost of electricity from storage
+        'COST_STORAGE_FIXED_COST_PERHOUR', # allocation of fixed cost of storage to cost of electricity from storage
+        'STORAGE_CAPACITY_NEEDED', # amount of storage capacity needed to supply the electricity needed for that hour, treating storage as a LIFO stack
+        'COST_PGP_STORAGE_PERKWH', # cost of electricity from PGP_STORAGE in $/kWh
+        'COST_PGP_STORAGE_PERHOUR', # cost of electricity from PGP_STORAGE per hour in $/hr (includes subcomponents listed below)
+        'COST_TO_PGP_STORAGE_PERHOUR', # variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from PGP_STORAGE
+        'COST_ELECTRICITY_TO_PGP_STORAGE_PERHOUR', # charging electricity cost contribution to hourly cost of electricity from PGP_STORAGE
+        'COST_FROM_PGP_STORAGE_PERHOUR', # variable cost of discharging contribution to hourly cost of electricity from PGP_STORAGE
+        'COST_PGP_STORAGE_FIXED_COST_PERHOUR', # allocation of fixed cost of PGP_STORAGE to cost of electricity from PGP_STORAGE
+        'PGP_STORAGE_CAPACITY_NEEDED' # amount of PGP_STORAGE energy capacity needed to supply the electricity needed for that hour, treating PGP_STORAGE as a LIFO stack
+        ]
+
+def cost_and_storage_calculation( global_dic, case_dic_list, result_list ):
+    
+    num_time_periods_list = np.array([len(case_dic['DEMAND_SERIES']) for case_dic in case_dic_list])
+    
+    for num_time_periods in np.unique(num_time_periods_list):
+        group = np.where(num_time_periods_list == num_time_periods)[0]
+        zeroVec = np.zeros(num_time_periods,dtype=float)
         
-        result['COST_TO_PGP_STORAGE_PERHOUR'] =  zeroVec #  variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from PGP_STORAGE
-        result['COST_ELECTRICITY_TO_PGP_STORAGE_PERHOUR'] =  zeroVec #  charging electricity cost contribution to hourly cost of electricity from PGP_STORAGE
-        result['COST_FROM_PGP_STORAGE_PERHOUR'] =  zeroVec #  variable cost of discharging contribution to hourly cost of electricity from PGP_STORAGE
-        result['COST_PGP_STORAGE_FIXED_COST_PERHOUR'] =  zeroVec #  allocation of fixed cost of PGP_STORAGE to cost of electricity from PGP_STORAGE
-        result['PGP_STORAGE_CAPACITY_NEEDED'] =  zeroVec #  amount of PGP_STORAGE energy capacity needed to supply the electricity needed for that hour, treating PGP_STORAGE as a LIFO stack
+        for component, capacity_key in cost_model_technology_list:
+            members = [case_idx for case_idx in group if component in case_dic_list[case_idx]['SYSTEM_COMPONENTS']]
+            for case_idx in group:
+                if case_idx not in members:
+                    result_list[case_idx]['COST_'+component+'_PERHOUR'] = zeroVec
+                    result_list[case_idx]['COST_'+component+'_PERKWH'] = zeroVec
+            if len(members) == 0:
+                continue
+            
+            dispatch = np.array([result_list[case_idx]['DISPATCH_'+component] for case_idx in members])
+            fixed_cost = np.array([case_dic_list[case_idx]['FIXED_COST_'+component] for case_idx in members])
+            var_cost = np.array([case_dic_list[case_idx]['VAR_COST_'+component] for case_idx in members])
+            if capacity_key is None:
+                costPerHour, costPerKWh = cost_model_dispatchable_batch(fixed_cost, var_cost, dispatch)
+            else:
+                capacity = np.array([case_dic_list[case_idx][capacity_key] for case_idx in members])
+                costPerHour, costPerKWh = cost_model_intermittent_batch(fixed_cost, var_cost, dispatch, capacity)
+            
+            for row, case_idx in enumerate(members):
+                result_list[case_idx]['COST_'+component+'_PERHOUR'] = costPerHour[row]
+                result_list[case_idx]['COST_'+component+'_PERKWH'] = costPerKWh[row]
         
+        # Assume no fixed cost to UNMET_DEMAND
+        members = [case_idx for case_idx in group if 'UNMET_DEMAND' in case_dic_list[case_idx]['SYSTEM_COMPONENTS']]
+        if len(members) > 0:
+            dispatch = np.array([result_list[case_idx]['DISPATCH_UNMET_DEMAND'] for case_idx in members])
+            var_cost = np.array([case_dic_list[case_idx]['VAR_COST_UNMET_DEMAND'] for case_idx in members],dtype=float)
+            costPerHour = var_cost[:,np.newaxis] * dispatch
+            with np.errstate(divide='ignore', invalid='ignore'):
+                costPerKWh = costPerHour / dispatch
+        for case_idx in group:
+            if case_idx in members:
+                row = members.index(case_idx)
+                result_list[case_idx]['COST_UNMET_DEMAND_PERHOUR'] = costPerHour[row]
+                result_list[case_idx]['COST_UNMET_DEMAND_PERKWH'] = costPerKWh[row]
+            else:
+                result_list[case_idx]['COST_UNMET_DEMAND_PERHOUR'] = zeroVec
+                result_list[case_idx]['COST_UNMET_DEMAND_PERKWH'] = zeroVec
 
-#%%    def cost_and_storage_lifo_stack_analysis( global_dic, case_dic, result ):
+        # storage follows the LIFO stack through time, so it is done case by case
+        for case_idx in group:
+            system_components = case_dic_list[case_idx]['SYSTEM_COMPONENTS']
+            if ('STORAGE' in system_components) or ('PGP_STORAGE' in system_components):
+                cost_and_storage_lifo_stack_analysis( global_dic, case_dic_list[case_idx], result_list[case_idx] )
+                # cost_and_storage_lifo_stack_analysis adds the items in <storage_cost_key_list> to <result>
+            else:
+                for key in storage_cost_key_list:
+                    result_list[case_idx][key] = zeroVec
         
-        # The basic idea of the following code is to treat battery plus PGP storage 
 
-        # storage_capacity_and_cost_analysis adds the following items to <result>
-        # result['COST_STORAGE_PERKWH']  cost of electricity from storage in $/kWh
-        
-        # result['COST_STORAGE_PERHOUR'] cost of electricity from storage per hour in $/hr (includes subcomponents listed below)
-        
-        # result['COST_TO_STORAGE_PERHOUR'] variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from storage
-        # result['COST_ELECTRICITY_TO_STORAGE_PERHOUR'] charging electricity cost contribution to hourly cost of electricity from storage
-        # result['COST_FROM_STORAGE_PERHOUR'] variable cost of discharging contribution to hourly cost of electricity from storage
-        # result['COST_STORAGE_FIXED_COST_PERHOUR'] allocation of fixed cost of storage to cost of electricity from storage
-        # result['STORAGE_CAPACITY_NEEDED'] amount of storage capacity needed to supply the electricity needed for that hour, treating storage as a LIFO stack
-        
-        # result['COST_PGP_STORAGE_PERKWH']  cost of electricity from PGP_STORAGE in $/kWh
-        
-        # result['COST_PGP_STORAGE_PERHOUR'] cost of electricity from PGP_STORAGE per hour in $/hr (includes subcomponents listed below)
-        
-        # result['COST_TO_PGP_STORAGE_PERHOUR'] variable cost of charging (other than nelectricity cost) contribution to hourly cost of electricity from PGP_STORAGE
-        # result['COST_ELECTRICITY_TO_PGP_STORAGE_PERHOUR'] charging electricity cost contribution to hourly cost of electricity from PGP_STORAGE
-        # result['COST_FROM_PGP_STORAGE_PERHOUR'] variable cost of discharging contribution to hourly cost of electricity from PGP_STORAGE
-        # result['COST_PGP_STORAGE_FIXED_COST_PERHOUR'] allocation of fixed cost of PGP_STORAGE to cost of electricity from PGP_STORAGE
-        # result['PGP_STORAGE_CAPACITY_NEEDED'] amount of PGP_STORAGE energy capacity needed to supply the electricity needed for that hour, treating PGP_STORAGE as a LIFO stack
+#%%
+# LIFO stack analysis of storage costs for a single case.
+#
+# The basic idea of the following code is to treat battery and PGP storage
+# reservoirs as LIFO (Last-In First-Out) stacks. Each item pushed on the stack
+# carries the amount of energy stored and the cost per kWh of putting it there.
+# When electricity is discharged, the items it came from are popped off the
+# stack, so the cost of electricity upon discharge includes the cost of the
+# electricity that was used to charge the storage.
+#
+# cost_and_storage_lifo_stack_analysis adds the items in <storage_cost_key_list> to <result>
+# (see the comments on that list for definitions).
 
 def cost_and_storage_lifo_stack_analysis( global_dic, case_dic, result ):
     
-    # To allocate costs associated with storage, we want to allocate costs of storage capital and
-    # costs of charging and discharging the battery attributable per kWh or per hour for each hour of electricity delivery
-    
-    # This calculation treats the storage reservoirs as LIFO (Last-In First-Out) stacks where the costs and amounts of electricity are stored.
-    
-    # cost of electricity upon discharge must include the cost 
-    
     num_time_periods = len(case_dic['DEMAND_SERIES'])
     zeroVec = np.zeros(num_time_periods,dtype=float)
     
     system_components = case_dic['SYSTEM_COMPONENTS'] 
     
-    # costOfElectricity, amountOfElectricity
+    # costOfElectricity, amountOfElectricity from everything other than storage.
+    # Storage is assumed to be charged at the average cost of this electricity
+    # in the hour of charging.
     costOfElectricityOther = (
             result['COST_NATGAS_PERHOUR'] 
             + result['COST_WIND_PERHOUR']
             + result['COST_SOLAR_PERHOUR']
             + result['COST_NUCLEAR_PERHOUR']
-            + result['COST_UNMET_DEMAND']
+            + result['COST_UNMET_DEMAND_PERHOUR']
             )
     amountOfElectricityOther = (
             result['DISPATCH_NATGAS'] 
@@ -298,100 +311,163 @@ def cost_and_storage_lifo_stack_analysis( global_dic, case_dic, result ):
             + result['DISPATCH_NUCLEAR']
             + result['DISPATCH_UNMET_DEMAND']
             )
-    lifo_stack = []
-<<<<<<< HEAD
+    price_of_electricity = np.divide(costOfElectricityOther, amountOfElectricityOther,
+                                     out = np.zeros(num_time_periods), where = amountOfElectricityOther > 0)
+
+    if 'STORAGE' in system_components:
+        dispatch_to = result['DISPATCH_TO_STORAGE']
+        dispatch_from = result['DISPATCH_FROM_STORAGE']
+        
+        # charging costs per kWh charged (other than electricity)
+        cost_to_per_kWh = case_dic['VAR_COST_TO_STORAGE'] * np.ones(num_time_periods)
+        
+        cost_electricity, cost_to, capacity_needed = lifo_stack_cost_analysis(
+                dispatch_to, dispatch_from, result['ENERGY_STORAGE'],
+                case_dic['STORAGE_CHARGING_EFFICIENCY'], price_of_electricity, cost_to_per_kWh
+                )
+        
+        # fixed cost of storage is distributed over the hours that needed that much storage capacity
+        cost_fixed = cost_model_dispatchable_batch(case_dic['FIXED_COST_STORAGE'], 0., capacity_needed)[0][0]
+        cost_from = case_dic['VAR_COST_FROM_STORAGE'] * dispatch_from
+        
+        result['COST_ELECTRICITY_TO_STORAGE_PERHOUR'] = cost_electricity
+        result['COST_TO_STORAGE_PERHOUR'] = cost_to
+        result['COST_FROM_STORAGE_PERHOUR'] = cost_from
+        result['COST_STORAGE_FIXED_COST_PERHOUR'] = cost_fixed
+        result['STORAGE_CAPACITY_NEEDED'] = capacity_needed
+        result['COST_STORAGE_PERHOUR'] = cost_electricity + cost_to + cost_from + cost_fixed
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result['COST_STORAGE_PERKWH'] = result['COST_STORAGE_PERHOUR'] / dispatch_from
+    else:
+        for key in storage_cost_key_list[:7]:
+            result[key] = zeroVec
+
+    if 'PGP_STORAGE' in system_components:
+        dispatch_to = result['DISPATCH_TO_PGP_STORAGE']
+        dispatch_from = result['DISPATCH_FROM_PGP_STORAGE']
+        
+        # charging costs per kWh charged: variable cost plus the electrolyzer
+        # capacity cost, distributed over hours of charging like a dispatchable generator
+        cost_to_per_hour = cost_model_dispatchable_batch(
+                case_dic['FIXED_COST_TO_PGP_STORAGE'], case_dic['VAR_COST_TO_PGP_STORAGE'], dispatch_to)[0][0]
+        cost_to_per_kWh = np.divide(cost_to_per_hour, dispatch_to,
+                                    out = np.zeros(num_time_periods), where = dispatch_to > 0)
+        
+        cost_electricity, cost_to, capacity_needed = lifo_stack_cost_analysis(
+                dispatch_to, dispatch_from, result['ENERGY_PGP_STORAGE'],
+                case_dic['PGP_STORAGE_CHARGING_EFFICIENCY'], price_of_electricity, cost_to_per_kWh
+                )
+        
+        cost_fixed = cost_model_dispatchable_batch(case_dic['FIXED_COST_PGP_STORAGE'], 0., capacity_needed)[0][0]
+        # discharging costs: variable cost plus the fuel cell capacity cost
+        cost_from = cost_model_dispatchable_batch(
+                case_dic['FIXED_COST_FROM_PGP_STORAGE'], case_dic['VAR_COST_FROM_PGP_STORAGE'], dispatch_from)[0][0]
+        
+        result['COST_ELECTRICITY_TO_PGP_STORAGE_PERHOUR'] = cost_electricity
+        result['COST_TO_PGP_STORAGE_PERHOUR'] = cost_to
+        result['COST_FROM_PGP_STORAGE_PERHOUR'] = cost_from
+        result['COST_PGP_STORAGE_FIXED_COST_PERHOUR'] = cost_fixed
+        result['PGP_STORAGE_CAPACITY_NEEDED'] = capacity_needed
+        result['COST_PGP_STORAGE_PERHOUR'] = cost_electricity + cost_to + cost_from + cost_fixed
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result['COST_PGP_STORAGE_PERKWH'] = result['COST_PGP_STORAGE_PERHOUR'] / dispatch_from
+    else:
+        for key in storage_cost_key_list[7:]:
+            result[key] = zeroVec
+
+#%%
+# Follows one storage reservoir through time as a LIFO stack.
+#
+# <dispatch_to> and <dispatch_from> are the charging and discharging time series,
+# <energy> is the amount in storage at the beginning of each time step and
+# <efficiency> is the charging efficiency. <price_of_electricity> and
+# <cost_to_per_kWh> are the cost per kWh charged of the electricity and of the
+# charging itself.
+#
+# Returns, for each hour, the electricity cost and the charging cost of the
+# energy that was discharged in that hour, and the storage capacity needed to
+# supply it (the maximum amount in storage since the oldest energy discharged
+# was put in, minus the amount left after the discharge).
+#
+# Storage decay is neglected here.
+
+def lifo_stack_cost_analysis(dispatch_to, dispatch_from, energy, efficiency, price_of_electricity, cost_to_per_kWh):
+    num_time_periods = len(dispatch_from)
+    cost_electricity = np.zeros(num_time_periods)
+    cost_to = np.zeros(num_time_periods)
+    oldest_time = np.zeros(num_time_periods, dtype=int)
+
+    # The LIFO stack is held in preallocated arrays; there is at most one push
+    # per hour in each of the two passes below.
+    #  stack_time[i] == time_idx
+    #  stack_amount[i] == amount of electricitity in storage
+    #  stack_electricity[i] == electricity cost per kWh stored
+    #  stack_to[i] == charging cost per kWh stored
+    stack_time = np.zeros(2 * num_time_periods, dtype=int)
+    stack_amount = np.zeros(2 * num_time_periods)
+    stack_electricity = np.zeros(2 * num_time_periods)
+    stack_to = np.zeros(2 * num_time_periods)
+    stack_top = 0 # number of items on the stack
 
     # We need to cycle to get a good initial condition.
-    # Initially, we know the amount but not the age or cost of stored energy.
-    # So, we make the assumption that the cost was zero and the age was -1.
-    num_cycles = 3
-    
-=======
-    tmp = 0.
-    
-    for idx in range(num_time_periods-start_point):
-        idx = idx + start_point
-        tmp = tmp + DISPATCH_TO_STORAGE[idx] - DISPATCH_FROM_STORAGE[idx]
-              
-        if DISPATCH_TO_STORAGE[idx] > 0:  # push on stack (with time moved up 1 cycle)
-            lifo_stack.append([idx-num_time_periods,DISPATCH_TO_STORAGE[idx]*STORAGE_CHARGING_EFFICIENCY ])
-        if DISPATCH_FROM_STORAGE[idx] > 0:
-            dispatch_remaining = DISPATCH_FROM_STORAGE[idx]
-            while dispatch_remaining > 0:
-                #print len(lifo_stack),DISPATCH_FROM_STORAGE[idx],dispatch_remaining
-                if len(lifo_stack) != 0:
-                    top_of_stack = lifo_stack.pop()
-                    if top_of_stack[1] > dispatch_remaining:
-                        # partial removal
-                        new_top = np.copy(top_of_stack)
-                        new_top[1] = new_top[1] - dispatch_remaining
-                        lifo_stack.append(new_top)
-                        dispatch_remaining = 0
+    # Initially, we know the amount but not the age or cost of stored energy,
+    # so the first pass through the time series (with time moved back 1 cycle)
+    # only fills the stack, and the second pass is done for real.
+    for cycle in range(2):
+        for idx in range(num_time_periods):
+            time_idx = idx + (cycle - 1) * num_time_periods
+            if dispatch_to[idx] > 0:  # push on stack
+                stack_time[stack_top] = time_idx
+                stack_amount[stack_top] = dispatch_to[idx]*efficiency
+                stack_electricity[stack_top] = price_of_electricity[idx]/efficiency
+                stack_to[stack_top] = cost_to_per_kWh[idx]/efficiency
+                stack_top += 1
+            if dispatch_from[idx] > 0:
+                dispatch_remaining = dispatch_from[idx]
+                accum_electricity = 0.
+                accum_to = 0.
+                oldest_time[idx] = time_idx
+                while dispatch_remaining > 0 and stack_top > 0:
+                    top = stack_top - 1
+                    amount = min(stack_amount[top], dispatch_remaining)
+                    accum_electricity += amount * stack_electricity[top]
+                    accum_to += amount * stack_to[top]
+                    oldest_time[idx] = stack_time[top]
+                    if stack_amount[top] > dispatch_remaining:
+                        # partial removal, the remaining energy stays at the old time
+                        stack_amount[top] -= dispatch_remaining
                     else:
-                        dispatch_remaining = dispatch_remaining - top_of_stack[1]
-                else:
-                    dispatch_remaining = 0 # stop while loop if stack is empty
-    # Now we have the stack as an initial condition and can do it for real
-    max_headroom = np.zeros(num_time_periods)
-    mean_residence_time = np.zeros(num_time_periods)
-    max_residence_time = np.zeros(num_time_periods)
-    
-    # energy storage at time t is the amount of energy in storage in the beginning of the time step.
-    #   constraints += [
-    #        energy_storage[(i+1) % num_time_periods] == energy_storage[i] + storage_charging_efficiency * dispatch_to_storage[i] - dispatch_from_storage[i] - energy_storage[i]*storage_decay_rate
-    #        ]
-    #
-    #   constraints += [
-    #        energy_pgp_storage[(i+1) % num_time_periods] == energy_pgp_storage[i] 
-    #        + pgp_storage_charging_efficiency * dispatch_to_pgp_storage[i] 
-    #        - dispatch_from_pgp_storage[i] 
-    #        ]
+                        stack_top -= 1
+                    dispatch_remaining = dispatch_remaining - amount
+                cost_electricity[idx] = accum_electricity
+                cost_to[idx] = accum_to
 
-    # each item on lifo stack is a list:
-    #  lifo[0] == time_idx
-    #  lifo[1] == amount of electricitity to storage
-    #  lifo[2] == cost of putting that much electricity in storage
-    
-    lifo_storage = []
-    lifo_storage.append([-1,result['ENERGY_STORAGE'][0],0.]) # dummy cost and time of placement in battery
-    
-    lifo_pgp_storage[]
-    lifo_pgp_storage.append([-1,result['ENERGY_PGP_STORAGE'][0],0.]) # dummy cost and time of placement in battery
-    
+    # capacity needed from a range maximum table over the tripled energy series
+    capacity_needed = np.zeros(num_time_periods)
+    discharge_index = np.where(np.asarray(dispatch_from) > 0)[0]
+    if len(discharge_index) > 0:
+        energy_vec = np.concatenate([energy,energy,energy])
+        range_max_table = func_range_max_table(energy_vec)
+        capacity_needed[discharge_index] = func_range_max_query(
+                range_max_table,
+                oldest_time[discharge_index] + num_time_periods,
+                discharge_index + 1 + num_time_periods
+                ) - energy_vec[discharge_index + 1 + num_time_periods]
+    return cost_electricity, cost_to, capacity_needed
 
-    for time_idx in range(2 * num_time_periods):
-        max_head = 0
-        mean_res = 0
-        max_res = 0
-        if DISPATCH_TO_STORAGE[time_idx] > 0:  # push on stack
-            lifo_stack.append([time_idx,DISPATCH_TO_STORAGE[time_idx % num_time_periods]*STORAGE_CHARGING_EFFICIENCY ])
-        if DISPATCH_FROM_STORAGE[time_idx] > 0:
-            dispatch_remaining = DISPATCH_FROM_STORAGE[time_idx % num_time_periods]
-            accum_time = 0
-            while dispatch_remaining > 0:
-                if lifo_stack != []:
-                    top_of_stack = lifo_stack.pop()
-                    if top_of_stack[1] > dispatch_remaining:
-                        # partial removal
-                        accum_time = accum_time + dispatch_remaining * (time_idx - top_of_stack[0])
-                        new_top = np.copy(top_of_stack)
-                        new_top[1] = new_top[1] - dispatch_remaining
-                        lifo_stack.append(new_top) # put back the remaining power at the old time
-                        dispatch_remaining = 0
-                    else: 
-                        # full removal of top of stack
-                        accum_time = accum_time + top_of_stack[1] * (time_idx - top_of_stack[0])
-                        dispatch_remaining = dispatch_remaining - top_of_stack[1]
-                else:
-                    dispatch_remaining = 0 # stop while loop if stack is empty
-            mean_res = accum_time / DISPATCH_FROM_STORAGE[time_idx % num_time_periods]
-            max_res = time_idx - top_of_stack[0]
-            # maximum headroom needed is the max of the storage between time_idx and top_of_stack[0]
-            #    minus the amount of storage at time time_idx + 1
-            energy_vec = np.concatenate([ENERGY_STORAGE,ENERGY_STORAGE,ENERGY_STORAGE])
-            max_head = np.max(energy_vec[int(top_of_stack[0]+num_time_periods):int(time_idx + 1+num_time_periods)]) - energy_vec[int(time_idx + 1 + num_time_periods)]   # dl-->could be negative?
-        max_headroom[time_idx % num_time_periods] = max_head
-        mean_residence_time[time_idx % num_time_periods] = mean_res
-        max_residence_time[time_idx % num_time_periods] = max_res
-    return max_headroom,mean_residence_time,max_residence_time
-    
+#%%
+# Cost attribution for a batch of solved cases, for use in a worker pool while
+# the solver works on the next cases. The cases of the batch go through the
+# batched calculation together. Returns, for each case, a dictionary of the
+# items added to its result by cost_and_storage_calculation.
+
+def cost_and_storage_calculation_batch( global_dic, case_dic_list, result_list ):
+    cost_result_list = [result.copy() for result in result_list]
+    cost_and_storage_calculation( global_dic, case_dic_list, cost_result_list )
+    return [dict( (key, cost_result[key]) for key in cost_result.keys() if key not in result )
+            for result, cost_result in zip(result_list, cost_result_list)]
+
+# Cost attribution for one case; see cost_and_storage_calculation_batch
+
+def cost_and_storage_calculation_case( global_dic, case_dic, result ):
+    return cost_and_storage_calculation_batch( global_dic, [case_dic], [result] )[0]
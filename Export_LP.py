@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+'''
+
+File name: Export_LP.py
+
+Simple Energy Model Ver 1
+
+Write the linear program of each case to a file in a standard format, so that
+solvers and solver settings can be benchmarked on real problem instances
+without preprocessing the input and building the problem in cvxpy each time.
+
+    export_case_lp()  writes the LP of one case as an MPS (free format) or
+                      CPLEX LP file, with a JSON file of case metadata next
+                      to it; used by core_model_loop when EXPORT_LP is set
+    replay_lp()       solves exported files with the command line solvers
+                      that are installed and records the solve times
+
+The LP is the problem as cvxpy passes it to the solver: variables are free,
+equality rows are the A x = b constraints and less-than rows the G x <= h
+constraints. The objective is in scaled units; the system cost is
+(objective + objective_offset) / objective_scaling from the metadata file.
+
+'''
+
+# -----------------------------------------------------------------------------
+
+import datetime
+import json
+import os
+import subprocess
+import time
+from distutils.spawn import find_executable
+import numpy as np
+import scipy.sparse as sparse
+from Core_Model import core_model, numerics_scaling
+
+# Command line for each solver; {model} is the LP file and {solution} the file
+# name (without extension) for the solution.
+solver_command_dic = {
+        'GUROBI':['gurobi_cl', 'ResultFile={solution}.sol', '{model}'],
+        'CBC':['cbc', '{model}', 'solve', 'solution', '{solution}.txt'],
+        'GLPK':['glpsol', '{glpk_format}', '{model}', '-o', '{solution}.txt'],
+        'HIGHS':['highs', '--model_file', '{model}', '--solution_file', '{solution}.txt'],
+        }
+
+# -----------------------------------------------------------------------------
+
+# constraint matrix, right hand side and row types of the problem data
+def lp_matrix(problem_data):
+    matrix_list = []
+    rhs_list = []
+    row_type_list = []
+    for matrix_key, rhs_key, row_type in [['A','b','E'], ['G','h','L']]:
+        if problem_data.get(matrix_key) is not None and problem_data[matrix_key].shape[0] > 0:
+            matrix_list.append(sparse.csr_matrix(problem_data[matrix_key]))
+            rhs_list.append(np.array(problem_data[rhs_key], dtype = float).flatten())
+            row_type_list += [row_type] * problem_data[matrix_key].shape[0]
+    return sparse.vstack(matrix_list).tocsc(), np.concatenate(rhs_list), row_type_list
+
+def write_mps(file_name, model_name, objective, matrix, rhs, row_type_list):
+
+    num_rows, num_columns = matrix.shape
+    line_list = ['NAME ' + model_name, 'ROWS', ' N obj']
+    for row_index in range(num_rows):
+        line_list.append(' {} r{}'.format(row_type_list[row_index], row_index))
+
+    line_list.append('COLUMNS')
+    for column_index in range(num_columns):
+        if objective[column_index] != 0:
+            line_list.append(' x{} obj {:.17g}'.format(column_index, objective[column_index]))
+        for k in range(matrix.indptr[column_index], matrix.indptr[column_index + 1]):
+            line_list.append(' x{} r{} {:.17g}'.format(column_index, matrix.indices[k], matrix.data[k]))
+
+    line_list.append('RHS')
+    for row_index in np.nonzero(rhs)[0]:
+        line_list.append(' rhs r{} {:.17g}'.format(row_index, rhs[row_index]))
+
+    line_list.append('BOUNDS')
+    for column_index in range(num_columns):
+        line_list.append(' FR bnd x{}'.format(column_index))
+    line_list.append('ENDATA')
+
+    with open(file_name, 'w') as output_file:
+        output_file.write('\n'.join(line_list) + '\n')
+
+# a linear expression in LP format, a few terms per line
+def lp_expression(coefficient_list, index_list):
+    term_list = ['{} {:.17g} x{}'.format('-' if value < 0 else '+', abs(value), index)
+                 for value, index in zip(coefficient_list, index_list)]
+    if len(term_list) == 0:
+        term_list = ['+ 0 x0']
+    return '\n   '.join(' '.join(term_list[i:i+8]) for i in range(0, len(term_list), 8))
+
+def write_lp(file_name, model_name, objective, matrix, rhs, row_type_list):
+
+    num_rows, num_columns = matrix.shape
+    matrix = matrix.tocsr()
+    sense_dic = {'E':'=', 'L':'<='}
+    nonzero_columns = np.nonzero(objective)[0]
+    line_list = ['\\ ' + model_name, 'Minimize',
+                 ' obj: ' + lp_expression(objective[nonzero_columns], nonzero_columns),
+                 'Subject To']
+    for row_index in range(num_rows):
+        row_slice = slice(matrix.indptr[row_index], matrix.indptr[row_index + 1])
+        line_list.append(' r{}: {} {} {:.17g}'.format(
+                row_index, lp_expression(matrix.data[row_slice], matrix.indices[row_slice]),
+                sense_dic[row_type_list[row_index]], rhs[row_index]))
+
+    line_list.append('Bounds')
+    for column_index in range(num_columns):
+        line_list.append(' x{} free'.format(column_index))
+    line_list.append('End')
+
+    with open(file_name, 'w') as output_file:
+        output_file.write('\n'.join(line_list) + '\n')
+
+# -----------------------------------------------------------------------------
+
+def export_case_lp(global_dic, case_dic, file_format = 'MPS'):
+
+    verbose = global_dic['VERBOSE']
+    file_format = file_format.upper()
+    case_name = case_dic['CASE_NAME']
+
+    export_folder = global_dic['OUTPUT_PATH'] + '/' + global_dic['GLOBAL_NAME'] + '/lp'
+    if not os.path.exists(export_folder):
+        os.makedirs(export_folder)
+    file_name = export_folder + '/' + case_name + '.' + file_format.lower()
+
+    start_time = time.time()
+    prob = core_model(global_dic, case_dic, solve = False)
+    problem_data = prob.get_problem_data('GUROBI')
+    build_time = time.time() - start_time
+
+    objective = np.array(problem_data['c'], dtype = float).flatten()
+    matrix, rhs, row_type_list = lp_matrix(problem_data)
+    if file_format == 'LP':
+        write_lp(file_name, case_name, objective, matrix, rhs, row_type_list)
+    else:
+        write_mps(file_name, case_name, objective, matrix, rhs, row_type_list)
+
+    numerics_cost_scaling, numerics_demand_scaling = numerics_scaling(global_dic, case_dic)
+    metadata = {
+            'CASE_NAME':case_name,
+            'CASE_INDEX':case_dic.get('CASE_INDEX'),
+            'GLOBAL_NAME':global_dic['GLOBAL_NAME'],
+            'FILE_FORMAT':file_format,
+            'SYSTEM_COMPONENTS':list(case_dic['SYSTEM_COMPONENTS']),
+            'NUM_TIME_PERIODS':len(case_dic['DEMAND_SERIES']),
+            'NUM_ROWS':matrix.shape[0],
+            'NUM_COLUMNS':matrix.shape[1],
+            'NUM_NONZEROS':matrix.nnz,
+            'NUMERICS_COST_SCALING':numerics_cost_scaling,
+            'NUMERICS_DEMAND_SCALING':numerics_demand_scaling,
+            'OBJECTIVE_OFFSET':float(np.array(problem_data.get('offset', 0.)).flatten()[0]),
+            'OBJECTIVE_SCALING':numerics_cost_scaling * numerics_demand_scaling,
+            'PRESOLVE':global_dic.get('PRESOLVE', True),
+            'BUILD_TIME':build_time,
+            'CREATED':str(datetime.datetime.now())
+            }
+    with open(file_name + '.json', 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent = 1, sort_keys = True)
+
+    if verbose:
+        print 'Export_LP.py: file written: ' + file_name
+
+    return file_name
+
+# -----------------------------------------------------------------------------
+
+def replay_lp(model_file_list, solver_list = None, output_file_name = 'replay_timings.csv',
+              num_repeats = 1, solver_option_list = None):
+
+    # model_file_list -- MPS or LP files written by export_case_lp
+    # solver_list -- keys of solver_command_dic; all installed solvers by default
+    # solver_option_list -- extra arguments passed to every solver command
+
+    if solver_list is None:
+        solver_list = sorted(solver_command_dic.keys())
+    if solver_option_list is None:
+        solver_option_list = []
+    available_solver_list = []
+    for solver in solver_list:
+        solver = solver.upper()
+        if solver in solver_command_dic and find_executable(solver_command_dic[solver][0]) is not None:
+            available_solver_list.append(solver)
+        else:
+            print 'Export_LP.py: solver ' + solver + ' not found, skipped'
+
+    row_list = []
+    for model_file_name in model_file_list:
+        case_name = os.path.splitext(os.path.basename(model_file_name))[0]
+        if os.path.exists(model_file_name + '.json'):
+            with open(model_file_name + '.json') as metadata_file:
+                case_name = json.load(metadata_file)['CASE_NAME']
+        glpk_format = '--cpxlp' if model_file_name.lower().endswith('.lp') else '--freemps'
+
+        for solver in available_solver_list:
+            solution_file_name = os.path.splitext(model_file_name)[0] + '_' + solver.lower()
+            command = [item.format(model = model_file_name, solution = solution_file_name, glpk_format = glpk_format)
+                       for item in solver_command_dic[solver]] + list(solver_option_list)
+            for repeat in range(num_repeats):
+                start_time = time.time()
+                with open(solution_file_name + '.log', 'w') as log_file:
+                    status = subprocess.call(command, stdout = log_file, stderr = subprocess.STDOUT)
+                solve_time = time.time() - start_time
+                row_list.append([model_file_name, case_name, solver, repeat, solve_time, status])
+                print 'Export_LP.py: {} {} {:.2f} s (status {})'.format(case_name, solver, solve_time, status)
+
+    with open(output_file_name, 'w') as output_file:
+        output_file.write('model file,case name,solver,repeat,solve time (s),exit status\n')
+        for row in row_list:
+            output_file.write('{},{},{},{},{:.4f},{}\n'.format(*row))
+
+    return row_list
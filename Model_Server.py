@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+'''
+
+File name: Model_Server.py
+
+Simple Energy Model Ver 1
+
+A local HTTP server that answers what-if questions about the cases of one case
+input file, without a full batch run per question.
+
+The case input file and all time series are read once when the server starts.
+The problem cache (Problem_Cache.py) is switched on, so the constraint matrices
+of each case structure are built once and kept in memory (the
+PROBLEM_CACHE_MEMORY most recently used). A question that only changes costs
+goes straight to the solver. Matrices built for overridden series, components
+or storage parameters are not written to the problem cache on disk.
+
+    GET  /cases   names of the cases, with their scalar keywords
+    POST /solve   solve a case with overrides, e.g.
+                  {"case": "case_1",
+                   "overrides": {"FIXED_COST_SOLAR": 0.01, "SYSTEM_COMPONENTS": ["SOLAR","STORAGE"]},
+                   "series": ["DISPATCH_SOLAR", "PRICE_ELECTRICITY"]}
+                  "case" is the first case by default; "series" is false by
+                  default, true for all time series results, or a list of keys.
+                  Returns {"case": ..., "solve_time": ..., "scalars": {...},
+                  "series": {...}}.
+
+Requests are answered one at a time, on localhost only by default. Nothing is
+written to the output folder.
+
+'''
+
+# -----------------------------------------------------------------------------
+
+import BaseHTTPServer
+import copy
+import json
+import time
+import numpy as np
+from Preprocess_Input import preprocess_input
+
+# -----------------------------------------------------------------------------
+
+# json value of a result or case entry
+def json_value(value):
+    if isinstance(value, np.ndarray):
+        return [json_value(x) for x in value.tolist()]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None # json has no nan or inf
+    return value
+
+def is_scalar(value):
+    return np.ndim(value) == 0
+
+# overrides that change the constraint matrices of a case; the matrices built
+# for them are kept in memory only, not written to the problem cache on disk
+structure_override_list = [
+        'SYSTEM_COMPONENTS','DEMAND_SERIES','SOLAR_SERIES','WIND_SERIES',
+        'STORAGE_CHARGING_EFFICIENCY','STORAGE_CHARGING_TIME','STORAGE_DECAY_RATE',
+        'PGP_STORAGE_CHARGING_EFFICIENCY'
+        ]
+
+# case with the overrides applied; raises ValueError for an unknown keyword,
+# or for a component added to SYSTEM_COMPONENTS that is unknown or has a
+# cost keyword < 0 (no cost given in the case input file)
+def apply_overrides(case_dic, override_dic):
+    from Core_Model import objective_cost_key_list, cost_component
+    base_components = case_dic['SYSTEM_COMPONENTS']
+    case_dic = copy.copy(case_dic)
+    for key, value in override_dic.items():
+        key = str(key).upper()
+        if key == 'SYSTEM_COMPONENTS':
+            case_dic[key] = [str(x).upper() for x in value]
+        elif key in ['DEMAND_SERIES','SOLAR_SERIES','WIND_SERIES']:
+            if len(value) != len(case_dic[key]):
+                raise ValueError('{} must have {} values'.format(key, len(case_dic[key])))
+            case_dic[key] = np.array(value, dtype = float)
+        elif key in case_dic and isinstance(case_dic[key], (int, long, float)) and not isinstance(case_dic[key], bool):
+            case_dic[key] = float(value)
+        else:
+            raise ValueError('keyword cannot be overridden: ' + key)
+
+    component_cost_dic = {}
+    for key in objective_cost_key_list:
+        component_cost_dic.setdefault(cost_component(key), []).append(key)
+    for component in case_dic['SYSTEM_COMPONENTS']:
+        if component in base_components:
+            continue
+        if component not in component_cost_dic:
+            raise ValueError('unknown component: ' + component)
+        for key in component_cost_dic[component]:
+            if case_dic[key] < 0:
+                raise ValueError('component {} added without a cost: {} = {}'.format(component, key, case_dic[key]))
+    return case_dic
+
+# -----------------------------------------------------------------------------
+
+class ModelServer(BaseHTTPServer.HTTPServer):
+
+    def __init__(self, address, global_dic, case_dic_list):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ModelRequestHandler)
+        self.global_dic = global_dic
+        self.case_dic_list = case_dic_list
+        self.case_dic_dic = dict((case_dic['CASE_NAME'], case_dic) for case_dic in case_dic_list)
+
+    def solve(self, request_dic):
+
+        # imported here so that the server starts without waiting for cvxpy
+        from Core_Model import core_model
+        from Cost_Model import cost_and_storage_calculation_case
+
+        # malformed requests are rejected before solving (ValueError, answered with 400)
+        if not isinstance(request_dic, dict):
+            raise ValueError('request must be a json object')
+        case_name = request_dic.get('case', self.case_dic_list[0]['CASE_NAME'])
+        if case_name not in self.case_dic_dic:
+            raise ValueError('unknown case: ' + str(case_name))
+        override_dic = request_dic.get('overrides', {})
+        if not isinstance(override_dic, dict):
+            raise ValueError('overrides must be a json object')
+        series_keys = request_dic.get('series', False)
+        if not isinstance(series_keys, (bool, list)):
+            raise ValueError('series must be true, false or a list of result keys')
+        case_dic = apply_overrides(self.case_dic_dic[case_name], override_dic)
+        global_dic = self.global_dic
+        if any(str(key).upper() in structure_override_list for key in override_dic):
+            global_dic = dict(global_dic, PROBLEM_CACHE_PERSIST = False)
+
+        start_time = time.time()
+        result = core_model(global_dic, case_dic)
+        if request_dic.get('cost_model', False):
+            result.update(cost_and_storage_calculation_case(global_dic, case_dic, result))
+        solve_time = time.time() - start_time
+
+        if series_keys is True:
+            series_keys = [key for key in result.keys() if not is_scalar(result[key])]
+        elif series_keys is False:
+            series_keys = []
+        return {
+                'case':case_name,
+                'solve_time':solve_time,
+                'scalars':dict((key, json_value(value)) for key, value in result.items() if is_scalar(value)),
+                'series':dict((key, json_value(np.array(result[key]))) for key in series_keys if key in result)
+                }
+
+class ModelRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def send_json(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/cases':
+            self.send_json(200, [
+                    {'case':case_dic['CASE_NAME'],
+                     'keywords':dict((key, json_value(value)) for key, value in case_dic.items()
+                                     if is_scalar(value) or key == 'SYSTEM_COMPONENTS')}
+                    for case_dic in self.server.case_dic_list
+                    ])
+        else:
+            self.send_json(404, {'error':'unknown path ' + self.path})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/solve':
+            self.send_json(404, {'error':'unknown path ' + self.path})
+            return
+        try:
+            request_dic = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))) or '{}')
+            response = self.server.solve(request_dic)
+        except (ValueError, TypeError) as error:
+            self.send_json(400, {'error':str(error)})
+            return
+        except Exception as error:
+            # e.g. a solver failure; the server keeps answering requests
+            self.send_json(500, {'error':'{}: {}'.format(type(error).__name__, error)})
+            return
+        self.send_json(200, response)
+
+# -----------------------------------------------------------------------------
+
+def serve_model(case_input_path_filename, host = '127.0.0.1', port = 8765):
+
+    global_dic, case_dic_list = preprocess_input(case_input_path_filename)
+    global_dic['PROBLEM_CACHE'] = True # keep the constraint matrices of each case structure in memory
+    server = ModelServer((host, port), global_dic, case_dic_list)
+    print 'Model_Server.py: serving {} cases on http://{}:{}'.format(len(case_dic_list), host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
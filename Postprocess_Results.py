@@ -6,11 +6,13 @@ Created by Lei at 27 March, 2018
 # -----------------------------------------------------------------------------
 
 import os,sys
+import csv
 import pickle
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
 import datetime
+from Supporting_Functions import func_range_max_table, func_range_max_query, func_sweep_grid, func_sweep_slice
 plt.ioff()
 
 #from matplotlib import style
@@ -37,73 +39,13 @@ def unpickle_raw_results(global_dic):
         print 'data unpickled from '+file_path_name
     return global_dic, case_dic_list, result_list 
 
+# <cost_list> is a dictionary of the unique values of every numeric keyword
+# across the cases, and <var_list> is the list of keywords that vary (one per
+# sweep dimension; see func_sweep_grid in Supporting_Functions.py).
 def get_dimension_info(case_dic_list):
-    FIXED_COST_NATGAS = []
-    FIXED_COST_SOLAR = []
-    FIXED_COST_WIND = []
-    FIXED_COST_NUCLEAR = []
-    FIXED_COST_STORAGE = []
-    
-    VAR_COST_NATGAS = []
-    VAR_COST_SOLAR = []
-    VAR_COST_WIND = []
-    VAR_COST_NUCLEAR = []
-    STORAGE_DECAY_RATE = []
-    
-    STORAGE_CHARGING_TIME = []
-    
-    num_scenarios = len(case_dic_list)
-    for idx in range(num_scenarios):
-        FIXED_COST_NATGAS  = np.r_[FIXED_COST_NATGAS,  case_dic_list[idx]['FIXED_COST_NATGAS']]
-        FIXED_COST_SOLAR   = np.r_[FIXED_COST_SOLAR,   case_dic_list[idx]['FIXED_COST_SOLAR']]
-        FIXED_COST_WIND    = np.r_[FIXED_COST_WIND,    case_dic_list[idx]['FIXED_COST_WIND']]
-        FIXED_COST_NUCLEAR = np.r_[FIXED_COST_NUCLEAR, case_dic_list[idx]['FIXED_COST_NUCLEAR']]
-        FIXED_COST_STORAGE = np.r_[FIXED_COST_STORAGE, case_dic_list[idx]['FIXED_COST_STORAGE']]
-    
-        VAR_COST_NATGAS  = np.r_[VAR_COST_NATGAS,  case_dic_list[idx]['VAR_COST_NATGAS']]
-        VAR_COST_SOLAR   = np.r_[VAR_COST_SOLAR,   case_dic_list[idx]['VAR_COST_SOLAR']]
-        VAR_COST_WIND    = np.r_[VAR_COST_WIND,    case_dic_list[idx]['VAR_COST_WIND']]
-        VAR_COST_NUCLEAR = np.r_[VAR_COST_NUCLEAR, case_dic_list[idx]['VAR_COST_NUCLEAR']]
-        STORAGE_DECAY_RATE = np.r_[STORAGE_DECAY_RATE, case_dic_list[idx]['STORAGE_DECAY_RATE']]
-        
-        STORAGE_CHARGING_TIME = np.r_[STORAGE_CHARGING_TIME, case_dic_list[idx]['STORAGE_CHARGING_TIME']]
-        
-    FIXED_COST_NATGAS_list  = np.unique(FIXED_COST_NATGAS)
-    FIXED_COST_SOLAR_list   = np.unique(FIXED_COST_SOLAR)
-    FIXED_COST_WIND_list    = np.unique(FIXED_COST_WIND)
-    FIXED_COST_NUCLEAR_list = np.unique(FIXED_COST_NUCLEAR)
-    FIXED_COST_STORAGE_list = np.unique(FIXED_COST_STORAGE)
-    
-    VAR_COST_NATGAS_list  = np.unique(VAR_COST_NATGAS)
-    VAR_COST_SOLAR_list   = np.unique(VAR_COST_SOLAR)
-    VAR_COST_WIND_list    = np.unique(VAR_COST_WIND)
-    VAR_COST_NUCLEAR_list = np.unique(VAR_COST_NUCLEAR)
-    STORAGE_DECAY_RATE_list = np.unique(STORAGE_DECAY_RATE)
-    
-    STORAGE_CHARGING_TIME_list = np.unique(STORAGE_CHARGING_TIME)
-    
-    cost_list = {'FIXED_COST_NATGAS':FIXED_COST_NATGAS_list,
-                 'FIXED_COST_SOLAR':FIXED_COST_SOLAR_list,
-                 'FIXED_COST_WIND':FIXED_COST_WIND_list,
-                 'FIXED_COST_NUCLEAR':FIXED_COST_NUCLEAR_list,
-                 'FIXED_COST_STORAGE':FIXED_COST_STORAGE_list,
-                 'VAR_COST_NATGAS':VAR_COST_NATGAS_list,
-                 'VAR_COST_SOLAR':VAR_COST_SOLAR_list,
-                 'VAR_COST_WIND':VAR_COST_WIND_list,
-                 'VAR_COST_NUCLEAR':VAR_COST_NUCLEAR_list,
-                 'STORAGE_DECAY_RATE':STORAGE_DECAY_RATE_list,
-                 'STORAGE_CHARGING_TIME':STORAGE_CHARGING_TIME_list}
-    var_list = ['FIXED_COST_NATGAS',
-                'FIXED_COST_SOLAR',
-                'FIXED_COST_WIND',
-                'FIXED_COST_NUCLEAR',
-                'FIXED_COST_STORAGE',
-                'VAR_COST_NATGAS',
-                'VAR_COST_SOLAR',
-                'VAR_COST_WIND',
-                'VAR_COST_NUCLEAR',
-                'STORAGE_DECAY_RATE',
-                'STORAGE_CHARGING_TIME']
+    sweep_grid = func_sweep_grid(case_dic_list)
+    cost_list = sweep_grid['value_list']
+    var_list = sweep_grid['dimension_list']
     
     return cost_list, var_list
 
@@ -146,11 +88,21 @@ def prepare_scalar_variables (global_dic, case_dic_list, result_list ):
         tmp['DISPATCH_TO_STORAGE']    = np.array(np.squeeze(result_list[idx]['DISPATCH_TO_STORAGE']))   #/ num_time_periods
         tmp['DISPATCH_FROM_STORAGE']  = np.array(np.squeeze(result_list[idx]['DISPATCH_FROM_STORAGE'])) #/ num_time_periods
         tmp['DISPATCH_UNMET_DEMAND']  = np.array(np.squeeze(result_list[idx]['DISPATCH_UNMET_DEMAND'])) #/ num_time_periods
-        tmp['DISPATCH_CURTAILMENT']   = np.array(np.squeeze(result_list[idx]['DISPATCH_CURTAILMENT']))  #/ num_time_periods
+        if 'DISPATCH_CURTAILMENT' in result_list[idx]: # not produced by the current Core_Model.py
+            tmp['DISPATCH_CURTAILMENT'] = np.array(np.squeeze(result_list[idx]['DISPATCH_CURTAILMENT']))  #/ num_time_periods
+        else:
+            tmp['DISPATCH_CURTAILMENT'] = np.zeros(len(tmp['DEMAND']))
         tmp['ENERGY_STORAGE']         = np.array(np.squeeze(result_list[idx]['ENERGY_STORAGE']))        #/ num_time_periods
+        tmp['CAPACITY_PGP_STORAGE']      = np.array(np.squeeze(result_list[idx]['FIXED_PGP_STORAGE']))
+        tmp['CAPACITY_TO_PGP_STORAGE']   = np.array(np.squeeze(result_list[idx]['CAPACITY_TO_PGP_STORAGE']))
+        tmp['CAPACITY_FROM_PGP_STORAGE'] = np.array(np.squeeze(result_list[idx]['CAPACITY_FROM_PGP_STORAGE']))
+        tmp['DISPATCH_TO_PGP_STORAGE']   = np.array(np.squeeze(result_list[idx]['DISPATCH_TO_PGP_STORAGE']))   #/ num_time_periods
+        tmp['DISPATCH_FROM_PGP_STORAGE'] = np.array(np.squeeze(result_list[idx]['DISPATCH_FROM_PGP_STORAGE'])) #/ num_time_periods
+        tmp['ENERGY_PGP_STORAGE']        = np.array(np.squeeze(result_list[idx]['ENERGY_PGP_STORAGE']))        #/ num_time_periods
         tmp['SYSTEM_COST']    = np.array(np.squeeze(result_list[idx]['SYSTEM_COST']))  
         tmp['STORAGE_CHARGING_EFFICIENCY']    = np.array(np.squeeze(case_dic_list[idx]['STORAGE_CHARGING_EFFICIENCY']))
         tmp['STORAGE_CHARGING_TIME']    = np.array(np.squeeze(case_dic_list[idx]['STORAGE_CHARGING_TIME']))
+        tmp['PGP_STORAGE_CHARGING_EFFICIENCY'] = np.array(np.squeeze(case_dic_list[idx]['PGP_STORAGE_CHARGING_EFFICIENCY']))
         tmp['CASE_NAME'] = np.array(np.squeeze(case_dic_list[idx]['CASE_NAME']))
 
         res[idx] = tmp
@@ -271,42 +223,43 @@ def plot_stack_multi1(case1,case2,case3,case4, case_name):
     plt.close(fig)
 
 def stack_plot1(
-        res,
-        num_case,
+        context,
         case_name,
         multipanel,
         var_dimension_list):
     
     # --- get Raw Data ---
+    res = context['res']
+    num_case = context['num_case']
     num_time_periods = len(res[0]['DEMAND'])
 
-    solar_series      = get_multicases_results(res, num_case , 'SOLAR_CAPACITY')   / num_time_periods
-    wind_series       = get_multicases_results(res, num_case , 'WIND_CAPACITY')    / num_time_periods
-    var_dimension = get_multicases_results(res, num_case, var_dimension_list[0])
-    CAPACITY_NATGAS   = get_multicases_results(res, num_case , 'CAPACITY_NATGAS')
-    CAPACITY_SOLAR    = get_multicases_results(res, num_case , 'CAPACITY_SOLAR')
-    CAPACITY_WIND     = get_multicases_results(res, num_case , 'CAPACITY_WIND')
-    CAPACITY_NUCLEAR  = get_multicases_results(res, num_case , 'CAPACITY_NUCLEAR')
-    CAPACITY_STORAGE  = get_multicases_results(res, num_case , 'CAPACITY_STORAGE')    
-    FIXED_COST_NATGAS  = get_multicases_results(res, num_case, 'FIXED_COST_NATGAS')
-    FIXED_COST_SOLAR   = get_multicases_results(res, num_case, 'FIXED_COST_SOLAR')
-    FIXED_COST_WIND    = get_multicases_results(res, num_case, 'FIXED_COST_WIND')
-    FIXED_COST_NUCLEAR = get_multicases_results(res, num_case, 'FIXED_COST_NUCLEAR')
-    FIXED_COST_STORAGE = get_multicases_results(res, num_case, 'FIXED_COST_STORAGE')    
-    VAR_COST_NATGAS  = get_multicases_results(res, num_case, 'VAR_COST_NATGAS')
-    VAR_COST_SOLAR   = get_multicases_results(res, num_case, 'VAR_COST_SOLAR')
-    VAR_COST_WIND    = get_multicases_results(res, num_case, 'VAR_COST_WIND')
-    VAR_COST_NUCLEAR = get_multicases_results(res, num_case, 'VAR_COST_NUCLEAR')
-    STORAGE_DECAY_RATE    = get_multicases_results(res, num_case, 'STORAGE_DECAY_RATE') 
-    VAR_COST_TO_STORAGE   = get_multicases_results(res, num_case, 'VAR_COST_TO_STORAGE') 
-    VAR_COST_FROM_STORAGE = get_multicases_results(res, num_case, 'VAR_COST_FROM_STORAGE')     
-    DISPATCH_NATGAS       = get_multicases_results(res, num_case, 'DISPATCH_NATGAS')        / num_time_periods
-    DISPATCH_SOLAR        = get_multicases_results(res, num_case, 'DISPATCH_SOLAR')         / num_time_periods
-    DISPATCH_WIND         = get_multicases_results(res, num_case, 'DISPATCH_WIND')          / num_time_periods
-    DISPATCH_NUCLEAR      = get_multicases_results(res, num_case, 'DISPATCH_NUCLEAR')       / num_time_periods
-    DISPATCH_TO_STORAGE   = get_multicases_results(res, num_case, 'DISPATCH_TO_STORAGE')    / num_time_periods
-    DISPATCH_FROM_STORAGE = get_multicases_results(res, num_case, 'DISPATCH_FROM_STORAGE')  / num_time_periods
-    ENERGY_STORAGE        = get_multicases_results(res, num_case, 'ENERGY_STORAGE')         / num_time_periods
+    solar_series      = context_results(context, 'SOLAR_CAPACITY')   / num_time_periods
+    wind_series       = context_results(context, 'WIND_CAPACITY')    / num_time_periods
+    var_dimension = context_results(context, var_dimension_list[0])
+    CAPACITY_NATGAS   = context_results(context, 'CAPACITY_NATGAS')
+    CAPACITY_SOLAR    = context_results(context, 'CAPACITY_SOLAR')
+    CAPACITY_WIND     = context_results(context, 'CAPACITY_WIND')
+    CAPACITY_NUCLEAR  = context_results(context, 'CAPACITY_NUCLEAR')
+    CAPACITY_STORAGE  = context_results(context, 'CAPACITY_STORAGE')    
+    FIXED_COST_NATGAS  = context_results(context, 'FIXED_COST_NATGAS')
+    FIXED_COST_SOLAR   = context_results(context, 'FIXED_COST_SOLAR')
+    FIXED_COST_WIND    = context_results(context, 'FIXED_COST_WIND')
+    FIXED_COST_NUCLEAR = context_results(context, 'FIXED_COST_NUCLEAR')
+    FIXED_COST_STORAGE = context_results(context, 'FIXED_COST_STORAGE')    
+    VAR_COST_NATGAS  = context_results(context, 'VAR_COST_NATGAS')
+    VAR_COST_SOLAR   = context_results(context, 'VAR_COST_SOLAR')
+    VAR_COST_WIND    = context_results(context, 'VAR_COST_WIND')
+    VAR_COST_NUCLEAR = context_results(context, 'VAR_COST_NUCLEAR')
+    STORAGE_DECAY_RATE    = context_results(context, 'STORAGE_DECAY_RATE') 
+    VAR_COST_TO_STORAGE   = context_results(context, 'VAR_COST_TO_STORAGE') 
+    VAR_COST_FROM_STORAGE = context_results(context, 'VAR_COST_FROM_STORAGE')     
+    DISPATCH_NATGAS       = context_results(context, 'DISPATCH_NATGAS')        / num_time_periods
+    DISPATCH_SOLAR        = context_results(context, 'DISPATCH_SOLAR')         / num_time_periods
+    DISPATCH_WIND         = context_results(context, 'DISPATCH_WIND')          / num_time_periods
+    DISPATCH_NUCLEAR      = context_results(context, 'DISPATCH_NUCLEAR')       / num_time_periods
+    DISPATCH_TO_STORAGE   = context_results(context, 'DISPATCH_TO_STORAGE')    / num_time_periods
+    DISPATCH_FROM_STORAGE = context_results(context, 'DISPATCH_FROM_STORAGE')  / num_time_periods
+    ENERGY_STORAGE        = context_results(context, 'ENERGY_STORAGE')         / num_time_periods
 
     # --- global setting ---
     order_list = FIXED_COST_NUCLEAR.argsort()  
@@ -481,37 +434,18 @@ def plot_stack_multi2(case1,case2,case3, case_name):
     return fig
     plt.close(fig)
     
+# time series pages for case <case_idx> of the analysis context
 def stack_plot2(
-        res,
-        num_case,
+        context,
         case_name,
         multipanel,
         var_dimension_list,
-        *select_case):
+        case_idx = 0):
     
     # --- data preparation ---
-    num_time_periods = len(res[0]['DEMAND'])
-    
-    find_case_idx = False
-    if select_case:
-        var1 = get_multicases_results(res, num_case , select_case[0][0])
-        var2 = get_multicases_results(res, num_case , select_case[0][1])
-        print num_case
-        for idx in range(num_case):
-            if var1[idx] == select_case[1][0] and var2[idx] == select_case[1][1]:
-                find_case_idx = True
-                case_idx = idx
-                break
-        if find_case_idx: 
-            print 'Find case index:', case_idx
-        else:
-            print 'Error: no such case, exit'
-            sys.exit(0)
-        
-    if find_case_idx == False:
-        case_idx = 0
+    num_time_periods = len(context['res'][case_idx]['DEMAND'])
     
-    CAPACITY_NATGAS   = get_multicases_results(res, num_case , 'CAPACITY_NATGAS')[case_idx]
+    CAPACITY_NATGAS   = context_results(context, 'CAPACITY_NATGAS')[case_idx]
     how_many_case = int(CAPACITY_NATGAS.size)
     if how_many_case > 1:
         print "too many case for time path plot"
@@ -521,39 +455,39 @@ def stack_plot2(
     week1start = 1
     week2start = 183*24
     
-    CASE_NAME = get_multicases_results(res, num_case , 'CASE_NAME')[case_idx]
-    CAPACITY_SOLAR    = get_multicases_results(res, num_case , 'CAPACITY_SOLAR')[case_idx]
-    CAPACITY_WIND     = get_multicases_results(res, num_case , 'CAPACITY_WIND')[case_idx]
-    CAPACITY_NUCLEAR  = get_multicases_results(res, num_case , 'CAPACITY_NUCLEAR')[case_idx]
-    demand_yr = get_multicases_results(res, num_case , 'DEMAND'   ,1,num_time_periods,24,1)[case_idx]
-    demand_week1 = get_multicases_results(res, num_case , 'DEMAND'   ,week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]
-    demand_week2 = get_multicases_results(res, num_case , 'DEMAND'   ,week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]  
-    
-    solar_series_yr = get_multicases_results(res, num_case , 'SOLAR_CAPACITY'   ,1,num_time_periods,24,1)[case_idx]
-    solar_series_week1 = get_multicases_results(res, num_case , 'SOLAR_CAPACITY' ,week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]
-    solar_series_week2 = get_multicases_results(res, num_case , 'SOLAR_CAPACITY' ,week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]
-    
-    wind_series_yr  = get_multicases_results(res, num_case , 'WIND_CAPACITY'   ,1,num_time_periods,24,1)[case_idx]
-    wind_series_week1  = get_multicases_results(res, num_case , 'WIND_CAPACITY' ,week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]
-    wind_series_week2  = get_multicases_results(res, num_case , 'WIND_CAPACITY' ,week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]
-    
-    DISPATCH_NATGAS_yr  = get_multicases_results(res, num_case,      'DISPATCH_NATGAS',      1,num_time_periods,24,1)[case_idx]
-    DISPATCH_SOLAR_yr   = get_multicases_results(res, num_case,      'DISPATCH_SOLAR',       1,num_time_periods,24,1)[case_idx]     
-    DISPATCH_WIND_yr    = get_multicases_results(res, num_case,      'DISPATCH_WIND',        1,num_time_periods,24,1)[case_idx]          
-    DISPATCH_NUCLEAR_yr = get_multicases_results(res, num_case,      'DISPATCH_NUCLEAR',     1,num_time_periods,24,1)[case_idx]  
-    DISPATCH_FROM_STORAGE_yr = get_multicases_results(res, num_case, 'DISPATCH_FROM_STORAGE',1,num_time_periods,24,1)[case_idx]
+    CASE_NAME = context_results(context, 'CASE_NAME')[case_idx]
+    CAPACITY_SOLAR    = context_results(context, 'CAPACITY_SOLAR')[case_idx]
+    CAPACITY_WIND     = context_results(context, 'CAPACITY_WIND')[case_idx]
+    CAPACITY_NUCLEAR  = context_results(context, 'CAPACITY_NUCLEAR')[case_idx]
+    demand_yr = context_results(context, 'DEMAND'   ,1,num_time_periods,24,1)[case_idx]
+    demand_week1 = context_results(context, 'DEMAND'   ,week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]
+    demand_week2 = context_results(context, 'DEMAND'   ,week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]  
+    
+    solar_series_yr = context_results(context, 'SOLAR_CAPACITY'   ,1,num_time_periods,24,1)[case_idx]
+    solar_series_week1 = context_results(context, 'SOLAR_CAPACITY' ,week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]
+    solar_series_week2 = context_results(context, 'SOLAR_CAPACITY' ,week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]
+    
+    wind_series_yr  = context_results(context, 'WIND_CAPACITY'   ,1,num_time_periods,24,1)[case_idx]
+    wind_series_week1  = context_results(context, 'WIND_CAPACITY' ,week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]
+    wind_series_week2  = context_results(context, 'WIND_CAPACITY' ,week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]
+    
+    DISPATCH_NATGAS_yr  = context_results(context, 'DISPATCH_NATGAS',      1,num_time_periods,24,1)[case_idx]
+    DISPATCH_SOLAR_yr   = context_results(context, 'DISPATCH_SOLAR',       1,num_time_periods,24,1)[case_idx]     
+    DISPATCH_WIND_yr    = context_results(context, 'DISPATCH_WIND',        1,num_time_periods,24,1)[case_idx]          
+    DISPATCH_NUCLEAR_yr = context_results(context, 'DISPATCH_NUCLEAR',     1,num_time_periods,24,1)[case_idx]  
+    DISPATCH_FROM_STORAGE_yr = context_results(context, 'DISPATCH_FROM_STORAGE',1,num_time_periods,24,1)[case_idx]
 
-    DISPATCH_NATGAS_week1  = get_multicases_results(res, num_case,      'DISPATCH_NATGAS',      week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]     
-    DISPATCH_SOLAR_week1   = get_multicases_results(res, num_case,      'DISPATCH_SOLAR',       week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]     
-    DISPATCH_WIND_week1    = get_multicases_results(res, num_case,      'DISPATCH_WIND',        week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]          
-    DISPATCH_NUCLEAR_week1 = get_multicases_results(res, num_case,      'DISPATCH_NUCLEAR',     week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]  
-    DISPATCH_FROM_STORAGE_week1 = get_multicases_results(res, num_case, 'DISPATCH_FROM_STORAGE',week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]    
+    DISPATCH_NATGAS_week1  = context_results(context, 'DISPATCH_NATGAS',      week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]     
+    DISPATCH_SOLAR_week1   = context_results(context, 'DISPATCH_SOLAR',       week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]     
+    DISPATCH_WIND_week1    = context_results(context, 'DISPATCH_WIND',        week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]          
+    DISPATCH_NUCLEAR_week1 = context_results(context, 'DISPATCH_NUCLEAR',     week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]  
+    DISPATCH_FROM_STORAGE_week1 = context_results(context, 'DISPATCH_FROM_STORAGE',week1start,week1start+num_periods_week-1,num_periods_week,2)[case_idx]    
 
-    DISPATCH_NATGAS_week2  = get_multicases_results(res, num_case,      'DISPATCH_NATGAS',      week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]     
-    DISPATCH_SOLAR_week2   = get_multicases_results(res, num_case,      'DISPATCH_SOLAR',       week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]     
-    DISPATCH_WIND_week2    = get_multicases_results(res, num_case,      'DISPATCH_WIND',        week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]          
-    DISPATCH_NUCLEAR_week2 = get_multicases_results(res, num_case,      'DISPATCH_NUCLEAR',     week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]  
-    DISPATCH_FROM_STORAGE_week2 = get_multicases_results(res, num_case, 'DISPATCH_FROM_STORAGE',week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx] 
+    DISPATCH_NATGAS_week2  = context_results(context, 'DISPATCH_NATGAS',      week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]     
+    DISPATCH_SOLAR_week2   = context_results(context, 'DISPATCH_SOLAR',       week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]     
+    DISPATCH_WIND_week2    = context_results(context, 'DISPATCH_WIND',        week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]          
+    DISPATCH_NUCLEAR_week2 = context_results(context, 'DISPATCH_NUCLEAR',     week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx]  
+    DISPATCH_FROM_STORAGE_week2 = context_results(context, 'DISPATCH_FROM_STORAGE',week2start,week2start+num_periods_week-1,num_periods_week,2)[case_idx] 
 
     curtail_natgas_yr  = CAPACITY_NATGAS                    - DISPATCH_NATGAS_yr
     curtail_solar_yr   = CAPACITY_SOLAR   * solar_series_yr - DISPATCH_SOLAR_yr
@@ -645,7 +579,7 @@ def stack_plot2(
     
 # --------- contour plot
     
-def plot_contour(x,y,z,levels,var_dimension):
+def plot_contour(x,y,z,levels,var_dimension,result_var = 'SYSTEM_COST'):
     fig = plt.figure()
     ax = fig.add_subplot(111)
     
@@ -659,41 +593,42 @@ def plot_contour(x,y,z,levels,var_dimension):
     ax.clabel(cs2, inline=1, fontsize=5)
     
     plt.colorbar(cs1, ticks=levels[::2], orientation='vertical')    
-    ax.set_title('SYSTEM_COST\n($)')
+    ax.set_title(result_var)
     ax.set_xlabel(var_dimension[0])
     ax.set_ylabel(var_dimension[1]) 
     ax.set_xlim(x.max(),x.min())
     return fig
     plt.clf()
 
+# Returns the unique x and y values and z on the (x, y) grid, masked where
+# there is no case. Each case is placed on the grid by the index of its x and
+# y values, in one pass.
 def create_contour_axes(x,y,z):
     
-    def find_zz(x_need, y_need):
-        find_z = 0.
-        tot_idx = len(x)
-        for idx in range(tot_idx):
-            if x[idx] == x_need and y[idx] == y_need:
-                find_z = z[idx]
-        return find_z
-    
-    x_uni = np.unique(x)
-    y_uni = np.unique(y)
+    x_uni, x_idx = np.unique(x, return_inverse=True)
+    y_uni, y_idx = np.unique(y, return_inverse=True)
     z2 = np.ones([ len(x_uni), len(y_uni) ])* (-9999)
-    for idx_x in range( len(x_uni) ):
-        for idx_y in range( len(y_uni) ):
-            x_need = x_uni[idx_x]
-            y_need = y_uni[idx_y]
-            z2[idx_x, idx_y] = find_zz(x_need,y_need)
+    z2[x_idx, y_idx] = z
     z3 = np.ma.masked_values(z2, -9999)
     return x_uni, y_uni, z3
 
-def contour_plot(res,num_case,case_name,var_dimension):
-    dimension1 = get_multicases_results(res, num_case, var_dimension[0])
-    dimension2 = get_multicases_results(res, num_case, var_dimension[1])
-    SYSTEM_COST      = get_multicases_results(res, num_case, 'SYSTEM_COST')
-    x,y,z = create_contour_axes(dimension1, dimension2, SYSTEM_COST)
+# Contour plot of any scalar result (<result_var>) against two sweep dimensions.
+# If <sweep_grid> (from func_sweep_grid) is given, the sweep can have any number
+# of dimensions and the other dimensions are held at <fixed_coordinates>
+# (dimension -> grid index, default is the first value).
+def contour_plot(context,case_name,var_dimension,result_var = 'SYSTEM_COST',sweep_grid = None,fixed_coordinates = None):
+    if fixed_coordinates is None:
+        fixed_coordinates = {}
+    result_values = context_results(context, result_var)
+    if sweep_grid is None:
+        dimension1 = context_results(context, var_dimension[0])
+        dimension2 = context_results(context, var_dimension[1])
+        x,y,z = create_contour_axes(dimension1, dimension2, result_values)
+    else:
+        sweep_slice = func_sweep_slice(sweep_grid, result_values, var_dimension[0], var_dimension[1], fixed_coordinates)
+        x,y,z = sweep_slice['x_values'], sweep_slice['y_values'], sweep_slice['z']
     levels = np.linspace(z.min(), z.max(), 20)   
-    plotz  = plot_contour(x,y,z,levels,var_dimension)
+    plotz  = plot_contour(x,y,z.transpose(),levels,var_dimension,result_var) # contourf wants z as (y, x)
     return plotz
 
 
@@ -765,102 +700,142 @@ def battery_calculation(
         ENERGY_STORAGE,
         STORAGE_CHARGING_EFFICIENCY
         ):
-    start_point = 0.
+    start_point = 0
     for idx in range(num_time_periods):
         if ENERGY_STORAGE[idx] == 0:
             start_point = idx
 
-    lifo_stack = []
-    tmp = 0.
-    
-    for idx in range(num_time_periods-start_point):
-        idx = idx + start_point
-        tmp = tmp + DISPATCH_TO_STORAGE[idx] - DISPATCH_FROM_STORAGE[idx]
-              
+    # The LIFO stack is held in preallocated arrays; there is at most one push
+    # per hour in each of the two passes below.
+    #   stack_time[i] == time the energy was put into storage
+    #   stack_amount[i] == amount of energy still in storage from that time
+    stack_time = np.zeros(2 * num_time_periods + 1, dtype=int)
+    stack_amount = np.zeros(2 * num_time_periods + 1)
+    stack_top = 0 # number of items on the stack
+    
+    for idx in range(start_point, num_time_periods):
         if DISPATCH_TO_STORAGE[idx] > 0:  # push on stack (with time moved up 1 cycle)
-            lifo_stack.append([idx-num_time_periods,DISPATCH_TO_STORAGE[idx]*STORAGE_CHARGING_EFFICIENCY ])
+            stack_time[stack_top] = idx - num_time_periods
+            stack_amount[stack_top] = DISPATCH_TO_STORAGE[idx]*STORAGE_CHARGING_EFFICIENCY
+            stack_top += 1
         if DISPATCH_FROM_STORAGE[idx] > 0:
             dispatch_remaining = DISPATCH_FROM_STORAGE[idx]
-            while dispatch_remaining > 0:
-                #print len(lifo_stack),DISPATCH_FROM_STORAGE[idx],dispatch_remaining
-                if len(lifo_stack) != 0:
-                    top_of_stack = lifo_stack.pop()
-                    if top_of_stack[1] > dispatch_remaining:
-                        # partial removal
-                        new_top = np.copy(top_of_stack)
-                        new_top[1] = new_top[1] - dispatch_remaining
-                        lifo_stack.append(new_top)
-                        dispatch_remaining = 0
-                    else:
-                        dispatch_remaining = dispatch_remaining - top_of_stack[1]
+            while dispatch_remaining > 0 and stack_top > 0: # stop while loop if stack is empty
+                if stack_amount[stack_top - 1] > dispatch_remaining:
+                    # partial removal
+                    stack_amount[stack_top - 1] -= dispatch_remaining
+                    dispatch_remaining = 0
                 else:
-                    dispatch_remaining = 0 # stop while loop if stack is empty
+                    dispatch_remaining = dispatch_remaining - stack_amount[stack_top - 1]
+                    stack_top -= 1
     # Now we have the stack as an initial condition and can do it for real
     max_headroom = np.zeros(num_time_periods)
     mean_residence_time = np.zeros(num_time_periods)
     max_residence_time = np.zeros(num_time_periods)
+    oldest_time = np.zeros(num_time_periods, dtype=int)
     
     for idx in range(num_time_periods):
-        max_head = 0
-        mean_res = 0
-        max_res = 0
         if DISPATCH_TO_STORAGE[idx] > 0:  # push on stack
-            lifo_stack.append([idx,DISPATCH_TO_STORAGE[idx]*STORAGE_CHARGING_EFFICIENCY ])
+            stack_time[stack_top] = idx
+            stack_amount[stack_top] = DISPATCH_TO_STORAGE[idx]*STORAGE_CHARGING_EFFICIENCY
+            stack_top += 1
         if DISPATCH_FROM_STORAGE[idx] > 0:
             dispatch_remaining = DISPATCH_FROM_STORAGE[idx]
             accum_time = 0
-            while dispatch_remaining > 0:
-                if lifo_stack != []:
-                    top_of_stack = lifo_stack.pop()
-                    if top_of_stack[1] > dispatch_remaining:
-                        # partial removal
-                        accum_time = accum_time + dispatch_remaining * (idx - top_of_stack[0])
-                        new_top = np.copy(top_of_stack)
-                        new_top[1] = new_top[1] - dispatch_remaining
-                        lifo_stack.append(new_top) # put back the remaining power at the old time
-                        dispatch_remaining = 0
-                    else: 
-                        # full removal of top of stack
-                        accum_time = accum_time + top_of_stack[1] * (idx - top_of_stack[0])
-                        dispatch_remaining = dispatch_remaining - top_of_stack[1]
-                else:
-                    dispatch_remaining = 0 # stop while loop if stack is empty
-            mean_res = accum_time / DISPATCH_FROM_STORAGE[idx]
-            max_res = idx - top_of_stack[0]
-            # maximum headroom needed is the max of the storage between idx and top_of_stack[0]
-            #    minus the amount of storage at time idx + 1
-            energy_vec = np.concatenate([ENERGY_STORAGE,ENERGY_STORAGE,ENERGY_STORAGE])
-            max_head = np.max(energy_vec[int(top_of_stack[0]+num_time_periods):int(idx + 1+num_time_periods)]) - energy_vec[int(idx + 1 + num_time_periods)]   # dl-->could be negative?
-        max_headroom[idx] = max_head
-        mean_residence_time[idx] = mean_res
-        max_residence_time[idx] = max_res
+            oldest_time[idx] = idx # if the stack is empty, nothing is taken from storage in this hour
+            while dispatch_remaining > 0 and stack_top > 0: # stop while loop if stack is empty
+                oldest_time[idx] = stack_time[stack_top - 1]
+                if stack_amount[stack_top - 1] > dispatch_remaining:
+                    # partial removal, the remaining energy stays at the old time
+                    accum_time = accum_time + dispatch_remaining * (idx - stack_time[stack_top - 1])
+                    stack_amount[stack_top - 1] -= dispatch_remaining
+                    dispatch_remaining = 0
+                else: 
+                    # full removal of top of stack
+                    accum_time = accum_time + stack_amount[stack_top - 1] * (idx - stack_time[stack_top - 1])
+                    dispatch_remaining = dispatch_remaining - stack_amount[stack_top - 1]
+                    stack_top -= 1
+            mean_residence_time[idx] = accum_time / DISPATCH_FROM_STORAGE[idx]
+            max_residence_time[idx] = idx - oldest_time[idx]
+
+    # maximum headroom needed is the max of the storage between idx and the oldest
+    #    energy taken off the stack minus the amount of storage at time idx + 1.
+    #    The range maximum table over the tripled series is built once.
+    discharge_index = np.where(np.array(DISPATCH_FROM_STORAGE[:num_time_periods]) > 0)[0]
+    if len(discharge_index) > 0:
+        energy_vec = np.concatenate([ENERGY_STORAGE,ENERGY_STORAGE,ENERGY_STORAGE])
+        range_max_table = func_range_max_table(energy_vec)
+        max_headroom[discharge_index] = func_range_max_query(
+                range_max_table,
+                oldest_time[discharge_index] + num_time_periods,
+                discharge_index + 1 + num_time_periods
+                ) - energy_vec[discharge_index + 1 + num_time_periods]   # dl-->could be negative?
     return max_headroom,mean_residence_time,max_residence_time
 
 def cycles_per_year(DISPATCH_FROM_STORAGE, max_headroom):
-    hrt = np.transpose(np.array((max_headroom,DISPATCH_FROM_STORAGE)))
-    hrt1 = hrt[hrt[:,0].argsort()]
-    hrt0_unique = np.sort(np.unique(hrt1[:,0])).tolist()
-    output = []
-    for headroom in hrt0_unique:
-        subset = hrt1[hrt1[:,0] == headroom]
-        record = [
-                headroom,
-                np.sum(subset[:,1]), # dispatch
-                0., # margingal increase in headroom
-                0., # cumulative dispatch
-                0., #  increase in headroom / increase in dispatch
-                0. #  increase in dispatch / increase in headroom
-                ]
-        output.append(record)
-    output = np.array(output)
-    output[1:,2]=output[1:,0]-output[:-1,0] # marginal increase in headroom
-    output[:,3] = np.cumsum(output[:,1]) # take cumulative sum 
-    output[1:,4] = output[1:,2]/output[1:,1] # increase in headroom per kWh delivered
-    output[1:,5] = output[1:,1]/output[1:,2] # increase in kWh delivered per increase in headroom
-    
-    headroom_table = output
+    headroom_table = cycles_per_year_batch([DISPATCH_FROM_STORAGE], [max_headroom])[0]
     return headroom_table
 
+# Same as cycles_per_year, but for a list of cases at once. Dispatch for each
+# unique headroom value of each case is summed with a single bincount over
+# (case, headroom rank) keys. Returns a list with one headroom table per case;
+# each table has one row per unique headroom value (in increasing order) with
+# the columns
+#   headroom, dispatch, marginal increase in headroom, cumulative dispatch,
+#   increase in headroom / increase in dispatch, increase in dispatch / increase in headroom
+def cycles_per_year_batch(dispatch_from_storage_list, max_headroom_list):
+    num_case = len(max_headroom_list)
+    case_index = np.concatenate([np.zeros(len(max_headroom_list[idx]), dtype=int) + idx for idx in range(num_case)])
+    headroom = np.concatenate([np.array(item, dtype=float).flatten() for item in max_headroom_list])
+    dispatch = np.concatenate([np.array(item, dtype=float).flatten() for item in dispatch_from_storage_list])
+    
+    unique_headroom, headroom_rank = np.unique(headroom, return_inverse=True)
+    key = case_index * len(unique_headroom) + headroom_rank
+    unique_key, key_inverse = np.unique(key, return_inverse=True) # sorted by case, then by headroom
+    key_case = unique_key // len(unique_headroom)
+    
+    output = np.zeros((len(unique_key), 6))
+    output[:,0] = unique_headroom[unique_key % len(unique_headroom)]
+    output[:,1] = np.bincount(key_inverse, weights=dispatch) # dispatch
+    
+    first_row = np.ones(len(unique_key), dtype=bool) # first row of each case
+    first_row[1:] = key_case[1:] != key_case[:-1]
+    
+    output[1:,2] = output[1:,0] - output[:-1,0] # marginal increase in headroom
+    output[first_row,2] = 0.
+    cum_dispatch = np.cumsum(output[:,1])
+    case_start = np.where(first_row)[0]
+    offset = cum_dispatch[case_start] - output[case_start,1]
+    output[:,3] = cum_dispatch - offset[np.cumsum(first_row) - 1] # take cumulative sum within each case
+    with np.errstate(divide='ignore', invalid='ignore'):
+        output[:,4] = np.where(first_row, 0., output[:,2]/output[:,1]) # increase in headroom per kWh delivered
+        output[:,5] = np.where(first_row, 0., output[:,1]/output[:,2]) # increase in kWh delivered per increase in headroom
+    
+    num_rows = np.bincount(key_case, minlength=num_case)
+    headroom_table_list = np.split(output, np.cumsum(num_rows)[:-1])
+    return headroom_table_list
+
+# Writes headroom tables for all cases, using the battery calculations held
+# in the analysis context (see load_analysis_context)
+def save_headroom_tables(context):
+    global_dic = context['global_dic']
+    res = context['res']
+    num_case = context['num_case']
+    output_folder = global_dic['OUTPUT_PATH'] + '/' + global_dic['GLOBAL_NAME']
+    header = ['case name','headroom (kWh)','dispatch (kWh)','marginal headroom (kWh)',
+              'cumulative dispatch (kWh)','headroom per dispatch','dispatch per headroom']
+    for storage_type in ['STORAGE','PGP_STORAGE']:
+        headroom_table_list = cycles_per_year_batch(
+                [res[idx]['DISPATCH_FROM_'+storage_type] for idx in range(num_case)],
+                [context_battery_calculation(context, idx, storage_type)[0] for idx in range(num_case)]
+                )
+        with open(output_folder + '/' + global_dic['GLOBAL_NAME'] + '_headroom_' + storage_type.lower() + '.csv', 'wb') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(header)
+            for idx in range(num_case):
+                for row in headroom_table_list[idx]:
+                    writer.writerow([str(res[idx]['CASE_NAME'])] + list(row))
+
 def battery_simpleline(xaxis, y1, y2, co):
     fig = plt.figure()
     ax1 = fig.add_subplot(111)    
@@ -896,20 +871,24 @@ def battery_plot(res,
     if find_case_idx == False:
         case_idx = 0
     
-    DISPATCH_TO_STORAGE         = get_multicases_results(res, num_case, 'DISPATCH_TO_STORAGE')[case_idx]
-    DISPATCH_FROM_STORAGE       = get_multicases_results(res, num_case, 'DISPATCH_FROM_STORAGE')[case_idx]
-    ENERGY_STORAGE              = get_multicases_results(res, num_case, 'ENERGY_STORAGE')[case_idx]
-    STORAGE_CHARGING_EFFICIENCY = get_multicases_results(res, num_case, 'STORAGE_CHARGING_EFFICIENCY')[case_idx]
-    max_headroom, mean_residence_time, max_residence_time = battery_calculation(num_time_periods,
-                                                                                DISPATCH_TO_STORAGE,
-                                                                                DISPATCH_FROM_STORAGE,
-                                                                                ENERGY_STORAGE,
-                                                                                STORAGE_CHARGING_EFFICIENCY)
-    aa = DISPATCH_FROM_STORAGE
-    bb = DISPATCH_TO_STORAGE
+    battery_results = battery_calculation(num_time_periods,
+                                          res[case_idx]['DISPATCH_TO_STORAGE'],
+                                          res[case_idx]['DISPATCH_FROM_STORAGE'],
+                                          res[case_idx]['ENERGY_STORAGE'],
+                                          res[case_idx]['STORAGE_CHARGING_EFFICIENCY'])
+    plotk = battery_plot_case(res[case_idx], battery_results)
+    
+    return plotk
+
+# battery plot for one case (an element of <res>), given the output of battery_calculation
+def battery_plot_case(res_case, battery_results):
+    num_time_periods = len(res_case['DEMAND'])
+    max_headroom, mean_residence_time, max_residence_time = battery_results
+    aa = res_case['DISPATCH_FROM_STORAGE']
+    bb = res_case['DISPATCH_TO_STORAGE']
     aaa = np.squeeze(avg_series(aa, 1, 1,num_time_periods,24,1))
     bbb = np.squeeze(avg_series(bb, 1, 1,num_time_periods,24,1))
-    ccc = STORAGE_CHARGING_EFFICIENCY
+    ccc = res_case['STORAGE_CHARGING_EFFICIENCY']
     battery_output = [aaa, bbb, ccc]
     
     xaxis = np.arange(num_time_periods/24)+1
@@ -917,13 +896,63 @@ def battery_plot(res,
     
     return plotk
 
+#------------------------------------------------------------------------------
+#------------------------------------------------ Analysis context ------------
+#------------------------------------------------------------------------------
+# The analysis context holds everything post_process needs: results are
+# unpickled and converted with prepare_scalar_variables once, and derived
+# quantities (arrays across cases, battery calculations) are computed the
+# first time they are asked for and kept in context['cache'].
+
+def load_analysis_context(global_dic):
+    global_dic, case_dic_list, result_list = unpickle_raw_results(global_dic)
+    res = prepare_scalar_variables (global_dic, case_dic_list, result_list )
+    sweep_grid = func_sweep_grid(case_dic_list)
+    
+    context = {
+            'global_dic':global_dic,
+            'case_dic_list':case_dic_list,
+            'res':res,
+            'num_case':len(res),
+            'sweep_grid':sweep_grid,
+            'cost_list':sweep_grid['value_list'],
+            'var_list':sweep_grid['dimension_list'],
+            'cache':{}
+            }
+    return context
 
+# same as get_multicases_results(res, num_case, var, *avg_option), computed once
+def context_results(context, var, *avg_option):
+    key = ('RESULTS', var) + avg_option
+    if key not in context['cache']:
+        context['cache'][key] = get_multicases_results(context['res'], context['num_case'], var, *avg_option)
+    return context['cache'][key]
 
+# battery_calculation for one case and storage type, computed once
+def context_battery_calculation(context, case_idx, storage_type = 'STORAGE'):
+    key = ('BATTERY', case_idx, storage_type)
+    if key not in context['cache']:
+        res_case = context['res'][case_idx]
+        context['cache'][key] = battery_calculation(
+                len(res_case['DEMAND']),
+                res_case['DISPATCH_TO_'+storage_type],
+                res_case['DISPATCH_FROM_'+storage_type],
+                res_case['ENERGY_'+storage_type],
+                res_case[storage_type+'_CHARGING_EFFICIENCY']
+                )
+    return context['cache'][key]
 
+# time series and battery pages for a single case
+def case_plots(context, case_idx, case_name, multipanel, pp):
+    ploty = stack_plot2(context, case_name, multipanel, context['var_list'], case_idx)
+    plotk = battery_plot_case(context['res'][case_idx], context_battery_calculation(context, case_idx))
+    pp.savefig(ploty,dpi=200,bbox_inches='tight',transparent=True)
+    pp.savefig(plotk,dpi=200,bbox_inches='tight',transparent=True)
+    plt.close(ploty)
+    plt.close(plotk)
 
 def post_process(global_dic):
-    file_path = global_dic['OUTPUT_PATH']+'/'
-    scenario_name = global_dic["GLOBAL_NAME"]
+    file_name = global_dic["GLOBAL_NAME"]
     
     multipanel = True
     today = datetime.datetime.now()
@@ -931,101 +960,39 @@ def post_process(global_dic):
         str(today.hour).zfill(2) + str(today.minute).zfill(2) + str(today.second).zfill(2)
 
     pp = PdfPages(global_dic['OUTPUT_PATH']+ '/'+ global_dic['GLOBAL_NAME']+ '/' + global_dic['GLOBAL_NAME'] + '_pdfBOOK_' + todayString +'.pdf')
-    file_list = os.listdir(file_path)
     
-    for file in file_list:
-        file_name = file
-        if scenario_name == 'all' or file_name == scenario_name:
-            print 'deal with case:', scenario_name
-        
-            global_dic,case_dic_list,result_list = unpickle_raw_results(global_dic)
-            res = prepare_scalar_variables (global_dic, case_dic_list, result_list )            
-            cost_list, var_list = get_dimension_info(case_dic_list)
-            
-            print cost_list
-            print var_list
-            
-            num_case = len(res)
-            num_var_list = len(var_list) 
-            
-            dimension = 0
-            var_dimension = []    
-            for idx in range(num_var_list):
-                if cost_list[var_list[idx]].size > 1:
-                    dimension = dimension+1
-                    var_dimension.append( var_list[idx] )
-            if dimension == 0:
-                print 'only one case included'
-                ploty = stack_plot2(res, num_case, file_name,multipanel, var_dimension)
-                plotk = battery_plot(res,num_case,file_name, multipanel)
-                pp.savefig(ploty,dpi=200,bbox_inches='tight',transparent=True)
-                pp.savefig(plotk,dpi=200,bbox_inches='tight',transparent=True)
-                #print "set at least one dimension change"
-                #sys.exit()
-            elif dimension == 1 or dimension ==2:
-                if dimension ==1 or dimension ==2:  # problem with 2D case, treat as 1D
-                    print "variation list:", var_dimension[0]
-                    plotx = stack_plot1(res, num_case, file_name, multipanel, var_dimension)
-                    pp.savefig(plotx,dpi=200,bbox_inches='tight',transparent=True)
-                    for idx in range( len(cost_list[var_dimension[0]]) ):
-                        case_name = file_name + ' - ' + case_dic_list[idx]['CASE_NAME']
-                        select_case1 = [var_dimension[0], var_dimension[0]]
-                        select_case2 = [cost_list[var_dimension[0]][idx], cost_list[var_dimension[0]][idx]]
-                        ploty = stack_plot2(res, num_case, case_name,multipanel, var_dimension, select_case1, select_case2)
-                        plotk = battery_plot(res,num_case,case_name, multipanel, select_case1, select_case2)
-                        pp.savefig(ploty,dpi=200,bbox_inches='tight',transparent=True)
-                        pp.savefig(plotk,dpi=200,bbox_inches='tight',transparent=True)
-                else:
-                    print "variation list 1:", var_dimension[0]
-                    print "variation list 2:", var_dimension[1]
-                    plotz = contour_plot(res,num_case, file_name, var_dimension)
-                    pp.savefig(plotz,dpi=200,bbox_inches='tight',transparent=True)
-                    for idx_1 in range( len(cost_list[var_dimension[0]])):
-                        subset_res = {}
-                        num_idx = 0
-                        for idx_2 in range(num_case):
-                            if res[idx_2][var_dimension[0]] == cost_list[var_dimension[0]][idx_1]:
-                                subset_res[num_idx] = res[idx_2]
-                                num_idx = num_idx + 1
-                        if len(subset_res) > 1:
-                            plotx = stack_plot1(subset_res, num_idx, file_name, multipanel, [var_dimension[1]])
-                            pp.savefig(plotx,dpi=200,bbox_inches='tight',transparent=True)
-                            for idx_3 in range( len(cost_list[var_dimension[1]]) ):
-                                case_name = file_name + ' - ' + case_dic_list[idx]['CASE_NAME']
-                                select_case1 = [var_dimension[0], var_dimension[1]]
-                                select_case2 = [cost_list[var_dimension[0]][idx_1], cost_list[var_dimension[1]][idx_3]]
-                                ploty = stack_plot2(res, num_case, case_name,multipanel, var_dimension, select_case1, select_case2)
-                                plotk = battery_plot(res,num_case,case_name, multipanel, select_case1, select_case2)
-                                pp.savefig(ploty,dpi=200,bbox_inches='tight',transparent=True)
-                                pp.savefig(plotk,dpi=200,bbox_inches='tight',transparent=True)
-                    for idx_1 in range( len(cost_list[var_dimension[1]])):
-                        subset_res = {}
-                        num_idx = 0
-                        for idx_2 in range(num_case):
-                            if res[idx_2][var_dimension[1]] == cost_list[var_dimension[1]][idx_1]:
-                                subset_res[num_idx] = res[idx_2]
-                                num_idx = num_idx + 1
-                        if len(subset_res) > 1:
-                            plotx = stack_plot1(subset_res, num_idx, file_name, multipanel, [var_dimension[0]])
-                            pp.savefig(plotx,dpi=200,bbox_inches='tight',transparent=True)
-                            for idx_3 in range( len(cost_list[var_dimension[0]]) ):
-                                case_name = file_name + ' - ' + case_dic_list[idx]['CASE_NAME']
-                                select_case1 = [var_dimension[0], var_dimension[1]]
-                                select_case2 = [cost_list[var_dimension[0]][idx_3], cost_list[var_dimension[1]][idx_1]]
-                                ploty = stack_plot2(res, num_case, case_name,multipanel, var_dimension, select_case1, select_case2)
-                                plotk = battery_plot(res,num_case,case_name, multipanel, select_case1, select_case2)
-                                pp.savefig(ploty,dpi=200,bbox_inches='tight',transparent=True)
-                                pp.savefig(plotk,dpi=200,bbox_inches='tight',transparent=True)
-            else:
-                # if dimension > 2, then just make individual plots
-                for idx in range( len(cost_list[var_dimension[0]]) ):
-                    case_name = file_name + ' - ' + case_dic_list[idx]['CASE_NAME']
-                    select_case1 = [var_dimension[0], var_dimension[0]]
-                    select_case2 = [cost_list[var_dimension[0]][idx], cost_list[var_dimension[0]][idx]]
-                    ploty = stack_plot2(res, num_case, case_name,multipanel, var_dimension, select_case1, select_case2)
-                    plotk = battery_plot(res,num_case,case_name, multipanel, select_case1, select_case2)
-                    pp.savefig(ploty,dpi=200,bbox_inches='tight',transparent=True)
-                    pp.savefig(plotk,dpi=200,bbox_inches='tight',transparent=True)
+    print 'deal with case:', file_name
+    
+    # results are loaded once and everything below is fed from the context
+    context = load_analysis_context(global_dic)
+    case_dic_list = context['case_dic_list']
+    res = context['res']
+    num_case = context['num_case']
+    cost_list = context['cost_list']
+    var_dimension = context['var_list']
+    grid_index = context['sweep_grid']['grid_index']
+    dimension = len(var_dimension)
+    
+    print var_dimension
+    
+    save_headroom_tables(context)
+    
+    if dimension == 0:
+        print 'only one case included'
+        case_plots(context, 0, file_name, multipanel, pp)
+    else:
+        print "variation list:", var_dimension
+        if dimension >= 2:
+            # contour of the first two dimensions (other dimensions at their first value)
+            plotz = contour_plot(context, file_name, var_dimension, 'SYSTEM_COST', context['sweep_grid'])
+            pp.savefig(plotz,dpi=200,bbox_inches='tight',transparent=True)
+        plotx = stack_plot1(context, file_name, multipanel, var_dimension)
+        pp.savefig(plotx,dpi=200,bbox_inches='tight',transparent=True)
+        # one case for each value along the first dimension
+        for idx in range( len(cost_list[var_dimension[0]]) ):
+            case_idx = int(np.where(grid_index[:,0] == idx)[0][0])
+            case_name = file_name + ' - ' + case_dic_list[case_idx]['CASE_NAME']
+            case_plots(context, case_idx, case_name, multipanel, pp)
     pp.close()
 
 
@@ -39,6 +39,7 @@ Each dictionary in <case_dic_list> OPTIONALLY contains:
 '''
 
 import csv
+import re
 import numpy as np
 import itertools
 
@@ -150,17 +151,23 @@ def preprocess_input(case_input_path_filename):
     # Recognized keywords in case_input.csv file
     
     keywords_logical = map(str.upper,
-            ['VERBOSE','POSTPROCESS','QUICK_LOOK','NORMALIZE_DEMAND_TO_ONE']
+            ['VERBOSE','POSTPROCESS','QUICK_LOOK','NORMALIZE_DEMAND_TO_ONE',
+             'COST_MODEL','QUICK_LOOK_CACHE','PRESOLVE','PRESOLVE_REPORT','SOLVE','PROBLEM_CACHE','RESULT_FLOAT32']
+            )
+    
+    # integer keywords that only apply in the global section
+    keywords_int_global = map(str.upper,
+            ['NUM_PROCESSES','QUICK_LOOK_NUM_PERIODS','PLOT_MAX_POINTS','PROBLEM_CACHE_MEMORY']
             )
 
     keywords_str = map(str.upper,
             ['DATA_PATH','DEMAND_FILE',
              'SOLAR_CAPACITY_FILE','WIND_CAPACITY_FILE','OUTPUT_PATH',
-             'CASE_NAME','GLOBAL_NAME']
+             'CASE_NAME','GLOBAL_NAME','CASE_ORDER','EXPORT_LP','PROBLEM_CACHE_PATH']
             )
     
     keywords_real = map(str.upper,
-            ['NUMERICS_COST_SCALING','NUMERICS_DEMAND_SCALING',
+            ['NUMERICS_COST_SCALING','NUMERICS_DEMAND_SCALING','VERIFY_TOLERANCE',
              'END_DAY','END_HOUR','END_MONTH',
             'END_YEAR','FIXED_COST_NATGAS','FIXED_COST_SOLAR','FIXED_COST_WIND',
             'FIXED_COST_NUCLEAR','FIXED_COST_STORAGE',
@@ -177,7 +184,7 @@ def preprocess_input(case_input_path_filename):
             )
     
     keywords_real_notscaled = map(str.upper,
-            ['NUMERICS_COST_SCALING','NUMERICS_DEMAND_SCALING',
+            ['NUMERICS_COST_SCALING','NUMERICS_DEMAND_SCALING','VERIFY_TOLERANCE',
              'END_DAY','END_HOUR','END_MONTH',
             'END_YEAR',
             'START_DAY','START_HOUR','START_MONTH',
@@ -216,9 +223,24 @@ def preprocess_input(case_input_path_filename):
     # For now, default for quicklook output is True
     global_dic['QUICK_LOOK'] = True
     global_dic['NORMALIZE_DEMAND_TO_ONE'] = False # If True, normalize mean demand to 1.0
+    global_dic['COST_MODEL'] = True # If True, add hourly cost series (Cost_Model.py) to results
+    global_dic['QUICK_LOOK_CACHE'] = True # If True, reuse quick look pages whose inputs have not changed
+    global_dic['PRESOLVE'] = True # If True, leave redundant rows and unused technologies out of the LP
+    global_dic['PRESOLVE_REPORT'] = False # If True, print the LP size with and without presolve for each case
+    global_dic['NUM_PROCESSES'] = 0 # number of worker processes; 0 means one per cpu
+    global_dic['QUICK_LOOK_NUM_PERIODS'] = 1 # number of non-overlapping extreme periods plotted per component
+    global_dic['PLOT_MAX_POINTS'] = 2000 # points per line in time series plots; 0 means plot every hour
+    global_dic['CASE_ORDER'] = 'INPUT' # order cases are solved in: INPUT, SERPENTINE or NEAREST_NEIGHBOR
+    global_dic['EXPORT_LP'] = '' # MPS or LP to write the LP of each case to a file (Export_LP.py)
+    global_dic['SOLVE'] = True # If False, cases are not solved (use with EXPORT_LP)
+    global_dic['PROBLEM_CACHE'] = False # If True, build the LP from constraint matrices cached on disk (Problem_Cache.py)
+    global_dic['PROBLEM_CACHE_PATH'] = './problem_cache' # directory of the problem cache, shared by all runs
+    global_dic['PROBLEM_CACHE_MEMORY'] = 16 # number of problem structures kept in memory, least recently used dropped first
+    global_dic['RESULT_FLOAT32'] = False # If True, hourly results are kept in single precision
     # default global values to help with numerical issues
-    global_dic['NUMERICS_COST_SCALING'] = 1e+12 # multiplies all costs by a factor and then divides at end
-    global_dic['NUMERICS_DEMAND_SCALING'] = 1e+12 # multiplies demand by a factor and then divides all costs and capacities at end
+    global_dic['NUMERICS_COST_SCALING'] = 0 # multiplies all costs by a factor and then divides at end; <= 0 means chosen for each case
+    global_dic['NUMERICS_DEMAND_SCALING'] = 0 # multiplies demand by a factor and then divides all costs and capacities at end; <= 0 means chosen for each case
+    global_dic['VERIFY_TOLERANCE'] = 1e-6 # largest constraint residual (relative to mean demand) accepted without a warning
     #------convert file input to dictionary of global data ---------
     for list_item in global_data:
         test_key = str.upper(list_item[0])
@@ -227,6 +249,8 @@ def preprocess_input(case_input_path_filename):
             global_dic[test_key] = test_value
         elif test_key in keywords_real:
             global_dic[test_key] = float(test_value)
+        elif test_key in keywords_int_global:
+            global_dic[test_key] = int(float(test_value))
         elif test_key in keywords_logical:
             global_dic[test_key] = literal_to_boolean(test_value)
     
@@ -423,3 +447,35 @@ def preprocess_input(case_input_path_filename):
     return global_dic,case_dic_list
 
              
+
+
+#%%
+def select_cases(case_dic_list, case_name_list = None, index_range = None,
+                 name_pattern = None, shard = None):
+    # Select the cases to run from <case_dic_list>.
+    # Each case gets 'CASE_INDEX', its position in the full case input file,
+    # so that results from separate runs can be put back in order.
+    #
+    #   case_name_list -- run only cases with these names
+    #   index_range -- (start, stop), run only cases with start <= index < stop
+    #   name_pattern -- run only cases whose name matches this regular expression
+    #   shard -- (i, N), run only every N-th of the selected cases, starting
+    #       with the i-th (i = 0 ... N-1), so that N runs cover all cases
+    
+    for case_index in range(len(case_dic_list)):
+        case_dic_list[case_index]['CASE_INDEX'] = case_index
+    
+    selected_list = []
+    for case_dic in case_dic_list:
+        if case_name_list is not None and case_dic['CASE_NAME'] not in case_name_list:
+            continue
+        if index_range is not None and not index_range[0] <= case_dic['CASE_INDEX'] < index_range[1]:
+            continue
+        if name_pattern is not None and re.search(name_pattern, case_dic['CASE_NAME']) is None:
+            continue
+        selected_list.append(case_dic)
+    
+    if shard is not None:
+        selected_list = selected_list[shard[0]::shard[1]]
+    
+    return selected_list
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+'''
+
+File name: Problem_Cache.py
+
+Simple Energy Model Ver 1
+
+The LP of core_model assembled directly as sparse matrices, with the
+constraint matrices cached on disk (PROBLEM_CACHE, PROBLEM_CACHE_PATH).
+
+Only the objective depends on the costs. Everything else (the sparsity pattern,
+the capacity factors in the capacity constraints, the storage parameters and
+the demand on the right hand side) depends on the structure of a case:
+
+    the components in the LP, the number of hours, the demand, solar and wind
+    series, the storage parameters, the demand scaling and PRESOLVE
+
+Cases with the same structure (e.g. a sweep over costs, or a repeated run of
+the same case input file) load the constraint matrices from the cache, build
+the objective vector and go straight to the solver, without building the
+problem in cvxpy expression by expression.
+
+The problem solved is the one core_model builds (same variables, constraints,
+scaling and presolve), and core_model_cached returns the same results: both
+hand the solution and the duals to Core_Model.solution_result, which computes
+the prices, reduced costs and the solution check.
+
+'''
+
+# -----------------------------------------------------------------------------
+
+import collections
+import hashlib
+import json
+import os
+import cvxpy as cvx
+import numpy as np
+import scipy.sparse as sparse
+
+# Change this when the LP assembled by assemble_structure() changes, so that
+# structures cached by earlier versions are not reused.
+STRUCTURE_VERSION = 1
+
+# Variables of each component, in the order of the LP columns, and whether
+# each is hourly (True) or a single capacity (False). Variable names are the
+# result keys.
+component_variable_list = [
+        ['NATGAS', [['CAPACITY_NATGAS', False], ['DISPATCH_NATGAS', True]]],
+        ['SOLAR', [['CAPACITY_SOLAR', False], ['DISPATCH_SOLAR', True]]],
+        ['WIND', [['CAPACITY_WIND', False], ['DISPATCH_WIND', True]]],
+        ['NUCLEAR', [['CAPACITY_NUCLEAR', False], ['DISPATCH_NUCLEAR', True]]],
+        ['STORAGE', [['CAPACITY_STORAGE', False], ['DISPATCH_TO_STORAGE', True],
+                     ['DISPATCH_FROM_STORAGE', True], ['ENERGY_STORAGE', True]]],
+        ['PGP_STORAGE', [['FIXED_PGP_STORAGE', False], ['CAPACITY_TO_PGP_STORAGE', False],
+                         ['CAPACITY_FROM_PGP_STORAGE', False], ['DISPATCH_TO_PGP_STORAGE', True],
+                         ['DISPATCH_FROM_PGP_STORAGE', True], ['ENERGY_PGP_STORAGE', True]]],
+        ['UNMET_DEMAND', [['DISPATCH_UNMET_DEMAND', True]]],
+        ]
+
+# cost keyword of each variable; variable costs are divided by the number of hours
+variable_cost_dic = {
+        'CAPACITY_NATGAS':'FIXED_COST_NATGAS',
+        'CAPACITY_SOLAR':'FIXED_COST_SOLAR',
+        'CAPACITY_WIND':'FIXED_COST_WIND',
+        'CAPACITY_NUCLEAR':'FIXED_COST_NUCLEAR',
+        'CAPACITY_STORAGE':'FIXED_COST_STORAGE',
+        'FIXED_PGP_STORAGE':'FIXED_COST_PGP_STORAGE',
+        'CAPACITY_TO_PGP_STORAGE':'FIXED_COST_TO_PGP_STORAGE',
+        'CAPACITY_FROM_PGP_STORAGE':'FIXED_COST_FROM_PGP_STORAGE',
+        'DISPATCH_NATGAS':'VAR_COST_NATGAS',
+        'DISPATCH_SOLAR':'VAR_COST_SOLAR',
+        'DISPATCH_WIND':'VAR_COST_WIND',
+        'DISPATCH_NUCLEAR':'VAR_COST_NUCLEAR',
+        'DISPATCH_TO_STORAGE':'VAR_COST_TO_STORAGE',
+        'DISPATCH_FROM_STORAGE':'VAR_COST_FROM_STORAGE',
+        'DISPATCH_TO_PGP_STORAGE':'VAR_COST_TO_PGP_STORAGE',
+        'DISPATCH_FROM_PGP_STORAGE':'VAR_COST_FROM_PGP_STORAGE',
+        'DISPATCH_UNMET_DEMAND':'VAR_COST_UNMET_DEMAND',
+        }
+
+# capacity bounds (dispatch <= coefficient * capacity), as in core_model's capacity_bound_dic
+capacity_bound_list = [
+        ['NATGAS', 'DISPATCH_NATGAS', 'CAPACITY_NATGAS'],
+        ['SOLAR', 'DISPATCH_SOLAR', 'CAPACITY_SOLAR'],
+        ['WIND', 'DISPATCH_WIND', 'CAPACITY_WIND'],
+        ['NUCLEAR', 'DISPATCH_NUCLEAR', 'CAPACITY_NUCLEAR'],
+        ['TO_STORAGE', 'DISPATCH_TO_STORAGE', 'CAPACITY_STORAGE'],
+        ['FROM_STORAGE', 'DISPATCH_FROM_STORAGE', 'CAPACITY_STORAGE'],
+        ['STORAGE', 'ENERGY_STORAGE', 'CAPACITY_STORAGE'],
+        ['TO_PGP_STORAGE', 'DISPATCH_TO_PGP_STORAGE', 'CAPACITY_TO_PGP_STORAGE'],
+        ['FROM_PGP_STORAGE', 'DISPATCH_FROM_PGP_STORAGE', 'CAPACITY_FROM_PGP_STORAGE'],
+        ['PGP_STORAGE', 'ENERGY_PGP_STORAGE', 'FIXED_PGP_STORAGE'],
+        ]
+
+# structures loaded in this process, by signature, least recently used first
+structure_memory_dic = collections.OrderedDict()
+
+# -----------------------------------------------------------------------------
+
+def model_components_of(case_dic, presolve):
+    # components in the LP, as in core_model, in a fixed order
+    from Core_Model import lp_components # imported here, as Core_Model imports this module
+    model_components = lp_components(case_dic, presolve)
+    return [component for component, variable_list in component_variable_list if component in model_components]
+
+def structure_signature(case_dic, model_components, numerics_demand_scaling, presolve):
+    signature = hashlib.sha1()
+    signature.update(repr([
+            STRUCTURE_VERSION, model_components, presolve, float(numerics_demand_scaling),
+            float(case_dic['STORAGE_CHARGING_EFFICIENCY']), float(case_dic['STORAGE_CHARGING_TIME']),
+            float(case_dic['STORAGE_DECAY_RATE']), float(case_dic['PGP_STORAGE_CHARGING_EFFICIENCY'])
+            ]).encode('utf-8'))
+    for key in ['DEMAND_SERIES','SOLAR_SERIES','WIND_SERIES']:
+        signature.update(np.ascontiguousarray(case_dic[key], dtype = float).tobytes())
+    return signature.hexdigest()
+
+# -----------------------------------------------------------------------------
+
+def assemble_structure(case_dic, model_components, numerics_demand_scaling, presolve):
+
+    from Core_Model import capacity_coefficient # imported here, as Core_Model imports this module
+
+    # Equality rows A x = b: energy balance and storage continuity.
+    # Less-than rows G x <= h: nonnegativity, capacity bounds and, without
+    # presolve, the redundant storage dispatch bounds.
+
+    demand_series = np.array(case_dic['DEMAND_SERIES'], dtype = float) * numerics_demand_scaling
+    num_time_periods = len(demand_series)
+    hours = np.arange(num_time_periods)
+    storage_decay_rate = case_dic['STORAGE_DECAY_RATE']
+
+    # columns
+    variable_dic = {} # name -> [first column, number of columns]
+    num_columns = 0
+    for component, variable_list in component_variable_list:
+        if component in model_components:
+            for name, hourly in variable_list:
+                size = num_time_periods if hourly else 1
+                variable_dic[name] = [num_columns, size]
+                num_columns += size
+
+    def columns(name, index = 0):
+        return variable_dic[name][0] + index
+
+    # rows, as lists of (row, column, value) arrays for each matrix
+    matrix_entry_dic = {'A':[], 'G':[]}
+    rhs_dic = {'A':[], 'G':[]}
+    block_dic = {'A':{}, 'G':{}} # block name -> [first row, number of rows]
+
+    def add_block(matrix_key, block_name, rhs):
+        block_dic[matrix_key][block_name] = [sum(len(x) for x in rhs_dic[matrix_key]), len(rhs)]
+        rhs_dic[matrix_key].append(np.array(rhs, dtype = float))
+
+    def add_entries(matrix_key, block_name, row_index, column_index, value):
+        row_index, column_index, value = np.broadcast_arrays(row_index, column_index, value)
+        matrix_entry_dic[matrix_key].append([block_dic[matrix_key][block_name][0] + row_index,
+                                             column_index, value.astype(float)])
+
+    # energy balance
+    add_block('A', 'ENERGY_BALANCE', demand_series)
+    for name in ['DISPATCH_NATGAS','DISPATCH_SOLAR','DISPATCH_WIND','DISPATCH_NUCLEAR',
+                 'DISPATCH_FROM_STORAGE','DISPATCH_FROM_PGP_STORAGE','DISPATCH_UNMET_DEMAND']:
+        if name in variable_dic:
+            add_entries('A', 'ENERGY_BALANCE', hours, columns(name, hours), 1.)
+    for name in ['DISPATCH_TO_STORAGE','DISPATCH_TO_PGP_STORAGE']:
+        if name in variable_dic:
+            add_entries('A', 'ENERGY_BALANCE', hours, columns(name, hours), -1.)
+
+    # storage continuity: energy[i+1] - energy[i] * (1 - decay) - efficiency * to[i] + from[i] == 0
+    for block_name, component, efficiency, decay_rate in [
+            ['STORAGE_CONTINUITY', 'STORAGE', case_dic['STORAGE_CHARGING_EFFICIENCY'], storage_decay_rate],
+            ['PGP_STORAGE_CONTINUITY', 'PGP_STORAGE', case_dic['PGP_STORAGE_CHARGING_EFFICIENCY'], 0.]]:
+        if component in model_components:
+            add_block('A', block_name, np.zeros(num_time_periods))
+            add_entries('A', block_name, hours, columns('ENERGY_' + component, (hours + 1) % num_time_periods), 1.)
+            add_entries('A', block_name, hours, columns('ENERGY_' + component, hours), -(1. - decay_rate))
+            add_entries('A', block_name, hours, columns('DISPATCH_TO_' + component, hours), -efficiency)
+            add_entries('A', block_name, hours, columns('DISPATCH_FROM_' + component, hours), 1.)
+
+    # every variable is nonnegative
+    add_block('G', 'NONNEGATIVITY', np.zeros(num_columns))
+    add_entries('G', 'NONNEGATIVITY', np.arange(num_columns), np.arange(num_columns), -1.)
+
+    # capacity bounds
+    for bound_name, dispatch_name, capacity_name in capacity_bound_list:
+        if dispatch_name in variable_dic:
+            add_block('G', bound_name, np.zeros(num_time_periods))
+            add_entries('G', bound_name, hours, columns(dispatch_name, hours), 1.)
+            add_entries('G', bound_name, hours, columns(capacity_name),
+                        -capacity_coefficient(case_dic, bound_name) * np.ones(num_time_periods))
+
+    # dispatch from storage <= energy in storage (redundant, see the Presolve note in core_model)
+    if not presolve:
+        for block_name, component, decay_rate in [
+                ['STORAGE_DISPATCH', 'STORAGE', storage_decay_rate], ['PGP_STORAGE_DISPATCH', 'PGP_STORAGE', 0.]]:
+            if component in model_components:
+                add_block('G', block_name, np.zeros(num_time_periods))
+                add_entries('G', block_name, hours, columns('DISPATCH_FROM_' + component, hours), 1.)
+                add_entries('G', block_name, hours, columns('ENERGY_' + component, hours), -(1. - decay_rate))
+
+    structure = {'layout':{'VARIABLES':variable_dic, 'A':block_dic['A'], 'G':block_dic['G'],
+                           'NUM_COLUMNS':num_columns, 'NUM_TIME_PERIODS':num_time_periods}}
+    for matrix_key, rhs_key in [['A','b'], ['G','h']]:
+        row_index, column_index, value = [np.concatenate(x) for x in zip(*matrix_entry_dic[matrix_key])]
+        num_rows = sum(len(x) for x in rhs_dic[matrix_key])
+        structure[matrix_key] = sparse.csr_matrix((value, (row_index, column_index)), shape = (num_rows, num_columns))
+        structure[rhs_key] = np.concatenate(rhs_dic[matrix_key])
+    return structure
+
+# -----------------------------------------------------------------------------
+
+def save_structure(file_name, structure):
+    # written to a temporary file and renamed, so that parallel runs never read a partial file
+    temporary_file_name = file_name + '.' + str(os.getpid()) + '.tmp'
+    array_dic = {'layout':np.array(json.dumps(structure['layout'])), 'b':structure['b'], 'h':structure['h']}
+    for matrix_key in ['A','G']:
+        matrix = structure[matrix_key]
+        array_dic[matrix_key + '_data'] = matrix.data
+        array_dic[matrix_key + '_indices'] = matrix.indices
+        array_dic[matrix_key + '_indptr'] = matrix.indptr
+        array_dic[matrix_key + '_shape'] = np.array(matrix.shape)
+    with open(temporary_file_name, 'wb') as cache_file:
+        np.savez(cache_file, **array_dic)
+    os.rename(temporary_file_name, file_name)
+
+def load_structure(file_name):
+    array_dic = np.load(file_name)
+    structure = {'layout':json.loads(str(array_dic['layout'])), 'b':array_dic['b'], 'h':array_dic['h']}
+    for matrix_key in ['A','G']:
+        structure[matrix_key] = sparse.csr_matrix(
+                (array_dic[matrix_key + '_data'], array_dic[matrix_key + '_indices'], array_dic[matrix_key + '_indptr']),
+                shape = tuple(array_dic[matrix_key + '_shape']))
+    array_dic.close()
+    return structure
+
+def get_structure(global_dic, case_dic, model_components, numerics_demand_scaling, presolve):
+
+    # global_dic['PROBLEM_CACHE_PERSIST'] = False keeps a new structure in
+    # memory only (used by Model_Server.py for what-if structures)
+    verbose = global_dic['VERBOSE']
+    signature = structure_signature(case_dic, model_components, numerics_demand_scaling, presolve)
+    if signature in structure_memory_dic:
+        structure = structure_memory_dic.pop(signature)
+        structure_memory_dic[signature] = structure # now the most recently used
+        return structure
+
+    cache_path = global_dic.get('PROBLEM_CACHE_PATH', './problem_cache')
+    file_name = cache_path + '/' + signature + '.npz'
+    if os.path.exists(file_name):
+        structure = load_structure(file_name)
+        if verbose:
+            print 'Problem_Cache.py: structure loaded from ' + file_name
+    else:
+        structure = assemble_structure(case_dic, model_components, numerics_demand_scaling, presolve)
+        if global_dic.get('PROBLEM_CACHE_PERSIST', True):
+            if not os.path.exists(cache_path):
+                os.makedirs(cache_path)
+            save_structure(file_name, structure)
+            if verbose:
+                print 'Problem_Cache.py: structure saved to ' + file_name
+    structure_memory_dic[signature] = structure
+    while len(structure_memory_dic) > max(1, global_dic.get('PROBLEM_CACHE_MEMORY', 16)):
+        structure_memory_dic.popitem(last = False)
+    return structure
+
+def objective_vector(case_dic, layout, numerics_cost_scaling):
+    num_time_periods = layout['NUM_TIME_PERIODS']
+    objective = np.zeros(layout['NUM_COLUMNS'])
+    for name, (first_column, size) in layout['VARIABLES'].items():
+        if name in variable_cost_dic:
+            cost = case_dic[variable_cost_dic[name]] * numerics_cost_scaling
+            if size > 1:
+                cost = cost / num_time_periods
+            objective[first_column:first_column + size] = cost
+    return objective
+
+# -----------------------------------------------------------------------------
+
+def core_model_cached(global_dic, case_dic, presolve = None):
+
+    # imported here, as Core_Model imports this module
+    from Core_Model import numerics_scaling, dual_array, solution_result
+
+    verbose = global_dic['VERBOSE']
+    if verbose:
+        print 'Problem_Cache.py: processing case ',case_dic['CASE_NAME']
+    if presolve is None:
+        presolve = global_dic.get('PRESOLVE', True)
+
+    numerics_cost_scaling, numerics_demand_scaling = numerics_scaling(global_dic, case_dic, presolve)
+    model_components = model_components_of(case_dic, presolve)
+    structure = get_structure(global_dic, case_dic, model_components, numerics_demand_scaling, presolve)
+    layout = structure['layout']
+    num_time_periods = layout['NUM_TIME_PERIODS']
+    objective = objective_vector(case_dic, layout, numerics_cost_scaling)
+
+    # -----------------------------------------------------------------------------
+    # Problem solving, in matrix form
+
+    x = cvx.Variable(layout['NUM_COLUMNS'])
+    equality = cvx.Constant(structure['A']) * x == structure['b']
+    inequality = cvx.Constant(structure['G']) * x <= structure['h']
+    prob = cvx.Problem(cvx.Minimize(objective.reshape(1, -1) * x), [equality, inequality])
+    prob.solve(solver = 'GUROBI')
+
+    if verbose:
+        print 'system cost ',prob.value/(numerics_cost_scaling * numerics_demand_scaling)
+
+    # -----------------------------------------------------------------------------
+    # Results, as in core_model (Core_Model.solution_result)
+
+    x_value = np.array(x.value, dtype = float).flatten()
+    value_dic = {}
+    for component, variable_list in component_variable_list:
+        for name, hourly in variable_list:
+            if name in layout['VARIABLES']:
+                first_column, size = layout['VARIABLES'][name]
+                value_dic[name] = x_value[first_column:first_column + size]
+            else:
+                value_dic[name] = np.zeros(num_time_periods) if hourly else 0.
+
+    # duals of each block of rows, by block name (capacity bounds by component)
+    dual_dic = {}
+    for matrix_key, constraint in [['A', equality], ['G', inequality]]:
+        dual = dual_array(constraint, structure[matrix_key].shape[0])
+        for block_name, (first_row, size) in layout[matrix_key].items():
+            dual_dic[block_name] = dual[first_row:first_row + size]
+
+    return solution_result(global_dic, case_dic, model_components, prob, value_dic, dual_dic,
+                           numerics_cost_scaling, numerics_demand_scaling)
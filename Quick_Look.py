@@ -70,14 +70,25 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import pickle
 import copy
+import multiprocessing
+import hashlib
+import time
 from cycler import cycler
-from Supporting_Functions import func_find_period
+from Supporting_Functions import func_find_periods
 from Supporting_Functions import func_lines_plot
 from Supporting_Functions import func_lines_2yaxes_plot
 from Supporting_Functions import func_stack_plot
 from Supporting_Functions import func_time_conversion
 from Supporting_Functions import func_load_optimization_results
 from matplotlib.backends.backend_pdf import PdfPages
+try:
+    from PyPDF2 import PdfFileMerger # only needed to merge the per-case pdf files
+except ImportError:
+    PdfFileMerger = None
+
+# Change this when the figures in plot_results_time_series_1scenario() change,
+# so that pages cached by earlier versions are not reused.
+FIGURE_CACHE_VERSION = 1
 
 
 #==============================================================================
@@ -104,8 +115,25 @@ def quick_look(pickle_file_name):
     output_all = global_dic['GLOBAL_NAME'] + '_all_cases.pdf'
     pdf_all = PdfPages(output_dir + '/' + output_all) # create and open pdf file
     # Define file for pdfs containing figures relating to individual cases
+    # (each case is plotted into its own file, merged at the end with PyPDF2;
+    # without PyPDF2 all cases are plotted into this file, one after another)
     output_each = global_dic['GLOBAL_NAME'] + '_each_case.pdf'
-    pdf_each = PdfPages(output_dir + '/' + output_each) # create and open pdf file
+    output_each_dir = output_dir + '/' + global_dic['GLOBAL_NAME'] + '_each_case'
+    # Pages are cached by a hash of their inputs (needs PyPDF2 to merge them)
+    figure_cache_dir = None
+    if PdfFileMerger is None:
+        print ('Quick_Look.py: WARNING: PyPDF2 is not installed, so the pages of the '
+               + str(len(case_dic_list)) + ' cases are plotted one case at a time, without the worker pool')
+        print 'Quick_Look.py: WARNING: install PyPDF2 to plot the cases in parallel'
+        if global_dic.get('QUICK_LOOK_CACHE',True):
+            print 'Quick_Look.py: WARNING: the figure cache (QUICK_LOOK_CACHE) needs PyPDF2 and is not used'
+    elif global_dic.get('QUICK_LOOK_CACHE',True):
+        figure_cache_dir = output_dir + '/' + global_dic['GLOBAL_NAME'] + '_figure_cache'
+        if not os.path.exists(figure_cache_dir):
+            os.makedirs(figure_cache_dir)
+    elif not os.path.exists(output_each_dir):
+        os.makedirs(output_each_dir)
+    run_start_time = time.time()
     # Define file for text output
     output_text = global_dic['GLOBAL_NAME'] + '_text.txt'
     text_file = open(output_dir + '/' + output_text,'w')
@@ -138,8 +166,10 @@ def quick_look(pickle_file_name):
         input_data = copy.copy(case_dic) # Dictionary for input into graphing functions will be superset of case_dic and result_dic
         input_data.update(result_dic)  # input_data is now the union of case_dic and result_dic
                 
-        input_data['pdf_each'] = pdf_each # file handle for pdf output case by case
-        input_data['text_file'] = text_file # file handle for text output case by case
+        input_data['pdf_each_file_name'] = output_each_dir + '/' + str(case_idx).zfill(4) + '_' + case_dic['CASE_NAME'] + '.pdf'
+        input_data['figure_cache_dir'] = figure_cache_dir
+        input_data['num_periods'] = global_dic.get('QUICK_LOOK_NUM_PERIODS',1) # extreme periods per component
+        input_data['max_points'] = global_dic.get('PLOT_MAX_POINTS',2000) # points per line in time series plots
         system_components = case_dic['SYSTEM_COMPONENTS']
 
         # results_matrix_dispatch contains time series of things that add electricity to the grid
@@ -229,14 +259,59 @@ def quick_look(pickle_file_name):
         # end of section to generate list of input_data dictionaries
 
     # ========== CREATE PLOTS =========
-  
-    for input_data in input_data_list:
+    # Cases are independent, so they are plotted in a worker pool. Each worker
+    # writes the pages for its case into the case's own pdf file or, with the
+    # figure cache, into one cached pdf file per page. Without PyPDF2 to merge
+    # these files, the cases are plotted here into one pdf file.
+    
+    if PdfFileMerger is None:
+        pdf_each = PdfPages(output_dir + '/' + output_each) # create and open pdf file
+        for input_data in input_data_list:
+            input_data['pdf_each'] = pdf_each
+            prepare_plot_results_time_series_1scenario (input_data) # produce single case time series plots
+            if verbose:
+                print 'done with prepare_plot_results_time_series_1scenario for case '+input_data['CASE_NAME']
+        pdf_each.close()
+    else:
+        num_processes = global_dic.get('NUM_PROCESSES',0)
+        if num_processes <= 0:
+            num_processes = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(max(1,min(num_processes,num_cases)), init_plot_worker)
+        plot_job_list = []
+        for input_data in input_data_list:
         
 #        prepare_plot_results_bar_1scenario (input_data) # produce single case barchart plots
-        prepare_plot_results_time_series_1scenario (input_data) # produce single case time series plots
-        
-        if verbose:
-            print 'done with prepare_plot_results_time_series_1scenario for case '+input_data['CASE_NAME']
+            plot_job_list.append(pool.apply_async(plot_case_time_series, (input_data,)))
+        pool.close()
+    
+        pdf_file_name_list = []
+        for case_idx in range(num_cases):
+            pdf_file_name_list += plot_job_list[case_idx].get()
+            if verbose:
+                print 'done with prepare_plot_results_time_series_1scenario for case '+input_data_list[case_idx]['CASE_NAME']
+        pool.join()
+    
+        # merge the pdf files for individual cases (or pages), in case order
+        merger = PdfFileMerger()
+        for pdf_file_name in pdf_file_name_list:
+            merger.append(pdf_file_name)
+        merger.write(output_dir + '/' + output_each)
+        merger.close()
+        if figure_cache_dir is None:
+            for pdf_file_name in pdf_file_name_list:
+                os.remove(pdf_file_name)
+            os.rmdir(output_each_dir)
+        else:
+            # remove the old pages of the cases in this run, and temporary
+            # pages left by workers that died before renaming them; pages of
+            # other cases, and files written since this run started, are kept
+            case_name_set = set(input_data['CASE_NAME'] for input_data in input_data_list)
+            for cache_file_name in os.listdir(figure_cache_dir):
+                cache_path_file_name = figure_cache_dir + '/' + cache_file_name
+                if ((cache_file_name.endswith('.tmp') or figure_cache_case_name(cache_file_name) in case_name_set)
+                        and cache_path_file_name not in pdf_file_name_list
+                        and os.path.getmtime(cache_path_file_name) < run_start_time):
+                    os.remove(cache_path_file_name)
             
             
     # ============= LOGIC FOR COMPARING CASES ==============================
@@ -254,11 +329,67 @@ def quick_look(pickle_file_name):
          
     # close files
     pdf_all.close()
-    pdf_each.close()
     text_file.close()
     if verbose:
         print 'files closed'
 
+
+#%%
+#==============================================================================
+# init_plot_worker, plot_case_time_series, figure_cache_key
+#
+# Purpose
+#   Plot the time series pages for one case in a worker process.
+#   Workers use the non-interactive Agg backend and write into their own pdf
+#       file (input_data['pdf_each_file_name']), as pdf file handles cannot
+#       be shared between processes.
+#   If input_data['figure_cache_dir'] is set, each page is instead written to
+#       its own file in that folder, named by the case name and
+#       figure_cache_key(), and pages already in the folder are not plotted
+#       again.
+#
+# Output
+#   list of the names of the pdf files for the case, in page order
+#
+def init_plot_worker():
+    plt.switch_backend('Agg')
+    
+def plot_case_time_series(input_data):
+    
+    if input_data['figure_cache_dir'] is not None:
+        input_data['page_file_list'] = [] # filled by plot_results_time_series_1scenario()
+        prepare_plot_results_time_series_1scenario (input_data) # produce single case time series plots
+        return input_data['page_file_list']
+    
+    pdf_each = PdfPages(input_data['pdf_each_file_name']) # create and open pdf file
+    input_data['pdf_each'] = pdf_each
+    prepare_plot_results_time_series_1scenario (input_data) # produce single case time series plots
+    pdf_each.close()
+    
+    return [input_data['pdf_each_file_name']]
+
+# hash of everything a plot_results_time_series_1scenario() page depends on
+def figure_cache_key(input_data, hours_to_avg, start_hour, end_hour):
+    
+    key = hashlib.sha1()
+    key.update(repr((FIGURE_CACHE_VERSION, hours_to_avg, start_hour, end_hour)))
+    for item in ['CASE_NAME','page_title','max_dispatch','max_points',
+                 'legend_list_dispatch','legend_list_demand','legend_list_curtailment',
+                 'color_list_dispatch','color_list_demand','color_list_curtailment']:
+        key.update(repr(input_data.get(item)))
+    for item in ['DEMAND_SERIES','results_matrix_dispatch','results_matrix_demand','results_matrix_curtailment']:
+        data = np.ascontiguousarray(input_data[item])
+        key.update(repr((data.dtype.str, data.shape)))
+        key.update(data.tobytes())
+    
+    return key.hexdigest()
+
+# case name of a page in the figure cache (file name is <case name>_<sha1 hex>.pdf)
+def figure_cache_case_name(cache_file_name):
+    
+    if not cache_file_name.endswith('.pdf') or len(cache_file_name) < 46 or cache_file_name[-45] != '_':
+        return None
+    return cache_file_name[:-45]
       
 #%%
 #==============================================================================
@@ -592,39 +723,51 @@ def prepare_plot_results_time_series_1scenario(input_data):
     plot_results_time_series_1scenario(input_data,24*5) # basic results by week
     
     # -------------------------------------------------------------------------
-    # Find the week where storage dispatch is at its weekly max or min use
+    # Find the weeks where each component's dispatch is at its weekly max use
+    # (all components in one pass)
     
-    for idx in range(results_matrix_dispatch.shape[1]):
-        plot_extreme_dispatch_results_time_series_1scenario(input_data, component_name_dispatch[idx],'max',24*5)
+    study_variable_dict = {
+            'window_size_list': [24*5],
+            'data':             results_matrix_dispatch, 
+            'print_option':     0,
+            'search_option':    'max',
+            'num_periods':      input_data.get('num_periods',1)
+            }
+    period_list = func_find_periods(study_variable_dict)
+    
+    for period in period_list:
+        plot_extreme_dispatch_results_time_series_1scenario(input_data, component_name_dispatch[period['column']],
+                                                            period['search_option'],period['window_size'],period)
         
     return
    
 
-def plot_extreme_dispatch_results_time_series_1scenario(input_data,component_name,search_option,window_size):
-    
-    component_index_dispatch = input_data['component_index_dispatch']
-    component_index = component_index_dispatch[component_name]
-    
-    results_matrix_dispatch = input_data['results_matrix_dispatch']
+def plot_extreme_dispatch_results_time_series_1scenario(input_data,component_name,search_option,window_size,period = None):
     
-    study_variable_dict = {
-            'window_size':      window_size,
-            'data':             results_matrix_dispatch[:,component_index], 
-            'print_option':     0,
-            'search_option':    search_option
-            }
-    
-    study_output_1 = func_find_period(study_variable_dict)    
-    start_hour = study_output_1['left_index']
-    end_hour = study_output_1['right_index']
+    # period is an entry of the func_find_periods() output, if already found
+    if period is None:
+        component_index_dispatch = input_data['component_index_dispatch']
+        component_index = component_index_dispatch[component_name]
+        
+        results_matrix_dispatch = input_data['results_matrix_dispatch']
+        
+        study_variable_dict = {
+                'window_size_list': [window_size],
+                'data':             results_matrix_dispatch[:,component_index], 
+                'print_option':     0,
+                'search_option':    search_option
+                }
+        
+        period = func_find_periods(study_variable_dict)[0]
+    start_hour = period['left_index']
+    end_hour = period['right_index']
         
     input_data['page_title'] = (
             component_name + ' ('+search_option+') supplied {:.2f} kW avg to the grid during hours: {} '
-            .format(study_output_1['value'],  (start_hour,end_hour))
+            .format(period['value'],  (start_hour,end_hour))
             )
     plot_results_time_series_1scenario(input_data,1,start_hour,end_hour)  # to storage min for 2 weeks
 
-    
        
 #%%
 #==============================================================================
@@ -683,7 +826,18 @@ def plot_results_time_series_1scenario (input_data, hours_to_avg = None, start_h
     results_matrix_dispatch = copy.deepcopy(input_data['results_matrix_dispatch'])
     results_matrix_demand = copy.deepcopy(input_data['results_matrix_demand'])
     results_matrix_curtailment = copy.deepcopy(input_data['results_matrix_curtailment'])
-    pdf_each = input_data['pdf_each']
+    figure_cache_dir = input_data.get('figure_cache_dir')
+    if figure_cache_dir is not None:
+        # with the figure cache, each page is a file named by its inputs
+        page_file_name = (figure_cache_dir + '/' + input_data['CASE_NAME'] + '_'
+                          + figure_cache_key(input_data,hours_to_avg,start_hour,end_hour) + '.pdf')
+        input_data['page_file_list'].append(page_file_name)
+        if os.path.exists(page_file_name):
+            return # page is unchanged
+        page_temp_file_name = page_file_name + '.' + str(os.getpid()) + '.tmp'
+        pdf_each = PdfPages(page_temp_file_name)
+    else:
+        pdf_each = input_data['pdf_each']
     legend_list_dispatch = input_data['legend_list_dispatch']
     legend_list_demand = input_data['legend_list_demand']
     legend_list_curtailment = input_data['legend_list_curtailment']
@@ -697,14 +851,10 @@ def plot_results_time_series_1scenario (input_data, hours_to_avg = None, start_h
     if hours_to_avg != None:
         if hours_to_avg > 1:
             avg_label = ' ' + str(hours_to_avg) + ' hr moving avg'
-            for i in xrange(results_matrix_dispatch.shape[1]):
-                results_matrix_dispatch [:,i] = func_time_conversion(results_matrix_dispatch[:,i],hours_to_avg)
-    
-            for i in xrange(results_matrix_demand.shape[1]):
-                results_matrix_demand [:,i] = func_time_conversion(results_matrix_demand[:,i],hours_to_avg)
-    
-            for i in xrange(results_matrix_curtailment.shape[1]):
-                results_matrix_curtailment [:,i] = func_time_conversion(results_matrix_curtailment[:,i],hours_to_avg)
+            # all columns of each matrix are averaged in one call
+            results_matrix_dispatch = func_time_conversion(results_matrix_dispatch,hours_to_avg)
+            results_matrix_demand = func_time_conversion(results_matrix_demand,hours_to_avg)
+            results_matrix_curtailment = func_time_conversion(results_matrix_curtailment,hours_to_avg)
 
             demand = func_time_conversion(demand,hours_to_avg)
             
@@ -783,6 +933,7 @@ def plot_results_time_series_1scenario (input_data, hours_to_avg = None, start_h
         'line_width':       0.5,
         'line_width_z':     0.2,
         'grid_option':      0,
+        'max_points':       input_data.get('max_points',0),
         }        
 
     ax1a.set_ylim([0, input_data['max_dispatch']])
@@ -832,6 +983,7 @@ def plot_results_time_series_1scenario (input_data, hours_to_avg = None, start_h
         'line_width':       0.5,
         #'line_width_z':     0.2,
         'grid_option':      0,
+        'max_points':       input_data.get('max_points',0),
         } 
           
     ax1c.set_ylim([0, input_data['max_dispatch']])
@@ -873,6 +1025,7 @@ def plot_results_time_series_1scenario (input_data, hours_to_avg = None, start_h
         'line_width':       0.5,
         #'line_width_z':     0.2,
         'grid_option':      0,
+        'max_points':       input_data.get('max_points',0),
         } 
           
     ax1e.set_ylim([0, input_data['max_dispatch']])
@@ -897,6 +1050,9 @@ def plot_results_time_series_1scenario (input_data, hours_to_avg = None, start_h
     plt.suptitle(input_data['page_title'])
     plt.tight_layout(rect=[0,0,0.75,0.975])
     pdf_each.savefig(figure1a)
+    if figure_cache_dir is not None:
+        pdf_each.close()
+        os.rename(page_temp_file_name, page_file_name) # complete pages only
     #plt.close()
     
     #pdf_each.savefig(figure1b)
@@ -1111,10 +1267,7 @@ def func_graphics_dispatch_var_Nscenarios (input_data):
     temporal_scale = 24
     x_data = np.arange(0, optimization_time_steps)
     
-    results_matrix_dispatch1 = np.zeros(results_matrix_dispatch.shape)
-    
-    for i in xrange(results_matrix_dispatch.shape[1]):
-        results_matrix_dispatch1 [:,i] = func_time_conversion(results_matrix_dispatch[:,i],temporal_scale)
+    results_matrix_dispatch1 = func_time_conversion(results_matrix_dispatch,temporal_scale)
     
     # -------------------------
     
@@ -1188,11 +1341,7 @@ def func_graphics_dispatch_var_Nscenarios (input_data):
     temporal_scale = 24 * 7
     x_data = np.arange(0, optimization_time_steps)
     
-    results_matrix_dispatch1 = np.zeros(results_matrix_dispatch.shape)
-    
-    for i in xrange(results_matrix_dispatch.shape[1]):
-        results_matrix_dispatch1 [:,i] = \
-            func_time_conversion(results_matrix_dispatch[:,i],temporal_scale)
+    results_matrix_dispatch1 = func_time_conversion(results_matrix_dispatch,temporal_scale)
     
     # -------------------------
     
@@ -12,6 +12,8 @@ save basic results for the simple energy model
 
 
 import os
+import re
+import copy
 import numpy as np
 import csv
 import datetime
@@ -67,6 +69,54 @@ def save_basic_results(global_dic, case_dic_list, result_list ):
     
     return scalar_names,scalar_table
 
+# Combine results pickled by separate runs of the same case input file (for
+# example, shards run on different nodes) into one set of results, put back in
+# case input order by CASE_INDEX, and save them as save_basic_results() does.
+# Cases without CASE_INDEX (pickled before it existed) are keyed by their run
+# and position in that run, and follow the indexed cases in that order.
+# If global_name is None, the shard suffix is dropped from the first run's name.
+def merge_results(pickle_file_name_list, output_path = None, global_name = None):
+    
+    global_dic = None
+    case_dic_list = []
+    result_list = []
+    case_key_list = []
+    case_key_set = set() # for the duplicate check
+    for run_index, pickle_file_name in enumerate(pickle_file_name_list):
+        with open(pickle_file_name, 'rb') as db:
+            run_global_dic, run_case_dic_list, run_result_list = pickle.load(db)
+        if global_dic is None:
+            global_dic = copy.copy(run_global_dic)
+        for row, (case_dic, result) in enumerate(zip(run_case_dic_list, run_result_list)):
+            if 'CASE_INDEX' in case_dic:
+                case_key = (0, case_dic['CASE_INDEX'])
+            else:
+                case_key = (1, run_index, row)
+            if case_key in case_key_set:
+                print 'Save_Basic_Results.py: case ' + case_dic['CASE_NAME'] + ' in more than one run, ' + pickle_file_name + ' ignored'
+                continue
+            case_key_list.append(case_key)
+            case_key_set.add(case_key)
+            case_dic_list.append(case_dic)
+            result_list.append(result)
+    
+    order = sorted(range(len(case_key_list)), key = lambda i: case_key_list[i])
+    case_dic_list = [case_dic_list[i] for i in order]
+    result_list = [result_list[i] for i in order]
+    
+    if output_path is not None:
+        global_dic['OUTPUT_PATH'] = output_path
+    if global_name is not None:
+        global_dic['GLOBAL_NAME'] = global_name
+    else:
+        global_dic['GLOBAL_NAME'] = re.sub('_shard[0-9]+of[0-9]+$', '', global_dic['GLOBAL_NAME'])
+    
+    if global_dic['VERBOSE']:
+        print 'Save_Basic_Results.py: merged ' + str(len(case_dic_list)) + ' cases from ' + str(len(pickle_file_name_list)) + ' runs'
+    save_basic_results(global_dic, case_dic_list, result_list)
+    
+    return global_dic, case_dic_list, result_list
+
 # save results by case
 def save_vector_results_as_csv( global_dic, case_dic_list, result_list ):
     
@@ -134,7 +184,22 @@ def save_vector_results_as_csv( global_dic, case_dic_list, result_list ):
         
         header_list += ['dispatch_unmet_demand (kW)']
         series_list.append( result['DISPATCH_UNMET_DEMAND'].flatten() )
-         
+
+        # hourly shadow prices from the LP duals (Core_Model.py)
+        if 'PRICE_ELECTRICITY' in result:
+            header_list += ['price_electricity ($/kWh)']
+            series_list.append( result['PRICE_ELECTRICITY'].flatten() )
+            header_list += ['price_storage ($/kWh)']
+            series_list.append( result['PRICE_STORAGE'].flatten() )
+            header_list += ['price_pgp_storage ($/kWh)']
+            series_list.append( result['PRICE_PGP_STORAGE'].flatten() )
+
+        # hourly costs from Cost_Model.py, if cost attribution was run
+        if 'COST_STORAGE_PERHOUR' in result:
+            for component in ['NATGAS','SOLAR','WIND','NUCLEAR','UNMET_DEMAND','STORAGE','PGP_STORAGE']:
+                header_list += ['cost_' + component.lower() + ' ($/h)']
+                series_list.append( np.array(result['COST_' + component + '_PERHOUR']).flatten() )
+
         output_file_name = case_dic['CASE_NAME']
     
         with contextlib.closing(open(output_folder + "/" + output_file_name + '.csv', 'wb')) as output_file:
@@ -199,8 +264,36 @@ def postprocess_key_scalar_results( global_dic, case_dic_list, result_list ):
             'dispatch_to_pgp_storage (kW)',
             'dispatch_pgp_storage (kW)',
             'energy_pgp_storage (kWh)',
-            'dispatch_unmet_demand (kW)'
+            'dispatch_unmet_demand (kW)',
+            
+            'price_electricity ($/kWh)',
+            'reduced_cost_capacity_natgas ($/kW/h)',
+            'reduced_cost_capacity_solar ($/kW/h)',
+            'reduced_cost_capacity_wind ($/kW/h)',
+            'reduced_cost_capacity_nuclear ($/kW/h)',
+            'reduced_cost_capacity_storage (($/h)/kWh)',
+            'reduced_cost_capacity_pgp_storage (($/h)/kWh)',
+            'reduced_cost_capacity_to_pgp_storage ($/kW/h)',
+            'reduced_cost_capacity_from_pgp_storage ($/kW/h)',
             
+            'numerics_cost_scaling',
+            'numerics_demand_scaling',
+            'numerics_objective_range',
+            'numerics_rhs_range',
+            'numerics_matrix_range',
+            
+            'verify_max_residual',
+            'verify_violation',
+            'verify_energy_balance_max',
+            'verify_energy_balance_mean',
+            'verify_storage_continuity_max',
+            'verify_storage_continuity_mean',
+            'verify_pgp_storage_continuity_max',
+            'verify_pgp_storage_continuity_mean',
+            'verify_capacity_max',
+            'verify_capacity_mean',
+            'verify_nonnegativity_max',
+            'verify_nonnegativity_mean'
             
             ]
 
@@ -261,8 +354,42 @@ def postprocess_key_scalar_results( global_dic, case_dic_list, result_list ):
                     np.average(d['DISPATCH_TO_PGP_STORAGE']),
                     np.average(d['DISPATCH_FROM_PGP_STORAGE']),
                     np.average(d['ENERGY_PGP_STORAGE']),
-                    np.average(d['DISPATCH_UNMET_DEMAND'])
+                    np.average(d['DISPATCH_UNMET_DEMAND']),
+                    
+                    # shadow prices and reduced costs (not in results saved before they were added)
+                    
+                    np.average(d.get('PRICE_ELECTRICITY', np.nan)),
+                    d.get('REDUCED_COST_CAPACITY_NATGAS', np.nan),
+                    d.get('REDUCED_COST_CAPACITY_SOLAR', np.nan),
+                    d.get('REDUCED_COST_CAPACITY_WIND', np.nan),
+                    d.get('REDUCED_COST_CAPACITY_NUCLEAR', np.nan),
+                    d.get('REDUCED_COST_CAPACITY_STORAGE', np.nan),
+                    d.get('REDUCED_COST_CAPACITY_PGP_STORAGE', np.nan),
+                    d.get('REDUCED_COST_CAPACITY_TO_PGP_STORAGE', np.nan),
+                    d.get('REDUCED_COST_CAPACITY_FROM_PGP_STORAGE', np.nan),
+                    
+                    # scaling used in the solve, and ratio of largest to smallest coefficient
+                    
+                    d.get('NUMERICS_COST_SCALING', np.nan),
+                    d.get('NUMERICS_DEMAND_SCALING', np.nan),
+                    d.get('NUMERICS_OBJECTIVE_RANGE', np.nan),
+                    d.get('NUMERICS_RHS_RANGE', np.nan),
+                    d.get('NUMERICS_MATRIX_RANGE', np.nan),
+                    
+                    # residuals of the solution relative to mean demand (Core_Model.verify_solution)
                     
+                    d.get('VERIFY_MAX_RESIDUAL', np.nan),
+                    d.get('VERIFY_VIOLATION', np.nan),
+                    d.get('VERIFY_ENERGY_BALANCE_MAX', np.nan),
+                    d.get('VERIFY_ENERGY_BALANCE_MEAN', np.nan),
+                    d.get('VERIFY_STORAGE_CONTINUITY_MAX', np.nan),
+                    d.get('VERIFY_STORAGE_CONTINUITY_MEAN', np.nan),
+                    d.get('VERIFY_PGP_STORAGE_CONTINUITY_MAX', np.nan),
+                    d.get('VERIFY_PGP_STORAGE_CONTINUITY_MEAN', np.nan),
+                    d.get('VERIFY_CAPACITY_MAX', np.nan),
+                    d.get('VERIFY_CAPACITY_MEAN', np.nan),
+                    d.get('VERIFY_NONNEGATIVITY_MAX', np.nan),
+                    d.get('VERIFY_NONNEGATIVITY_MEAN', np.nan)
                     
              ]
             for d in combined_dic
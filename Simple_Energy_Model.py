@@ -8,15 +8,52 @@
   
   The format of this file is documented in the file called <case_input.csv>.
   
+  Command line use:
+  
+    python Simple_Energy_Model.py [run] [case_input.csv] [options]
+        --output-path PATH, --global-name NAME   override the global settings
+        --case-name NAME (repeatable), --case-range START:STOP,
+        --case-regex PATTERN                     run only the selected cases
+        --shard I/N                              run every N-th selected case,
+                                                 starting with the I-th (0 ... N-1)
+    
+    python Simple_Energy_Model.py merge RUN.pickle ... [--output-path PATH]
+        [--global-name NAME]
+        combine the results of several runs (e.g. the N shards) into one
+    
+    python Simple_Energy_Model.py enqueue [case_input.csv] --queue QUEUE.db
+        [--history HISTORY.db] [case selection options as for run]
+    python Simple_Energy_Model.py worker --queue QUEUE.db [--lease SECONDS]
+        [--max-attempts N]
+    python Simple_Energy_Model.py collect --queue QUEUE.db [--history HISTORY.db]
+        [--output-path PATH] [--global-name NAME] [--max-attempts N]
+        run the cases through a work queue (see Work_Queue.py): fill the queue,
+        start workers on any number of nodes, then collect the results
+    
+    python Simple_Energy_Model.py adaptive [case_input.csv] --keyword NAME LOW HIGH ...
+        [--case-name BASE] [--points N] [--tolerance TOL] [--budget N]
+        [--min-cell-width FRACTION] [--result-key KEY ...] [--output-path PATH] [--global-name NAME]
+        adaptive sweep around one base case (see Adaptive_Sweep.py)
+    
+    python Simple_Energy_Model.py replay CASE.mps ... [--solver NAME ...]
+        [--repeats N] [--output TIMINGS.csv] [--solver-option OPTION ...]
+        solve LP files written with EXPORT_LP and record the solve times
+        (see Export_LP.py)
+    
+    python Simple_Energy_Model.py serve [case_input.csv] [--host HOST] [--port PORT]
+        answer what-if questions about the cases over HTTP (see Model_Server.py)
+  
 '''
 
 
+import argparse
+import sys
 from Core_Model import core_model_loop
-from Preprocess_Input import preprocess_input
-from Postprocess_Results import post_process
+from Preprocess_Input import preprocess_input, select_cases
 #from Postprocess_Results_kc180214 import postprocess_key_scalar_results,merge_two_dicts
-from Save_Basic_Results import save_basic_results
-from Quick_Look import quick_look
+from Save_Basic_Results import save_basic_results, merge_results
+# Postprocess_Results and Quick_Look are imported in main() only when they are
+# used, as they import matplotlib, which is slow to load.
  
 # directory = 'D:/M/WORK/'
 #root_directory = '/Users/kcaldeira/Google Drive/simple energy system model/Kens version/'
@@ -28,22 +65,188 @@ case_input_path_filename = './case_input.csv'
 # -----------------------------------------------------------------------------
 # =============================================================================
 
-print 'Simple_Energy_Model: Pre-processing input'
-global_dic,case_dic_list = preprocess_input(case_input_path_filename)
+def prepare_cases(case_input_path_filename = case_input_path_filename, output_path = None, global_name = None,
+                  case_name_list = None, index_range = None, name_pattern = None, shard = None):
+
+    print 'Simple_Energy_Model: Pre-processing input'
+    global_dic,case_dic_list = preprocess_input(case_input_path_filename)
+    
+    case_dic_list = select_cases(case_dic_list, case_name_list, index_range, name_pattern, shard)
+    if output_path is not None:
+        global_dic['OUTPUT_PATH'] = output_path
+    if global_name is not None:
+        global_dic['GLOBAL_NAME'] = global_name
+    elif shard is not None:
+        # so that shards sharing an output folder do not overwrite each other
+        global_dic['GLOBAL_NAME'] = global_dic['GLOBAL_NAME'] + '_shard{}of{}'.format(shard[0], shard[1])
+    
+    return global_dic, case_dic_list
+
+def run_model(case_input_path_filename = case_input_path_filename, output_path = None, global_name = None,
+              case_name_list = None, index_range = None, name_pattern = None, shard = None):
+
+    global_dic, case_dic_list = prepare_cases(case_input_path_filename, output_path, global_name,
+                                              case_name_list, index_range, name_pattern, shard)
+    
+    print 'Simple_Energy_Model: Executing core model loop'
+    result_list = core_model_loop (global_dic, case_dic_list)
+    if not global_dic['SOLVE']:
+        return global_dic, case_dic_list, None # cases only exported (EXPORT_LP)
+    
+    print 'Simple_Energy_Model: Saving basic results'
+    scalar_names,scalar_table = save_basic_results(global_dic, case_dic_list, result_list)
+    
+    plot_results(global_dic)
+    
+    return global_dic, case_dic_list, result_list
 
-print 'Simple_Energy_Model: Executing core model loop'
-result_list = core_model_loop (global_dic, case_dic_list)
+def plot_results(global_dic):
+    
+    if global_dic['POSTPROCESS']:
+        from Postprocess_Results import post_process
+        print 'Simple_Energy_Model: Post-processing results'
+        post_process(global_dic)  # Lei's old postprocessing
+    
+    if global_dic['QUICK_LOOK']:
+        from Quick_Look import quick_look
+        print 'Simple_Energy_Model: Preparing quick look at results'
+        pickle_file_name = global_dic['OUTPUT_PATH']+'/'+global_dic['GLOBAL_NAME']+'/'+global_dic['GLOBAL_NAME']+'.pickle'
+        quick_look(pickle_file_name)  # Fan's new postprocessing
 
-print 'Simple_Energy_Model: Saving basic results'
-scalar_names,scalar_table = save_basic_results(global_dic, case_dic_list, result_list)
+def parse_index_range(text):
+    # 'START:STOP', either may be left out
+    start, stop = text.split(':')
+    if start == '':
+        start = 0
+    if stop == '':
+        stop = sys.maxint
+    return int(start), int(stop)
 
-if global_dic['POSTPROCESS']:
-    print 'Simple_Energy_Model: Post-processing results'
-    post_process(global_dic)  # Lei's old postprocessing
+def parse_shard(text):
+    # 'I/N'
+    shard_index, num_shards = [int(x) for x in text.split('/')]
+    if not 0 <= shard_index < num_shards:
+        raise argparse.ArgumentTypeError('shard must be I/N with 0 <= I < N')
+    return shard_index, num_shards
 
-if global_dic['QUICK_LOOK']:
-    print 'Simple_Energy_Model: Preparing quick look at results'
-    pickle_file_name = './Output_Data/'+global_dic['GLOBAL_NAME']+'/'+global_dic['GLOBAL_NAME']+'.pickle'
-    quick_look(pickle_file_name)  # Fan's new postprocessing
+def main(argv = None):
+    
+    if argv is None:
+        argv = sys.argv[1:]
+    command_list = ['run','merge','enqueue','worker','collect','adaptive','replay','serve']
+    if len(argv) == 0 or (argv[0] not in command_list and argv[0] not in ['-h','--help']):
+        argv = ['run'] + list(argv) # run is the default command
+    
+    parser = argparse.ArgumentParser(description = 'Simple Energy Model')
+    subparsers = parser.add_subparsers(dest = 'command')
+    
+    run_parser = subparsers.add_parser('run', help = 'run the cases in a case input file')
+    enqueue_parser = subparsers.add_parser('enqueue', help = 'put the cases in a case input file in a work queue')
+    for case_parser in [run_parser, enqueue_parser]:
+        case_parser.add_argument('case_input', nargs = '?', default = case_input_path_filename)
+        case_parser.add_argument('--output-path', default = None)
+        case_parser.add_argument('--global-name', default = None)
+        case_parser.add_argument('--case-name', action = 'append', default = None)
+        case_parser.add_argument('--case-range', type = parse_index_range, default = None)
+        case_parser.add_argument('--case-regex', default = None)
+        case_parser.add_argument('--shard', type = parse_shard, default = None)
+    enqueue_parser.add_argument('--queue', required = True)
+    enqueue_parser.add_argument('--history', default = None)
+    
+    worker_parser = subparsers.add_parser('worker', help = 'solve cases from a work queue until it is empty')
+    worker_parser.add_argument('--queue', required = True)
+    worker_parser.add_argument('--lease', type = float, default = 600.)
+    worker_parser.add_argument('--max-attempts', type = int, default = 3)
+    
+    collect_parser = subparsers.add_parser('collect', help = 'save the results from a finished work queue')
+    collect_parser.add_argument('--queue', required = True)
+    collect_parser.add_argument('--history', default = None)
+    collect_parser.add_argument('--output-path', default = None)
+    collect_parser.add_argument('--global-name', default = None)
+    collect_parser.add_argument('--max-attempts', type = int, default = 3)
+    
+    merge_parser = subparsers.add_parser('merge', help = 'combine the results (pickle files) of several runs')
+    merge_parser.add_argument('pickle_file', nargs = '+')
+    merge_parser.add_argument('--output-path', default = None)
+    merge_parser.add_argument('--global-name', default = None)
+    
+    adaptive_parser = subparsers.add_parser('adaptive', help = 'adaptive sweep around one case of a case input file')
+    adaptive_parser.add_argument('case_input', nargs = '?', default = case_input_path_filename)
+    adaptive_parser.add_argument('--case-name', default = None) # base case, the first case by default
+    adaptive_parser.add_argument('--keyword', nargs = 3, action = 'append', required = True,
+                                 metavar = ('NAME','LOW','HIGH'))
+    adaptive_parser.add_argument('--points', type = int, default = 3)
+    adaptive_parser.add_argument('--tolerance', type = float, default = 0.05)
+    adaptive_parser.add_argument('--budget', type = int, default = 200)
+    adaptive_parser.add_argument('--min-cell-width', type = float, default = 0.01)
+    adaptive_parser.add_argument('--result-key', action = 'append', default = None)
+    adaptive_parser.add_argument('--output-path', default = None)
+    adaptive_parser.add_argument('--global-name', default = None)
+    
+    replay_parser = subparsers.add_parser('replay', help = 'solve exported LP files and record solve times')
+    replay_parser.add_argument('model_file', nargs = '+')
+    replay_parser.add_argument('--solver', action = 'append', default = None) # all installed solvers by default
+    replay_parser.add_argument('--repeats', type = int, default = 1)
+    replay_parser.add_argument('--output', default = 'replay_timings.csv')
+    replay_parser.add_argument('--solver-option', action = 'append', default = None)
+    
+    serve_parser = subparsers.add_parser('serve', help = 'answer what-if questions about the cases over HTTP')
+    serve_parser.add_argument('case_input', nargs = '?', default = case_input_path_filename)
+    serve_parser.add_argument('--host', default = '127.0.0.1')
+    serve_parser.add_argument('--port', type = int, default = 8765)
+    
+    args = parser.parse_args(argv)
     
+    if args.command == 'run':
+        return run_model(args.case_input, args.output_path, args.global_name,
+                         args.case_name, args.case_range, args.case_regex, args.shard)
+    elif args.command == 'merge':
+        print 'Simple_Energy_Model: Merging results'
+        global_dic, case_dic_list, result_list = merge_results(args.pickle_file, args.output_path, args.global_name)
+        plot_results(global_dic)
+        return global_dic, case_dic_list, result_list
+    elif args.command == 'enqueue':
+        from Work_Queue import enqueue_cases
+        global_dic, case_dic_list = prepare_cases(args.case_input, args.output_path, args.global_name,
+                                                  args.case_name, args.case_range, args.case_regex, args.shard)
+        enqueue_cases(args.queue, global_dic, case_dic_list, args.history)
+    elif args.command == 'worker':
+        from Work_Queue import run_worker
+        run_worker(args.queue, lease_time = args.lease, max_attempts = args.max_attempts)
+    elif args.command == 'collect':
+        from Work_Queue import collect_results
+        print 'Simple_Energy_Model: Collecting results from work queue'
+        collected = collect_results(args.queue, args.output_path, args.global_name, args.history,
+                                    args.max_attempts)
+        if collected is not None:
+            plot_results(collected[0])
+        return collected
+    elif args.command == 'adaptive':
+        from Adaptive_Sweep import adaptive_sweep, adaptive_result_key_list
+        case_name_list = None
+        if args.case_name is not None:
+            case_name_list = [args.case_name]
+        global_dic, case_dic_list = prepare_cases(args.case_input, args.output_path, args.global_name, case_name_list)
+        if len(case_dic_list) == 0:
+            if args.case_name is not None:
+                adaptive_parser.error('no case named ' + args.case_name + ' in ' + args.case_input)
+            adaptive_parser.error('no cases in ' + args.case_input)
+        keyword_range_list = [(str.upper(name), float(low), float(high)) for name, low, high in args.keyword]
+        result_key_list = adaptive_result_key_list
+        if args.result_key is not None:
+            result_key_list = [str.upper(key) for key in args.result_key]
+        print 'Simple_Energy_Model: Running adaptive sweep'
+        case_dic_list, result_list = adaptive_sweep(global_dic, case_dic_list[0], keyword_range_list, args.points,
+                                                    args.tolerance, args.budget, result_key_list,
+                                                    args.min_cell_width)
+        plot_results(global_dic)
+        return global_dic, case_dic_list, result_list
+    elif args.command == 'replay':
+        from Export_LP import replay_lp
+        return replay_lp(args.model_file, args.solver, args.output, args.repeats, args.solver_option)
+    elif args.command == 'serve':
+        from Model_Server import serve_model
+        serve_model(args.case_input, args.host, args.port)
 
+if __name__ == '__main__':
+    main()
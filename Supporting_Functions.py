@@ -12,8 +12,17 @@ Functions defined
     func_load_optimization_results()
     func_time_conversion()
     func_time_conversion()
+    func_rolling_extreme()
     func_change_in_period()
     func_find_period()
+    func_find_periods()
+    func_range_max_table()
+    func_range_max_query()
+    func_sweep_grid()
+    func_sweep_slice()
+    func_sweep_order()
+    func_lttb_index()
+    func_envelope_index()
     func_lines_plot()
     func_lines_2yaxes_plot()
     func_stack_plot()
@@ -165,14 +174,15 @@ def func_load_optimization_results(optimization_results_file_path):
 #   calculate key statistics of the input_data in a moving window (rolling basis)
 #
 # Input
-#   input_data [one dimentional]
+#   input_data [one or two dimentional] time series, or a matrix (time x
+#       columns) of time series that are all converted at once
 #   window_size [scalar] the length/size of the moving window
 #   operation_type <string> there are a number of downscale operations (namely,
 #       how to select a 'representative/aggregate' from a set of data)
 #
 # Output
-#   output_data [one dimentional] data that consists of key statistics calculated
-#   for the moving window around each time step.
+#   output_data [same dimension as input_data] data that consists of key
+#   statistics calculated for the moving window around each time step.
 #
 # History
 #   Dec, 2017 started and finished the code.    
@@ -209,42 +219,103 @@ def func_load_optimization_results(optimization_results_file_path):
 # -----------------------------------------------------------------------------
 def func_time_conversion (input_data, window_size, operation_type = 'mean'):
     
-    # NOTE: THIS FUNCTION HAS ONLY BEEN VERIFIED FOR PROPER WRAP-AROUND BEHAVIOR
-    #       FOR 'mean'
     # For odd windows sizes, easy. For even need to consider ends where you have half hour of data.
-
-    N_periods = len(input_data)
-    input_data_x3 = np.concatenate((input_data,input_data,input_data))
+    #   odd window_size = 2h+1:  statistics over data[i-h : i+h+1]
+    #   even window_size = 2h:   'mean' and 'sum' take data[i-h : i+h] plus half of
+    #                            data[i-h-1] and half of data[i+h+1];
+    #                            'min' and 'max' take data[i-h-1 : i+h+1]
+    # Indices wrap around the ends of the time series.
+    #
+    # input_data can be one dimentional or two dimentional (time x columns); all
+    # columns are done at once. 'mean' and 'sum' use a cumulative sum and 'min'
+    # and 'max' use func_rolling_extreme(), so the cost does not grow with window_size.
+
+    data = np.asarray(input_data, dtype = float)
+    one_dimensional = (data.ndim == 1)
+    if one_dimensional:
+        data = data[:, np.newaxis]
+    N_periods = data.shape[0]
     
     half_size = window_size / 2.
     half_size_full = int(half_size) # number of full things for the mean
+    odd_window = (half_size != float (half_size_full))
+
+    # pad both ends with wrapped data: data_padded[k] == data[(k - pad) % N_periods]
+    pad = half_size_full + 2
+    data_padded = data[np.arange(-pad, N_periods + pad) % N_periods]
+    ii = np.arange(N_periods) + pad # position of each time step in data_padded
+
+    if operation_type == 'mean' or operation_type == 'sum':
+        cum_data = np.zeros((data_padded.shape[0] + 1, data_padded.shape[1]))
+        cum_data[1:] = np.cumsum(data_padded, axis = 0) # sum of data_padded[a:b] is cum_data[b] - cum_data[a]
+        if odd_window:
+            output_data = cum_data[ii + half_size_full + 1] - cum_data[ii - half_size_full]
+        else: # even number need to include half of last ones
+            output_data = ( cum_data[ii + half_size_full] - cum_data[ii - half_size_full]
+                    + data_padded[ii - half_size_full - 1] * 0.5 + data_padded[ii + half_size_full + 1] * 0.5 )
+        if operation_type == 'mean':
+            output_data = output_data / window_size
+    elif operation_type == 'min' or operation_type == 'max':
+        if odd_window:
+            rolling_extreme = func_rolling_extreme(data_padded, 2 * half_size_full + 1, operation_type)
+            output_data = rolling_extreme[ii - half_size_full]
+        else:
+            rolling_extreme = func_rolling_extreme(data_padded, 2 * half_size_full + 2, operation_type)
+            output_data = rolling_extreme[ii - half_size_full - 1]
+    else:
+        output_data = np.zeros(data.shape)
+    
+    if one_dimensional:
+        output_data = output_data[:,0]
+    return output_data
+
+#%%
+# -----------------------------------------------------------------------------
+# func_rolling_extreme()
+#
+# Function
+#   minimum or maximum over every window of a fixed length, along the first
+#   axis, in O(n) for any window length (van Herk / Gil-Werman algorithm: the
+#   data are cut into blocks of window length; each window covers the end of
+#   one block and the start of the next, whose running extremes are computed
+#   with two accumulate calls)
+#
+# Input
+#   input_data [one or two dimentional] data (time x columns)
+#   window_length [integer] number of points in each window
+#   operation_type <string> 'min' or 'max'
+#
+# Output
+#   output_data [same dimension] output_data[k] is the extreme of
+#       input_data[k : k + window_length]; the length is reduced by
+#       window_length - 1
+#
+# -----------------------------------------------------------------------------
 
-    output_data = np.zeros(len(input_data))
+def func_rolling_extreme (input_data, window_length, operation_type = 'max'):
+    
+    data = np.asarray(input_data, dtype = float)
+    window_length = int(window_length)
+    if operation_type == 'min':
+        func_extreme = np.minimum
+        fill_value = np.inf
+    else:
+        func_extreme = np.maximum
+        fill_value = -np.inf
+    
+    N_periods = data.shape[0]
+    num_blocks = int(np.ceil(N_periods / float(window_length)))
+    data_blocks = np.full((num_blocks * window_length,) + data.shape[1:], fill_value)
+    data_blocks[:N_periods] = data
+    data_blocks = data_blocks.reshape((num_blocks, window_length) + data.shape[1:])
+    
+    # running extreme from the start of each block, and to the end of each block
+    prefix = func_extreme.accumulate(data_blocks, axis = 1).reshape((-1,) + data.shape[1:])
+    suffix = func_extreme.accumulate(data_blocks[:, ::-1], axis = 1)[:, ::-1].reshape((-1,) + data.shape[1:])
+    
+    num_windows = N_periods - window_length + 1
+    output_data = func_extreme(suffix[:num_windows], prefix[window_length - 1 : window_length - 1 + num_windows])
     
-    for ii in range(len(output_data)):
-        if half_size != float (half_size_full): # odd number, easy
-            if (operation_type == 'mean'):
-                output_data[ii] = np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full + 1 ])/ float(window_size)
-            elif(operation_type == 'min'):
-                output_data[ii] = np.min(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full + 1 ])
-            elif(operation_type == 'max'):
-                output_data[ii] = np.max(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full  + 1])
-            elif(operation_type == 'sum'):
-                output_data[ii] = np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full  + 1])
-        else: # even number need to include half of last ones
-            if (operation_type == 'mean'):
-                output_data[ii] = ( np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full ])  \
-                        + input_data_x3[N_periods + ii - half_size_full -1 ] *0.5 +  input_data_x3[N_periods + ii + half_size_full + 1 ] *0.5) / window_size
-            elif(operation_type == 'min'):
-                output_data[ii] = np.min(input_data_x3[N_periods + ii - half_size_full -1 : N_periods + ii + half_size_full + 1 ])
-            elif(operation_type == 'max'):
-                output_data[ii] = np.max(input_data_x3[N_periods + ii - half_size_full -1 : N_periods + ii + half_size_full + 1 ])
-            elif(operation_type == 'sum'):
-                output_data[ii] = (
-                        np.sum(input_data_x3[N_periods + ii - half_size_full : N_periods + ii + half_size_full ]) 
-                        + input_data_x3[N_periods + ii - half_size_full -1 ] *0.5 +  input_data_x3[N_periods + ii + half_size_full + 1 ] *0.5
-                        ) 
-        
     return output_data
 
 def func_change_in_period (input_data, window_size):
@@ -295,62 +366,519 @@ def func_change_in_period (input_data, window_size):
 
 def func_find_period (input_data):
     
-    window_size = input_data['window_size']
-    eff_window_size = copy.deepcopy(window_size) # If even go up to next odd number
-    if eff_window_size == 2 * int (eff_window_size /2 ):  # check if even
-        eff_window_size = eff_window_size + 1             # if so, add 1
-    data = input_data['data']
-    search_option = input_data['search_option']
-    print_option = input_data['print_option']
-    
-    # -------------------------------------------------------------------------
-    
-    # Get the down-scaled data
-    
-    data_in_window = func_time_conversion(data, eff_window_size, 'mean')
-    
-    # -------------------------------------------------------------------------
+    # one column, one window size, one search option and one period
+    study_variable_dict = {
+            'data':             np.asarray(input_data['data'], dtype = float),
+            'window_size_list': [input_data['window_size']],
+            'search_option':    input_data['search_option'],
+            'num_periods':      1,
+            'print_option':     input_data['print_option']
+            }
+    period = func_find_periods(study_variable_dict)[0]
     
-    if search_option == 'max':
+    output = {
+        'value':        period['value'],
+        'left_index':   period['left_index'],
+        'right_index':  period['right_index'],
+        'center_index': period['center_index'],
+        }
+
+    return output
+
+#%%
+# -----------------------------------------------------------------------------
+# func_find_periods()
+#
+# Function
+#   batched version of func_find_period(): for every column of a matrix, every
+#   window size and every search option, find the top num_periods windows that
+#   do not overlap (the first one is the same window func_find_period() finds)
+#
+# Input
+#   input_data, a DICT variable that has the following keys
+#       data <np.array> (time x columns) the data to be studied
+#       window_size_list <list> window sizes
+#       search_option <string or list> 'max', 'min', or a list of these
+#       num_periods [scalar] number of non-overlapping periods to find
+#           (optional, default 1)
+#       print_option <integer> treated as a logical variable (optional)
+#
+# Output
+#   output_data <list> of DICT variables, one per period found, with keys
+#       column, window_size, search_option, rank (0 is the most extreme)
+#       value, left_index, right_index, center_index (as in func_find_period())
+#
+# Note
+#   The rolling mean of all columns is computed once per window size.
+#   Periods are chosen greedily in order of the rolling mean; a period is
+#       skipped if it would overlap a period already chosen.
+#
+# -----------------------------------------------------------------------------
+
+def func_find_periods (input_data):
+    
+    data = np.asarray(input_data['data'], dtype = float)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    window_size_list = input_data['window_size_list']
+    search_option_list = input_data['search_option']
+    if isinstance(search_option_list, str):
+        search_option_list = [search_option_list]
+    num_periods = input_data.get('num_periods', 1)
+    print_option = input_data.get('print_option', 0)
+    N_periods = data.shape[0]
+    
+    output = []
+    for window_size in window_size_list:
+        eff_window_size = copy.deepcopy(window_size) # If even go up to next odd number
+        if eff_window_size == 2 * int (eff_window_size /2 ):  # check if even
+            eff_window_size = eff_window_size + 1             # if so, add 1
+        half_window = int(eff_window_size/2)
         
-        center_index = int(np.argmax(data_in_window))
-        value = np.max(data_in_window)
+        # Get the down-scaled data, all columns at once
+        data_in_window = func_time_conversion(data, eff_window_size, 'mean')
         
-    elif search_option == 'min':
+        for search_option in search_option_list:
+            # stable sort, so ties are broken by the first index as in np.argmax()
+            if search_option == 'max':
+                order = np.argsort(-data_in_window, axis = 0, kind = 'mergesort')
+            elif search_option == 'min':
+                order = np.argsort(data_in_window, axis = 0, kind = 'mergesort')
+            
+            # If interval would go over boundary, then move inteval
+            center_order = np.clip(order, half_window, N_periods - 1 - half_window)
+            
+            for column in range(data.shape[1]):
+                center_list = []
+                for position in range(N_periods):
+                    if len(center_list) == num_periods:
+                        break
+                    center_index = int(center_order[position, column])
+                    if any(abs(center_index - center) < eff_window_size for center in center_list):
+                        continue # overlaps a period already found
+                    center_list.append(center_index)
+                    
+                    # The same algorithm as in func_time_conversion()
+                    period = {
+                        'column':           column,
+                        'window_size':      window_size,
+                        'search_option':    search_option,
+                        'rank':             len(center_list) - 1,
+                        'value':            data_in_window[order[position, column], column],
+                        'left_index':       center_index - half_window,
+                        'right_index':      center_index + half_window,
+                        'center_index':     center_index,
+                        }
+                    output.append(period)
+
+                    if print_option == 1:
+                        print 'center index = {}, value = {}'.format(center_index, period['value'])
+                        print 'left index = {}, right index = {}'.format(period['left_index'], period['right_index'])
+    
+    return output
 
-        center_index = int(np.argmin(data_in_window))
-        value = np.min(data_in_window)
+#%%
+# -----------------------------------------------------------------------------
+# func_range_max_table()
+#
+# Function
+#   build a sparse table for range-maximum queries over a time series, so that
+#   the maximum of any slice can be found in O(1) after O(n log n) setup
+#
+# Input
+#   input_data [one dimentional] the data to be queried
+#
+# Output
+#   output_data <dict> with the following keys
+#       levels <list> levels[k][i] is the maximum of input_data[i : i + 2**k]
+#       log2 <np.array> log2[m] is floor(log2(m)), used to pick the level
+#
+# Usage
+#   max headroom calculations for energy storage (see battery_calculation())
+#
+# -----------------------------------------------------------------------------
 
-    # -------------------------------------------------------------------------
-    # If interval would go over boundary, then move inteval
-    if center_index < int(eff_window_size/2):
-        center_index = int(eff_window_size/2)
-    if center_index > len(data)- int(eff_window_size/2) - 1:
-        center_index = len(data) - 1 - int(eff_window_size/2)
+def func_range_max_table (input_data):
+    
+    data = np.asarray(input_data, dtype = float)
+    
+    levels = [data]
+    width = 1
+    while 2 * width <= len(data):
+        previous_level = levels[-1]
+        levels.append(np.maximum(previous_level[:-width], previous_level[width:]))
+        width = 2 * width
+    
+    # np.frexp returns the exponent e with m = f * 2**e and 0.5 <= f < 1
+    log2 = np.frexp(np.arange(len(data) + 1))[1] - 1
+    log2[0] = 0
+    
+    output = {
+        'levels':   levels,
+        'log2':     log2,
+        }
+    
+    return output
 
-    # The same algorithm as in func_time_conversion()
+#%%
+# -----------------------------------------------------------------------------
+# func_range_max_query()
+#
+# Function
+#   answer range-maximum queries using a table from func_range_max_table()
+#
+# Input
+#   range_max_table <dict> output of func_range_max_table()
+#   left_index, right_index [scalar or one dimentional] the queried slices are
+#       input_data[left_index : right_index] (right_index is excluded, and
+#       right_index must be larger than left_index)
+#
+# Output
+#   output_data [one dimentional] maximum of each queried slice
+#
+# -----------------------------------------------------------------------------
 
-    left_index = center_index - int(eff_window_size/2)
-    right_index = center_index + int(eff_window_size/2)
+def func_range_max_query (range_max_table, left_index, right_index):
+    
+    left_index = np.atleast_1d(np.asarray(left_index, dtype = int))
+    right_index = np.atleast_1d(np.asarray(right_index, dtype = int))
+    
+    # Each slice is covered by two (overlapping) blocks of length 2**k
+    level_index = range_max_table['log2'][right_index - left_index]
+    
+    output_data = np.zeros(len(left_index))
+    for level in np.unique(level_index):
+        select = level_index == level
+        level_data = range_max_table['levels'][level]
+        output_data[select] = np.maximum(
+                level_data[left_index[select]],
+                level_data[right_index[select] - 2 ** level]
+                )
+    
+    return output_data
 
-    # -------------------------------------------------------------------------
+#%%
+# -----------------------------------------------------------------------------
+# func_sweep_grid()
+#
+# Function
+#   detect which keywords vary across a set of cases (a parameter sweep) and
+#   place every case on the grid of sweep coordinates
+#
+# Input
+#   case_dic_list <list> list of case dictionaries (see Preprocess_Input.py)
+#   exclude_list <list> keywords that are never treated as sweep dimensions
+#       (by default CASE_INDEX, the position of the case in the case input file)
+#
+# Output
+#   output_data <dict> with the following keys
+#       dimension_list <list> one keyword per sweep dimension
+#       dimension_keyword_list <list> for each dimension, all of the keywords
+#           that vary together along it (e.g., START_YEAR and END_YEAR)
+#       value_list <dict> keyword -> sorted unique values, for every numeric
+#           scalar keyword (including those that do not vary)
+#       grid_index <np.array> (cases x dimensions) coordinate of each case
+#       grid_shape <tuple> number of unique values along each dimension
+#       case_index_dic <dict> coordinate tuple -> case index, for the grid
+#           points where a case was run (the last case if there are several)
+#
+# Note
+#   Keywords that change together in the same way across all cases are
+#       merged into one dimension, so a grid is not filled only on its diagonal.
+#   The grid is kept sparse: a scattered sweep of n cases over d keywords has
+#       up to n**d grid points but only n cases.
+#
+# -----------------------------------------------------------------------------
 
-    # output
+def func_sweep_grid (case_dic_list, exclude_list = None):
+    
+    if exclude_list is None:
+        exclude_list = ['CASE_INDEX']
+    num_cases = len(case_dic_list)
+    
+    # numeric scalar keywords present in every case
+    keyword_list = []
+    if num_cases > 0:
+        for keyword in sorted(case_dic_list[0].keys()):
+            if keyword in exclude_list:
+                continue
+            is_scalar = True
+            for case_dic in case_dic_list:
+                value = case_dic.get(keyword, None)
+                if isinstance(value, bool) or not isinstance(value, (int, long, float, np.number)):
+                    is_scalar = False
+                    break
+            if is_scalar:
+                keyword_list.append(keyword)
+    
+    # one pass over the cases, then one np.unique per keyword
+    value_matrix = np.array([[case_dic[keyword] for keyword in keyword_list] for case_dic in case_dic_list],
+                            dtype = float).reshape(num_cases, len(keyword_list))
+    
+    value_list = {}
+    inverse_list = []
+    varying_list = []
+    for col in range(len(keyword_list)):
+        unique_values, inverse = np.unique(value_matrix[:,col], return_inverse = True)
+        value_list[keyword_list[col]] = unique_values
+        if len(unique_values) > 1:
+            varying_list.append(keyword_list[col])
+            inverse_list.append(inverse)
+    
+    # merge keywords that vary together
+    dimension_list = []
+    dimension_keyword_list = []
+    grid_index_list = []
+    for col in range(len(varying_list)):
+        for dim in range(len(dimension_list)):
+            if np.array_equal(grid_index_list[dim], inverse_list[col]):
+                dimension_keyword_list[dim].append(varying_list[col])
+                break
+        else:
+            dimension_list.append(varying_list[col])
+            dimension_keyword_list.append([varying_list[col]])
+            grid_index_list.append(inverse_list[col])
+    
+    grid_shape = tuple(len(value_list[keyword]) for keyword in dimension_list)
+    if len(dimension_list) > 0:
+        grid_index = np.array(grid_index_list, dtype = int).transpose()
+    else:
+        grid_index = np.zeros((num_cases, 0), dtype = int)
+    
+    case_index_dic = {}
+    for case_index, coordinate in enumerate(map(tuple, grid_index.tolist())):
+        case_index_dic[coordinate] = case_index
+    
+    output = {
+        'dimension_list':           dimension_list,
+        'dimension_keyword_list':   dimension_keyword_list,
+        'value_list':               value_list,
+        'grid_index':               grid_index,
+        'grid_shape':               grid_shape,
+        'case_index_dic':           case_index_dic,
+        }
+    
+    return output
 
-    if print_option == 1:
-        
-        print 'center index = {}, value = {}'.format(center_index, value)
-        print 'left index = {}, right index = {}'.format(left_index, right_index)
+#%%
+# -----------------------------------------------------------------------------
+# func_sweep_slice()
+#
+# Function
+#   take a 2-D slice through an N-dimensional sweep for any per-case scalar
+#
+# Input
+#   sweep_grid <dict> output of func_sweep_grid()
+#   case_values [one dimentional] one value per case (e.g., SYSTEM_COST)
+#   dimension_x, dimension_y <string> the two sweep dimensions of the slice
+#   fixed_coordinates <dict> dimension -> grid index for each of the other
+#       dimensions (default is index 0, the smallest value)
+#
+# Output
+#   output_data <dict> with the following keys
+#       x_values, y_values <np.array> values along the two dimensions at which
+#           the slice has a case
+#       z <np.ma.array> (x x y) values, masked where no case was run
+#       case_index <np.array> (x x y) case index at each point, -1 if none
+#
+# Note
+#   Only the 2-D slice is stored densely.
+#
+# -----------------------------------------------------------------------------
 
+def func_sweep_slice (sweep_grid, case_values, dimension_x, dimension_y, fixed_coordinates = None):
+    
+    if fixed_coordinates is None:
+        fixed_coordinates = {}
+    dimension_list = sweep_grid['dimension_list']
+    index_x = dimension_list.index(dimension_x)
+    index_y = dimension_list.index(dimension_y)
+    
+    # cases at the grid points of the slice
+    case_list = np.array(sorted(sweep_grid['case_index_dic'].values()), dtype = int)
+    grid_index = sweep_grid['grid_index'][case_list]
+    in_slice = np.ones(len(case_list), dtype = bool)
+    for dim in range(len(dimension_list)):
+        if dim != index_x and dim != index_y:
+            in_slice &= grid_index[:, dim] == fixed_coordinates.get(dimension_list[dim], 0)
+    case_list = case_list[in_slice]
+    x_coordinates, x_index = np.unique(grid_index[in_slice, index_x], return_inverse = True)
+    y_coordinates, y_index = np.unique(grid_index[in_slice, index_y], return_inverse = True)
+    
+    case_index = np.full((len(x_coordinates), len(y_coordinates)), -1, dtype = int)
+    case_index[x_index, y_index] = case_list
+    
+    case_values = np.asarray(case_values, dtype = float)
+    z = np.ma.masked_where(case_index < 0, case_values[case_index])
+    
     output = {
-        'value':        value,
-        'left_index':   left_index,
-        'right_index':  right_index,
-        'center_index': center_index,
+        'x_values':     sweep_grid['value_list'][dimension_x][x_coordinates],
+        'y_values':     sweep_grid['value_list'][dimension_y][y_coordinates],
+        'z':            z,
+        'case_index':   case_index,
         }
-
+    
     return output
 
+#%%
+# -----------------------------------------------------------------------------
+# func_sweep_order()
+#
+# Function
+#   choose an order in which to run the cases of a sweep so that consecutive
+#   cases are near each other in parameter space
+#
+# Input
+#   case_dic_list <list> list of case dictionaries (see Preprocess_Input.py)
+#   order_option <string>
+#       'SERPENTINE': go along the last sweep dimension, reversing direction
+#           every time another dimension steps (a space-filling path through
+#           the grid, so consecutive cases differ in one keyword by one step)
+#       'NEAREST_NEIGHBOR': start at the grid corner and always go to the
+#           nearest case not run yet (distances in grid steps, each dimension
+#           scaled to [0, 1])
+#       anything else: the order of the case input file
+#
+# Output
+#   order <np.array> case indices in the order they should be run
+#
+# Note
+#   Cases at the same grid point are kept in their input order.
+#
+# -----------------------------------------------------------------------------
+
+def func_sweep_order (case_dic_list, order_option):
+    
+    num_cases = len(case_dic_list)
+    if order_option not in ['SERPENTINE','NEAREST_NEIGHBOR']:
+        return np.arange(num_cases)
+    
+    sweep_grid = func_sweep_grid(case_dic_list)
+    grid_index = sweep_grid['grid_index']
+    grid_shape = sweep_grid['grid_shape']
+    
+    if num_cases == 0 or len(grid_shape) == 0:
+        return np.arange(num_cases)
+    
+    if order_option == 'SERPENTINE':
+        # reverse a dimension when the coordinates before it sum to an odd number
+        key_list = []
+        outer_sum = np.zeros(num_cases, dtype = int)
+        for dim in range(len(grid_shape)):
+            coordinate = grid_index[:, dim]
+            key_list.append(np.where(outer_sum % 2 == 0, coordinate, grid_shape[dim] - 1 - coordinate))
+            outer_sum = outer_sum + coordinate
+        # np.lexsort sorts by the last key first
+        order = np.lexsort([np.arange(num_cases)] + key_list[::-1])
+    
+    elif order_option == 'NEAREST_NEIGHBOR':
+        position = grid_index / np.maximum(np.array(grid_shape, dtype = float) - 1., 1.)
+        not_run = np.ones(num_cases, dtype = bool)
+        order = np.zeros(num_cases, dtype = int)
+        current = int(np.argmin(np.sum(position, axis = 1)))
+        for step in range(num_cases):
+            order[step] = current
+            not_run[current] = False
+            if step == num_cases - 1:
+                break
+            distance = np.sum((position - position[current]) ** 2, axis = 1)
+            distance[~not_run] = np.inf
+            current = int(np.argmin(distance)) # ties go to the first case in the input
+    
+    return order
+
+#%%
+# -----------------------------------------------------------------------------
+# func_lttb_index()
+#
+# Function
+#   choose the points of a line to plot, using the largest-triangle-three-
+#   buckets method: the first and last points are kept, the rest of the series
+#   is split into (max_points - 2) buckets, and from each bucket the point
+#   making the largest triangle with the point chosen from the previous bucket
+#   and the average of the next bucket is kept.
+#
+# Input
+#   x_data [one dimensional] x values
+#   y_data [one dimensional] y values
+#   max_points [scalar] number of points to keep. If max_points < 3 or the
+#       series is not longer than max_points, all points are kept.
+#
+# Output
+#   index <np.array> sorted indices of the points to plot
+#
+# -----------------------------------------------------------------------------
+
+def func_lttb_index (x_data, y_data, max_points):
+    
+    N_periods = len(y_data)
+    if max_points < 3 or N_periods <= max_points:
+        return np.arange(N_periods)
+    
+    x_data = np.asarray(x_data, dtype = float)
+    y_data = np.asarray(y_data, dtype = float)
+    
+    # bucket b covers [edges[b], edges[b+1]); the first and last points are alone
+    edges = np.floor(np.linspace(1, N_periods - 1, max_points - 1)).astype(int)
+    edges = np.append(edges, N_periods)
+    
+    index = np.zeros(max_points, dtype = int)
+    index[-1] = N_periods - 1
+    chosen = 0
+    for bucket in range(max_points - 2):
+        left_index = edges[bucket]
+        right_index = edges[bucket + 1]
+        x_next = np.mean(x_data[edges[bucket + 1]:edges[bucket + 2]])
+        y_next = np.mean(y_data[edges[bucket + 1]:edges[bucket + 2]])
+        area = np.abs(
+                (x_data[chosen] - x_next) * (y_data[left_index:right_index] - y_data[chosen]) -
+                (x_data[chosen] - x_data[left_index:right_index]) * (y_next - y_data[chosen])
+                )
+        chosen = left_index + int(np.argmax(area))
+        index[bucket + 1] = chosen
+    
+    return index
+
+#%%
+# -----------------------------------------------------------------------------
+# func_envelope_index()
+#
+# Function
+#   choose the points to plot so that the min/max envelope of every column is
+#   kept: the series is split into buckets, and from each bucket the points
+#   where each column is at its min and at its max are kept. All columns share
+#   the points chosen, so the result can be used for stack plots.
+#
+# Input
+#   y_data <np.ndarray> (time x columns) or [one dimensional]
+#   max_points [scalar] about the number of points to keep (each bucket keeps
+#       up to 2 points per column). If max_points is smaller than that or the
+#       series is not longer than max_points, all points are kept.
+#
+# Output
+#   index <np.array> sorted indices of the points to plot
+#
+# -----------------------------------------------------------------------------
+
+def func_envelope_index (y_data, max_points):
+    
+    y_data = np.asarray(y_data, dtype = float)
+    if y_data.ndim == 1:
+        y_data = y_data[:, np.newaxis]
+    N_periods = y_data.shape[0]
+    num_buckets = int(max_points / (2 * y_data.shape[1]))
+    if num_buckets < 1 or N_periods <= max_points:
+        return np.arange(N_periods)
+    
+    edges = np.linspace(0, N_periods, num_buckets + 1).astype(int)
+    index_list = [np.array([0, N_periods - 1])]
+    for bucket in range(num_buckets):
+        y_bucket = y_data[edges[bucket]:edges[bucket + 1]]
+        index_list.append(edges[bucket] + np.argmin(y_bucket, axis = 0))
+        index_list.append(edges[bucket] + np.argmax(y_bucket, axis = 0))
+    
+    return np.unique(np.concatenate(index_list))
+
 #%%
 # -----------------------------------------------------------------------------
 # func_bar_plot()
@@ -469,6 +997,8 @@ def func_bar_plot(input_data):
 #       y2_label    
 #       title
 #       legend
+#       max_points (optional) if given, each line is reduced to about
+#           max_points points with func_lttb_index() before plotting
 #
 # Output
 #   ax <figure> subplot figure handle
@@ -513,18 +1043,29 @@ def func_lines_plot(input_data):
     else:
         x_data_range = [0, x_data.size]
 
+    if 'max_points' not in input_data.keys():
+         max_points = 0
+    else:
+         max_points = input_data['max_points']
+
+    x_plot = x_data[x_data_range[0]:x_data_range[1]]
+
     # each column is a (independent) line
     
     if len(y_data.shape) > 1: 
         for i in xrange(y_data.shape[1]):
+            y_plot = y_data[x_data_range[0]:x_data_range[1], i]
+            index = func_lttb_index(x_plot, y_plot, max_points)
             ax.plot(
-                    x_data[x_data_range[0]:x_data_range[1]],
-                    y_data[x_data_range[0]:x_data_range[1], i], 
+                    x_plot[index],
+                    y_plot[index], 
                     linewidth = line_width)
     else:
+        y_plot = y_data[x_data_range[0]:x_data_range[1]]
+        index = func_lttb_index(x_plot, y_plot, max_points)
         ax.plot(
-                x_data[x_data_range[0]:x_data_range[1]],
-                y_data[x_data_range[0]:x_data_range[1]], 
+                x_plot[index],
+                y_plot[index], 
                 linewidth = line_width)
 
     # -------------------------------------------------------------------------
@@ -539,14 +1080,18 @@ def func_lines_plot(input_data):
             # each column is a (independent) line
         if len(y_data.shape) > 1: 
             for i in xrange(y_data.shape[1]):
+                y_plot = y2_data[x_data_range[0]:x_data_range[1], i]
+                index = func_lttb_index(x_plot, y_plot, max_points)
                 ax2.plot(
-                        x_data[x_data_range[0]:x_data_range[1]],
-                        y2_data[x_data_range[0]:x_data_range[1], i], 
+                        x_plot[index],
+                        y_plot[index], 
                         linewidth = line_width)
         else:
+            y_plot = y2_data[x_data_range[0]:x_data_range[1]]
+            index = func_lttb_index(x_plot, y_plot, max_points)
             ax2.plot(
-                    x_data[x_data_range[0]:x_data_range[1]],
-                    y2_data[x_data_range[0]:x_data_range[1]], 
+                    x_plot[index],
+                    y_plot[index], 
                     linewidth = line_width)
 
         ax2.set_ylabel(input_data['y2_label'])
@@ -713,6 +1258,10 @@ def func_lines_2yaxes_plot (input_data):
 #       legend_z
 #       line_width_z
 #
+#   max_points (optional) if given, the plot is reduced to about max_points
+#       points with func_envelope_index() on the stacked totals (and z_data),
+#       so the min/max envelope of every layer is kept
+#
 # Output
 #   ax <figure> subplot figure handle
 #
@@ -761,10 +1310,23 @@ def func_stack_plot (input_data):
         x_data_range = input_data['x_data_range']
     else:
         x_data_range = [0, x_data.size]        
+
+    if 'max_points' not in input_data.keys():
+         max_points = 0
+    else:
+         max_points = input_data['max_points']
+
+    # the points kept are shared by all layers (and by the z_data line)
+    x_plot = x_data[x_data_range[0]:x_data_range[1]]
+    y_plot = np.array(y_data[x_data_range[0]:x_data_range[1], :])
+    envelope_data = np.cumsum(y_plot, axis = 1)
+    if 'z_data' in input_data.keys():
+        envelope_data = np.column_stack((envelope_data, input_data['z_data'][x_data_range[0]:x_data_range[1]]))
+    index = func_envelope_index(envelope_data, max_points)
         
     ax.stackplot(
-            x_data[x_data_range[0]:x_data_range[1]], 
-            np.array(y_data[x_data_range[0]:x_data_range[1], :].T),
+            x_plot[index], 
+            y_plot[index].T,
             linewidth = line_width)
 
     # -------------------------------------------------------------------------
@@ -777,9 +1339,12 @@ def func_stack_plot (input_data):
         ax2 = ax.twinx()
         y2_data = input_data['y2_data']
     
+        y2_plot = np.array(y2_data[x_data_range[0]:x_data_range[1], :])
+        index2 = func_envelope_index(np.cumsum(y2_plot, axis = 1), max_points)
+    
         ax2.stackplot(
-                x_data[x_data_range[0]:x_data_range[1]], 
-                np.array(y2_data[x_data_range[0]:x_data_range[1], :].T),
+                x_plot[index2], 
+                y2_plot[index2].T,
                 linewidth = line_width)
     
         ax2.set_ylabel(input_data['y2_label'])
@@ -794,8 +1359,8 @@ def func_stack_plot (input_data):
         # print 'z plotting'
         
         ax.plot(
-                x_data[x_data_range[0]:x_data_range[1]], 
-                input_data['z_data'][x_data_range[0]:x_data_range[1]], 
+                x_plot[index], 
+                np.asarray(input_data['z_data'][x_data_range[0]:x_data_range[1]])[index], 
                 color='k', 
                 linewidth = input_data['line_width_z'])
         
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+'''
+
+File name: Work_Queue.py
+
+Simple Energy Model Ver 1
+
+A work queue for running the cases of one case input file on many nodes.
+
+The queue is a SQLite file (which can be on a disk shared by the nodes):
+
+    enqueue_cases()    puts the cases from preprocess_input() in the queue
+    run_worker()       claims cases one at a time, solves them and writes the
+                       results back; run as many workers as there are cores
+                       on as many nodes as are available
+    collect_results()  when every case is done, saves the results in case
+                       order, as save_basic_results() does for a single run
+
+A worker holds a lease on the case it is solving and renews it while it
+solves. If a worker dies, its lease runs out and another worker claims the
+case again. If the model raises an error, the case is marked failed with the
+traceback. A case is claimed at most max_attempts times (default 3); after
+that it stays failed and collect_results() lists it instead of its results.
+
+Cases are claimed longest-expected-first. The expected solve time of a case is
+its size (hours x components) times the time per unit size measured for cases
+with the same components in earlier sweeps (kept in a timing history file).
+
+'''
+
+# -----------------------------------------------------------------------------
+
+import os
+import socket
+import sqlite3
+import pickle
+import threading
+import time
+import traceback
+import numpy as np
+from Save_Basic_Results import save_basic_results
+
+# -----------------------------------------------------------------------------
+
+def open_queue(queue_file_name):
+    # isolation_level = None so that transactions are started explicitly
+    connection = sqlite3.connect(queue_file_name, timeout = 600, isolation_level = None)
+    connection.execute('CREATE TABLE IF NOT EXISTS global (id INTEGER PRIMARY KEY, global_dic BLOB)')
+    connection.execute(
+            'CREATE TABLE IF NOT EXISTS cases (case_index INTEGER PRIMARY KEY, case_name TEXT, '
+            'case_dic BLOB, expected_time REAL, status TEXT, worker TEXT, lease_expires REAL, '
+            'result BLOB, solve_time REAL, attempts INTEGER DEFAULT 0, error TEXT)'
+            )
+    return connection
+
+def open_timing_history(history_file_name):
+    connection = sqlite3.connect(history_file_name, timeout = 600)
+    connection.execute('CREATE TABLE IF NOT EXISTS timing (components TEXT, size REAL, solve_time REAL)')
+    return connection
+
+def to_blob(data):
+    return sqlite3.Binary(pickle.dumps(data, protocol = pickle.HIGHEST_PROTOCOL))
+
+def from_blob(blob):
+    return pickle.loads(str(blob))
+
+# size of the optimization problem for a case, and the key used for its timing history
+def case_size(case_dic):
+    return len(case_dic['DEMAND_SERIES']) * max(1, len(case_dic['SYSTEM_COMPONENTS']))
+
+def case_components(case_dic):
+    return ','.join(sorted(case_dic['SYSTEM_COMPONENTS']))
+
+# -----------------------------------------------------------------------------
+
+def enqueue_cases(queue_file_name, global_dic, case_dic_list, history_file_name = None):
+
+    verbose = global_dic['VERBOSE']
+
+    # solve time per unit size, by component list and over all cases
+    time_per_size_dic = {}
+    time_per_size = 1.
+    if history_file_name is not None and os.path.exists(history_file_name):
+        history = open_timing_history(history_file_name)
+        rows = history.execute('SELECT components, SUM(solve_time), SUM(size) FROM timing GROUP BY components').fetchall()
+        history.close()
+        for components, solve_time, size in rows:
+            time_per_size_dic[components] = solve_time / size
+        if len(rows) > 0:
+            time_per_size = sum(row[1] for row in rows) / sum(row[2] for row in rows)
+
+    connection = open_queue(queue_file_name)
+    connection.execute('BEGIN IMMEDIATE')
+    connection.execute('INSERT OR REPLACE INTO global (id, global_dic) VALUES (0, ?)', (to_blob(global_dic),))
+    for case_index in range(len(case_dic_list)):
+        case_dic = case_dic_list[case_index]
+        expected_time = case_size(case_dic) * time_per_size_dic.get(case_components(case_dic), time_per_size)
+        connection.execute(
+                'INSERT OR REPLACE INTO cases (case_index, case_name, case_dic, expected_time, status, attempts) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (case_dic.get('CASE_INDEX', case_index), case_dic['CASE_NAME'], to_blob(case_dic), expected_time, 'pending', 0)
+                )
+    connection.execute('COMMIT')
+    connection.close()
+
+    if verbose:
+        print 'Work_Queue.py: ' + str(len(case_dic_list)) + ' cases put in queue ' + queue_file_name
+
+# a case whose worker's lease ran out on its last attempt is marked failed
+def expire_leases(connection, max_attempts):
+
+    connection.execute(
+            "UPDATE cases SET status = 'failed', error = 'lease expired on worker ' || worker "
+            "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+            (time.time(), max_attempts)
+            )
+
+# claim the pending case with the longest expected solve time, or a case whose
+# worker's lease has run out or that failed, if it has been claimed fewer than
+# max_attempts times; returns (case_index, case_dic), or None
+def claim_case(connection, worker_name, lease_time, max_attempts = 3):
+
+    now = time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    expire_leases(connection, max_attempts)
+    row = connection.execute(
+            "SELECT case_index, case_dic FROM cases "
+            "WHERE (status = 'pending' OR (status = 'running' AND lease_expires < ?) OR status = 'failed') "
+            "AND attempts < ? "
+            "ORDER BY expected_time DESC LIMIT 1",
+            (now, max_attempts)
+            ).fetchone()
+    if row is not None:
+        connection.execute(
+                "UPDATE cases SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE case_index = ?",
+                (worker_name, now + lease_time, row[0])
+                )
+    connection.execute('COMMIT')
+
+    if row is None:
+        return None
+    return row[0], from_blob(row[1])
+
+# keep renewing the lease on a case until stop_event is set
+def renew_lease(queue_file_name, case_index, worker_name, lease_time, stop_event):
+
+    connection = open_queue(queue_file_name)
+    while not stop_event.wait(lease_time / 3.):
+        connection.execute(
+                "UPDATE cases SET lease_expires = ? WHERE case_index = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_time, case_index, worker_name)
+                )
+    connection.close()
+
+# write back a result; the first worker to finish a case wins
+def complete_case(connection, case_index, result, solve_time):
+
+    connection.execute(
+            "UPDATE cases SET status = 'done', result = ?, solve_time = ? WHERE case_index = ? AND status != 'done'",
+            (to_blob(result), solve_time, case_index)
+            )
+
+# record the traceback of a case whose model run raised an error
+def fail_case(connection, case_index, error):
+
+    connection.execute(
+            "UPDATE cases SET status = 'failed', error = ? WHERE case_index = ? AND status != 'done'",
+            (error, case_index)
+            )
+
+def queue_status(connection):
+
+    status_dic = {'pending':0, 'running':0, 'done':0, 'failed':0}
+    for status, count in connection.execute('SELECT status, COUNT(*) FROM cases GROUP BY status'):
+        status_dic[status] = count
+    return status_dic
+
+# -----------------------------------------------------------------------------
+
+def run_worker(queue_file_name, worker_name = None, lease_time = 600., poll_time = 30., max_attempts = 3):
+
+    # imported here so that the queue can be filled and collected without cvxpy
+    from Core_Model import core_model
+    from Cost_Model import cost_and_storage_calculation_case
+
+    if worker_name is None:
+        worker_name = socket.gethostname() + ':' + str(os.getpid())
+
+    connection = open_queue(queue_file_name)
+    global_dic = from_blob(connection.execute('SELECT global_dic FROM global WHERE id = 0').fetchone()[0])
+    verbose = global_dic['VERBOSE']
+
+    num_solved = 0
+    while True:
+        claimed = claim_case(connection, worker_name, lease_time, max_attempts)
+        if claimed is None:
+            # wait while other workers still hold cases, in case one of them dies
+            if queue_status(connection)['running'] == 0:
+                break
+            time.sleep(poll_time)
+            continue
+        case_index, case_dic = claimed
+        if verbose:
+            print 'Work_Queue.py: ' + worker_name + ' solving ' + case_dic['CASE_NAME']
+
+        stop_event = threading.Event()
+        lease_thread = threading.Thread(target = renew_lease,
+                                        args = (queue_file_name, case_index, worker_name, lease_time, stop_event))
+        lease_thread.daemon = True
+        lease_thread.start()
+
+        start_time = time.time()
+        try:
+            result = core_model(global_dic, case_dic)
+            if global_dic['COST_MODEL']:
+                result.update(cost_and_storage_calculation_case(global_dic, case_dic, result))
+        except Exception:
+            error = traceback.format_exc()
+            stop_event.set()
+            lease_thread.join()
+            fail_case(connection, case_index, error)
+            print 'Work_Queue.py: ' + worker_name + ' failed on ' + case_dic['CASE_NAME'] + '\n' + error.rstrip()
+            continue
+        solve_time = time.time() - start_time
+
+        stop_event.set()
+        lease_thread.join()
+        complete_case(connection, case_index, result, solve_time)
+        num_solved += 1
+
+    connection.close()
+    if verbose:
+        print 'Work_Queue.py: ' + worker_name + ' finished, ' + str(num_solved) + ' cases solved'
+    return num_solved
+
+# -----------------------------------------------------------------------------
+
+def collect_results(queue_file_name, output_path = None, global_name = None, history_file_name = None,
+                    max_attempts = 3):
+
+    connection = open_queue(queue_file_name)
+    global_dic = from_blob(connection.execute('SELECT global_dic FROM global WHERE id = 0').fetchone()[0])
+    verbose = global_dic['VERBOSE']
+
+    expire_leases(connection, max_attempts)
+    status_dic = queue_status(connection)
+    if status_dic['pending'] + status_dic['running'] > 0:
+        print ('Work_Queue.py: not all cases are done: {} pending, {} running, {} done, {} failed'
+               .format(status_dic['pending'], status_dic['running'], status_dic['done'], status_dic['failed']))
+        connection.close()
+        return None
+
+    # failed cases are listed, with the last line of their traceback, and left out of the results
+    for case_name, attempts, error in connection.execute(
+            "SELECT case_name, attempts, error FROM cases WHERE status = 'failed' ORDER BY case_index"):
+        print ('Work_Queue.py: case {} failed after {} attempts: {}'
+               .format(case_name, attempts, (error or '').strip().split('\n')[-1]))
+
+    case_dic_list = []
+    result_list = []
+    timing_list = []
+    for case_blob, result_blob, solve_time in connection.execute(
+            "SELECT case_dic, result, solve_time FROM cases WHERE status = 'done' ORDER BY case_index"):
+        case_dic = from_blob(case_blob)
+        case_dic_list.append(case_dic)
+        result_list.append(from_blob(result_blob))
+        timing_list.append((case_components(case_dic), case_size(case_dic), solve_time))
+    connection.close()
+
+    # add this sweep's solve times to the history used to order later sweeps
+    if history_file_name is not None:
+        history = open_timing_history(history_file_name)
+        history.executemany('INSERT INTO timing (components, size, solve_time) VALUES (?, ?, ?)', timing_list)
+        history.commit()
+        history.close()
+
+    if output_path is not None:
+        global_dic['OUTPUT_PATH'] = output_path
+    if global_name is not None:
+        global_dic['GLOBAL_NAME'] = global_name
+    if verbose:
+        print ('Work_Queue.py: {} cases collected, total solve time {:.1f} s'
+               .format(len(case_dic_list), np.sum([x[2] for x in timing_list])))
+    save_basic_results(global_dic, case_dic_list, result_list)
+
+    return global_dic, case_dic_list, result_list